@@ -1,17 +1,34 @@
 # -*- coding: UTF-8 -*-
 
 from enum import Enum
-import json
+from operator import attrgetter
 import struct
 
 from dogwood.core.logger import Logger
+from dogwood.core.packet_codec import get_codec, codec_of
 
 class PacketDef(Enum):
-    MIN_PACKET_LEN = 7            # json的最短长度会是7'{"m":0}'
+    MIN_PACKET_LEN = 4            # json的最短长度会是7'{"m":0}',msgpack是4,二进制格式最短5(格式标记+mid+nid)
     MAX_PACKET_LEN = 16384         # 消息包最大长度,16K
     PACKET_SPLIT_BUFFER_SIZE = 65536     # 粘包处理缓冲区长度,64K
     PER_RECV_SIZE = 2048          # 网络读取时也使用此长度
+    SPLIT_PUSH_SIZE = 32768       # 每次放进粘包缓冲区的最大长度,要给未拼完的半个包留出空间
+    STRUCT_FLAG = 0               # 长度后的第一个字节,二进制格式(StructPacket)的标记.json内容总是以'{'开头
+    CHUNK_FLAG = 1                # 长度后的第一个字节,分片包的标记(协议v2),超过MAX_PACKET_LEN的BasePacket分成多个分片包发送
+    MAX_MESSAGE_LEN = 1048576     # 分片重组后的消息默认最大长度,1M.PacketSplit可以单独设置
     
+_LEN_STRUCT = struct.Struct('<H')         # 粘包处理时读取长度用,也是StructPacket里变长字段的长度
+_PACK_LEN_STRUCT = struct.Struct('<h')    # BasePacket打包时写入长度
+_CHUNK_MORE = 0x01                        # 分片包的第二个字节: 后面还有分片
+_CHUNK_FIRST = 0x02                       # 分片包的第二个字节: 第一个分片,后面跟着varint的消息总长度
+_CHUNK_HEAD_MAX = 7                       # 分片包头最长: 标记,flags,最多5个字节的varint
+_STRUCT_HEAD_FMT = '<hBHH'                # StructPacket的头: 长度,格式标记,mid,nid
+_STRUCT_ID = struct.Struct('<HH')         # 从格式标记后读取mid,nid
+_STRUCT_TYPE_DICT = {'int8': 'b', 'uint8': 'B', 'int16': 'h', 'uint16': 'H', 'int32': 'i', 'uint32': 'I',
+                     'int64': 'q', 'uint64': 'Q', 'float': 'f', 'double': 'd', 'bool': '?'}     # 定长字段
+_STRUCT_VAR_TYPES = ('string', 'bytes')   # 变长字段,两个字节长度加内容,放在所有定长字段之后
+_struct_packet_dict = {}                  # key (mid, nid), value StructPacket子类
+
 class PacketError(Exception):
     def __init__(self, msg):
         self.msg = msg
@@ -20,73 +37,360 @@ class PacketError(Exception):
         return 'PacketError: {}'.format(self.msg)
 
 class BasePacket:
-    '''网络通讯及服务器内部进程线程间通讯用的协议,两个字节的json长度.
-    长度不包括两个字节本身,json格式的内容'''
-    __slots__ = ('data')
+    '''网络通讯及服务器内部进程线程间通讯用的协议,两个字节的内容长度.
+    长度不包括两个字节本身,内容默认是json,也可以是packet_codec里注册的其它编码,解码时按内容的第一个字节识别.
+    延迟解码(unpack的lazy为True)时只识别编码,读取开头的m,n,内容在第一次访问data时才解码,
+    路由只需要mid,nid,丢弃或原样转发(raw)的包不用解码'''
+    __slots__ = ('_data', 'codec', '_content', '_raw', '_mid', '_nid')
     def __init__(self):
-        self.data = {}
+        self._data = {}
+        self.codec = None               # 解码出来的包为所用编码的名字,用来按对端的编码回复
+        self._content = None            # 延迟解码时保存的内容,不包括长度,为None时在_raw里
+        self._raw = None                # 转发用的原始包,包括长度,需要时由_content生成
+        self._mid = None                # 延迟解码时从内容开头读到的id,读不到为None
+        self._nid = None
+        
+    @property
+    def data(self):
+        '''延迟解码的包第一次访问时解码,数据错误时抛出PacketError.
+        返回的dict可能被就地修改,访问后raw为None,只读的用get,mid,nid'''
+        data = self.__decoded()
+        self.__modified()
+        return data
+    
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self.__modified()
+    
+    @property
+    def mid(self):
+        if self._data is None and self._mid is not None:        # 还没解码,用开头读到的
+            return self._mid
+        return self.__decoded().get('m', None)
+    
+    @property
+    def nid(self):
+        if self._data is None and self._nid is not None:
+            return self._nid
+        return self.__decoded().get('n', None)
+    
+    @property
+    def raw(self):
+        '''延迟解码收到的原始包,可以直接send_socket_msg转发,不用重新编码.
+        不是延迟解码收到的包,或者访问过data(可能就地修改),通过set_id,[]或data=修改过的包为None'''
+        if self._raw is None and self._content is not None:
+            length = len(self._content)
+            if length > PacketDef.MAX_PACKET_LEN.value:           # 分片重组的消息重新分片
+                self._raw = pack_chunks(self._content)
+            else:
+                self._raw = _PACK_LEN_STRUCT.pack(length) + self._content
+        return self._raw
         
     def empty(self):
-        return len(self.data) == 0      
+        return len(self.__decoded()) == 0      
     
-    def unpack(self, buffer):
-        length, = struct.unpack_from('<h', buffer, 0)          #json长度
-        bys_read, = struct.unpack_from('%ds' % length, buffer, 2)      #json内容
-        try:
-            str_data = bys_read.decode(encoding='utf8')
-        except Exception as e:
-            raise PacketError('{}.{}'.format(e, bys_read[:30]))
+    def unpack(self, buffer, lazy=False):
+        '''buffer可以是bytes,也可以是memoryview,直接从中解码,不做中间拷贝.
+        lazy为True时拷贝一份内容保存,第一次访问data时才解码'''
+        length, = _PACK_LEN_STRUCT.unpack_from(buffer, 0)      #内容长度
+        bys_read = memoryview(buffer)[2:2 + length]             #内容
+        if len(bys_read) != length or length == 0:
+            raise PacketError('length error.{}.{}'.format(length, len(bys_read)))
+        if lazy:
+            raw = bytes(buffer[:2 + length])                    # 粘包缓冲区会被覆盖,要拷贝出来
+            self.__lazy_content(memoryview(raw)[2:])
+            self._raw = raw
+        else:
+            self.unpack_content(bys_read)
+    
+    def unpack_content(self, bys_read, lazy=False):
+        '''解码不带长度的内容,如分片重组后的消息.
+        lazy为True时memoryview会拷贝一份保存(粘包缓冲区会被覆盖),bytes,bytearray直接保存,调用者之后不能再修改'''
+        if lazy:
+            if type(bys_read) is memoryview:
+                bys_read = bytes(bys_read)
+            self.__lazy_content(bys_read)
+            self._content = bys_read
             return
+        self.codec = self.__codec_of(bys_read)
+        self._data = self.__loads(get_codec(self.codec), bys_read)
+    
+    def __lazy_content(self, bys_read):
+        '''只识别编码和读取开头的id.内容的引用由调用者保存,保存的要能pickle,不能是memoryview'''
+        self.codec = self.__codec_of(bys_read)
+        self._data = None
+        ids = get_codec(self.codec).peek_ids(bys_read)
+        if ids is not None:
+            self._mid, self._nid = ids
+    
+    @staticmethod
+    def __codec_of(bys_read):
+        codec = codec_of(bys_read[0])
+        if codec is None:
+            raise PacketError('unknown codec.{}'.format(bytes(bys_read[:30])))
+        return codec.name
+    
+    def __decoded(self):
+        '''只读访问的解码,不影响raw'''
+        if self._data is None:
+            self.__decode()
+        return self._data
+    
+    def __decode(self):
+        if self._content is None:
+            content = memoryview(self._raw)[2:]
+        else:
+            content = self._content
+        self._data = {}                     # 解码失败时为空,不重复解码
+        self._data = self.__loads(get_codec(self.codec), content)
+    
+    @staticmethod
+    def __loads(codec, bys_read):
         try:
-            self.data = json.loads(str_data)
-        except json.JSONDecodeError:
-            self.data.clear()
-            raise PacketError(str_data[:30])        # 只打印前30个字符,太多不方便显示
+            data = codec.loads(bys_read)
+        except Exception as e:
+            raise PacketError('{}.{}.{}'.format(codec.name, e, bytes(bys_read[:30])))        # 只打印前30个字节,太多不方便显示
+        if type(data) is not dict:
+            raise PacketError('{}.content not dict.{}'.format(codec.name, bytes(bys_read[:30])))
+        return data
     
-    def pack(self):
-        js_str = json.dumps(self.data, ensure_ascii=False)
-        bys = js_str.encode(encoding='utf8')
-        length = len(bys)
-        buffer = struct.pack('<h%ds' % length, length, bys)
-        return buffer
+    def __modified(self):
+        self._content = None
+        self._raw = None
+    
+    def pack(self, codec_name=None):
+        '''codec_name为None时使用json,回复时可以传收到的包或BaseClient.codec,用对端的编码'''
+        codec = get_codec('json' if codec_name is None else codec_name)
+        if codec is None:
+            raise PacketError('codec not registered.{}'.format(codec_name))
+        bys = codec.dumps(self.__decoded())
+        if len(bys) > PacketDef.MAX_PACKET_LEN.value:          # 只能发给支持分片包的对端
+            return pack_chunks(bys)
+        return _PACK_LEN_STRUCT.pack(len(bys)) + bys
     
     def set_id(self, mid, nid):
-        self.data['m'] = mid
-        self.data['n'] = nid
+        data = self.data
+        data['m'] = mid
+        data['n'] = nid
+        self.__modified()
     
     def __setitem__(self, key, value):
         self.data[key] = value
+        self.__modified()
         
     def get(self, key, def_value):
-        return self.data.get(key, def_value)
+        return self.__decoded().get(key, def_value)
     
 
+class StructPacket:
+    '''二进制格式的消息,用于收发频繁的消息,不经过json.
+    子类由tools/xml_2_python.py根据协议xml里的field生成,声明__slots__,MID,NID,FIELDS和按FIELDS顺序的__init__.
+    定义子类时按FIELDS预编译struct.Struct,并按(MID, NID)注册,PacketSplit收到二进制格式的包时直接解码成对应子类.
+    格式: 两个字节长度(同BasePacket),一个字节STRUCT_FLAG,mid,nid各两个字节,然后是定长字段,最后是变长字段'''
+    __slots__ = ()
+    MID = 0
+    NID = 0
+    FIELDS = ()                 # ((字段名, 类型), ...),类型见_STRUCT_TYPE_DICT和_STRUCT_VAR_TYPES
+    codec = None                # 没有编码,和BasePacket一样的路由接口(mid,nid,codec,raw)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fixed_names = []
+        fixed_fmt = ''
+        var_fields = []
+        for name, field_type in cls.FIELDS:
+            if field_type in _STRUCT_TYPE_DICT:
+                fixed_names.append(name)
+                fixed_fmt += _STRUCT_TYPE_DICT[field_type]
+            elif field_type in _STRUCT_VAR_TYPES:
+                var_fields.append((name, field_type == 'string'))
+            else:
+                raise PacketError('StructPacket field type error.{}.{}.{}'.format(cls.__name__, name, field_type))
+        key = (cls.MID, cls.NID)
+        if key in _struct_packet_dict:
+            raise PacketError('StructPacket id exist.{}.{}'.format(cls.__name__, key))
+        cls._struct = struct.Struct(_STRUCT_HEAD_FMT + fixed_fmt)
+        if len(fixed_names) == 0:
+            cls._fixed_getter = None
+        elif len(fixed_names) == 1:
+            getter = attrgetter(fixed_names[0])
+            cls._fixed_getter = lambda obj: (getter(obj),)
+        else:
+            cls._fixed_getter = attrgetter(*fixed_names)
+        cls._var_fields = tuple(var_fields)
+        order = fixed_names + [name for name, is_str in var_fields]         # 解码后的值的顺序
+        cls._arg_order = None if len(var_fields) == 0 else tuple(order.index(name) for name, field_type in cls.FIELDS)
+        _struct_packet_dict[key] = cls
+
+    def pack(self):
+        cls = self.__class__
+        fixed = () if cls._fixed_getter is None else cls._fixed_getter(self)
+        head_len = cls._struct.size - 2
+        if len(cls._var_fields) == 0:
+            return cls._struct.pack(head_len, PacketDef.STRUCT_FLAG.value, cls.MID, cls.NID, *fixed)
+        part_list = []
+        length = head_len
+        for name, is_str in cls._var_fields:
+            value = getattr(self, name)
+            if is_str:
+                value = value.encode(encoding='utf8')
+            part_list.append(_LEN_STRUCT.pack(len(value)))
+            part_list.append(value)
+            length += 2 + len(value)
+        if length > PacketDef.MAX_PACKET_LEN.value:
+            raise PacketError('StructPacket too long.{}.{}'.format(cls.__name__, length))
+        return cls._struct.pack(length, PacketDef.STRUCT_FLAG.value, cls.MID, cls.NID, *fixed) + b''.join(part_list)
+
+    @classmethod
+    def unpack_from(cls, buffer):
+        '''buffer包括两个字节长度,可以是memoryview'''
+        buf_len = len(buffer)
+        if buf_len < cls._struct.size:
+            raise PacketError('StructPacket length error.{}.{}'.format(cls.__name__, buf_len))
+        values = cls._struct.unpack_from(buffer, 0)
+        if cls._arg_order is None:
+            return cls(*values[4:])
+        values = list(values[4:])
+        view = memoryview(buffer)
+        pos = cls._struct.size
+        for name, is_str in cls._var_fields:
+            if pos + 2 > buf_len:
+                raise PacketError('StructPacket field error.{}.{}'.format(cls.__name__, name))
+            length, = _LEN_STRUCT.unpack_from(view, pos)
+            pos += 2
+            if pos + length > buf_len:
+                raise PacketError('StructPacket field error.{}.{}'.format(cls.__name__, name))
+            try:
+                values.append(str(view[pos:pos + length], encoding='utf8') if is_str else bytes(view[pos:pos + length]))
+            except UnicodeDecodeError as e:
+                raise PacketError('StructPacket field error.{}.{}.{}'.format(cls.__name__, name, e))
+            pos += length
+        return cls(*[values[i] for i in cls._arg_order])
+
+    @property
+    def mid(self):
+        return self.MID
+
+    @property
+    def nid(self):
+        return self.NID
+
+    @property
+    def raw(self):
+        '''转发用的包,每次调用都重新打包'''
+        return self.pack()
+
+    @property
+    def data(self):
+        '''和BasePacket.data一样的字典,兼容按字典处理消息的代码,每次调用都会新建'''
+        data = {'m': self.MID, 'n': self.NID}
+        for name, field_type in self.FIELDS:
+            data[name] = getattr(self, name)
+        return data
+
+    def get(self, key, def_value):
+        if key == 'm':
+            return self.MID
+        if key == 'n':
+            return self.NID
+        return getattr(self, key, def_value)
+
+
+def unpack_struct_packet(buffer):
+    '''按buffer里的mid,nid找到注册的StructPacket子类解码'''
+    if len(buffer) < 3 + _STRUCT_ID.size:             # 长度,格式标记,mid,nid
+        raise PacketError('StructPacket length error.{}'.format(bytes(buffer[:30])))
+    mid, nid = _STRUCT_ID.unpack_from(buffer, 3)
+    cls = _struct_packet_dict.get((mid, nid), None)
+    if cls is None:
+        raise PacketError('StructPacket not registered.{}.{}'.format(mid, nid))
+    return cls.unpack_from(buffer)
+
+
+def _pack_varint(value):
+    buf = bytearray()
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+    return bytes(buf)
+
+def _unpack_varint(buffer, pos):
+    '''返回(值, 之后的位置),最多读5个字节'''
+    value = 0
+    for i in range(5):
+        if pos >= len(buffer):
+            break
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7f) << (7 * i)
+        if byte < 0x80:
+            return value, pos
+    raise PacketError('chunk varint error')
+
+def pack_chunks(content):
+    '''超过MAX_PACKET_LEN的内容分成多个分片包,每个分片包都是正常的两个字节长度的包,连续发送.
+    分片包内容: CHUNK_FLAG,flags(_CHUNK_MORE|_CHUNK_FIRST),第一个分片带varint的总长度,然后是这一段内容.
+    按平均长度分片,最后一个分片不会太短'''
+    total = len(content)
+    max_part = PacketDef.MAX_PACKET_LEN.value - _CHUNK_HEAD_MAX
+    count = -(-total // max_part)
+    part_len = -(-total // count)
+    view = memoryview(content)
+    buf_list = []
+    for pos in range(0, total, part_len):
+        flags = _CHUNK_MORE if pos + part_len < total else 0
+        if pos == 0:
+            head = bytes((PacketDef.CHUNK_FLAG.value, flags | _CHUNK_FIRST)) + _pack_varint(total)
+        else:
+            head = bytes((PacketDef.CHUNK_FLAG.value, flags))
+        part = view[pos:pos + part_len]
+        buf_list.append(_PACK_LEN_STRUCT.pack(len(head) + len(part)))
+        buf_list.append(head)
+        buf_list.append(part)
+    return b''.join(buf_list)
+
+
 class PacketSplit:
-    '''处理网络传输中的粘包处理'''
-    __slots__ = ('_byte_arr', '_copy_pos', '_split_pos', '_data_len')
-    def __init__(self):
+    '''处理网络传输中的粘包处理.
+    环形缓冲区,写入和读取都使用切片拷贝,不再逐字节复制和清0.
+    完整的包直接以memoryview交给BasePacket.unpack,只有包跨越缓冲区尾部时才拼接一次.
+    分片包按第一个分片里的总长度分配一次重组缓冲区,每个分片拷贝一次,收完后解码'''
+    __slots__ = ('_byte_arr', '_view', '_copy_pos', '_split_pos', '_data_len', '_max_message_len', '_chunk_buf', '_chunk_pos', '_lazy')
+    def __init__(self, max_message_len=None, lazy=False):
+        '''max_message_len: 分片重组后的最大长度,超过时抛出PacketError.None时为PacketDef.MAX_MESSAGE_LEN.
+        lazy: BasePacket延迟解码,见BasePacket'''
         self._byte_arr = bytearray(PacketDef.PACKET_SPLIT_BUFFER_SIZE.value)
+        self._view = memoryview(self._byte_arr)
         self._copy_pos = 0
         self._split_pos = 0
         self._data_len = 0
+        self._max_message_len = PacketDef.MAX_MESSAGE_LEN.value if max_message_len is None else max_message_len
+        self._chunk_buf = None              # 正在重组的消息
+        self._chunk_pos = 0
+        self._lazy = lazy
         
     def clear(self):
-        for i in range(0, PacketDef.PACKET_SPLIT_BUFFER_SIZE.value):
-            self._byte_arr[i] = 0
+        '''只重置读写位置,旧数据会被后续写入覆盖,不需要清0'''
         self._copy_pos = 0
         self._split_pos = 0
         self._data_len = 0
+        self._chunk_buf = None
+        self._chunk_pos = 0
         
     def push_data(self, dt_bys):
+        buf_size = PacketDef.PACKET_SPLIT_BUFFER_SIZE.value
         dt_len = len(dt_bys)
-        if (dt_len > PacketDef.MAX_PACKET_LEN.value):
-            Logger().warning('PacketSplit.push_data.长度超长.{}'.format(dt_len))
+        if dt_len > buf_size - self._data_len:
+            Logger().warning('PacketSplit.push_data.缓冲区空间不足.{}.{}'.format(dt_len, self._data_len))
             return False
-        for i in range(0, dt_len):
-            if self._copy_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
-                self._copy_pos = 0
-            self._byte_arr[self._copy_pos] = dt_bys[i]
-            self._copy_pos += 1
+        src = memoryview(dt_bys)
+        first_len = min(dt_len, buf_size - self._copy_pos)             # 写到缓冲区尾部的长度
+        self._view[self._copy_pos:self._copy_pos + first_len] = src[:first_len]
+        if first_len < dt_len:                                          # 剩下的从缓冲区头部开始写
+            self._view[0:dt_len - first_len] = src[first_len:]
+        self._copy_pos = (self._copy_pos + dt_len) % buf_size
         self._data_len += dt_len
         return True
         
@@ -94,70 +398,90 @@ class PacketSplit:
         '''派生类重载'''
         if self._data_len <= 0:
             return []
-        len_arr = bytearray(2)
         pack_list = []
         
-        while self._data_len > 0:
-            if self._split_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
-                self._split_pos = 0
-            len_pos1 = self._split_pos
-            len_pos2 = self._split_pos + 1
-            if len_pos2 >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
-                len_pos2 = 0
-            len_arr[0] = self._byte_arr[len_pos1]
-            len_arr[1] = self._byte_arr[len_pos2]
-            content_len = int.from_bytes(len_arr, 'little')
+        while self._data_len >= 2:
+            content_len = self._peek_len()
             if content_len < PacketDef.MIN_PACKET_LEN.value or content_len > PacketDef.MAX_PACKET_LEN.value:  #等于0也是异常
                 self.raise_error()
                 return []
-            '''判断是否有完整包,
-            __data_len不为0的情况下,__copy_pos和__split_pos不可能相等。因为每次的MAX_PER_TO_SPLIT_SIZE只有2048,而缓冲区65536,不可能出现一次填充到尾又到头又到__split_pos
-            的情况。
-            同一边:_copy_pos > _split_pos
-            不同边:_copy_pos < _split_pos
-            '''
-            if self._copy_pos == self._split_pos:
-                self.raise_error()
-                return []
-            if self._copy_pos > self._split_pos and content_len > (self._copy_pos - self._split_pos):              #同一边
-                break
-            if self._copy_pos < self._split_pos:                                                                  # 不同边
-                if content_len > (PacketDef.MAX_PACKET_LEN.value - self._split_pos) + self._copy_pos:
-                    break
             pack_len = content_len + 2          # BasePacket开头的两个字节长度不包括长度本身
-            data_arr = bytearray(pack_len)      
-            pack_pos = len_pos1
-            for i in range(0, pack_len):            
-                if pack_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
-                    pack_pos = 0
-                data_arr[i] = self._byte_arr[pack_pos]
-                self._byte_arr[pack_pos] = 0           #清0
-                pack_pos += 1
-            packet = BasePacket()
+            if pack_len > self._data_len:       # 还没有完整包
+                break
             try:
-                packet.unpack(bytes(data_arr))
+                view = self._read_view(pack_len)
+                if view[2] == PacketDef.STRUCT_FLAG.value:         # 二进制格式,解码成注册的StructPacket子类
+                    packet = unpack_struct_packet(view)
+                elif view[2] == PacketDef.CHUNK_FLAG.value:        # 分片包,收完最后一个分片才有完整的包
+                    packet = self._push_chunk(view)
+                else:
+                    packet = BasePacket()
+                    packet.unpack(view, self._lazy)
             except Exception as e:
                 self.clear()
                 raise e
                 return []
-            pack_list.append(packet)
-            self._split_pos = pack_pos
+            if packet is not None:
+                pack_list.append(packet)
+            self._split_pos = (self._split_pos + pack_len) % PacketDef.PACKET_SPLIT_BUFFER_SIZE.value
             self._data_len -= pack_len
         
         return pack_list
+    
+    def _push_chunk(self, view):
+        '''分片放进重组缓冲区,收完最后一个分片时返回解码后的BasePacket,否则返回None'''
+        flags = view[3]
+        pos = 4
+        if flags & _CHUNK_FIRST:
+            if self._chunk_buf is not None:
+                raise PacketError('chunk first again.{}'.format(self._chunk_pos))
+            total, pos = _unpack_varint(view, pos)
+            if total > self._max_message_len:
+                raise PacketError('chunk message too long.{}.{}'.format(total, self._max_message_len))
+            self._chunk_buf = bytearray(total)
+            self._chunk_pos = 0
+        elif self._chunk_buf is None:
+            raise PacketError('chunk without first')
+        end = self._chunk_pos + len(view) - pos
+        if end > len(self._chunk_buf):
+            raise PacketError('chunk overflow.{}.{}'.format(end, len(self._chunk_buf)))
+        self._chunk_buf[self._chunk_pos:end] = view[pos:]
+        self._chunk_pos = end
+        if flags & _CHUNK_MORE:
+            return None
+        content = self._chunk_buf
+        self._chunk_buf = None
+        if end != len(content) or end == 0:
+            raise PacketError('chunk length error.{}.{}'.format(end, len(content)))
+        packet = BasePacket()
+        if self._lazy:
+            packet.unpack_content(content, True)                # 重组用的缓冲区不再复用,不用拷贝
+        else:
+            packet.unpack_content(memoryview(content))
+        return packet
+    
+    def _peek_len(self):
+        '''直接从缓冲区读取两个字节的长度'''
+        pos = self._split_pos
+        if pos + 1 < PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
+            content_len, = _LEN_STRUCT.unpack_from(self._byte_arr, pos)
+            return content_len
+        return self._byte_arr[pos] | (self._byte_arr[0] << 8)          # 长度的两个字节跨越了缓冲区尾部
+    
+    def _read_view(self, pack_len):
+        '''返回从_split_pos开始pack_len长度的数据.不跨尾部时是缓冲区的视图,不拷贝'''
+        buf_size = PacketDef.PACKET_SPLIT_BUFFER_SIZE.value
+        pos = self._split_pos
+        if pos + pack_len <= buf_size:
+            return self._view[pos:pos + pack_len]
+        return memoryview(bytes(self._view[pos:]) + bytes(self._view[:pack_len - (buf_size - pos)]))
             
     def raise_error(self):
         '''在此函数里会调用clear'''
-        info_len = 30                   # 只打印30数据
-        info_pos = self._split_pos
-        info_arr = bytearray(info_len)
-        for i in range(0, info_len):
-            if info_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
-                info_pos = 0
-            info_arr[i] = self._byte_arr[info_pos]
-            info_pos += 1
-        # s_i = bytes(info_arr).decode(encoding='utf8') 可能触发UnicodeDecodeError
-        s_i = 'datalen:{},arrlen:{},bytes:{}'.format(self._data_len, len(info_arr), bytes(info_arr))
+        info_len = min(30, self._data_len)                   # 只打印30数据
+        info_bys = bytes(self._read_view(info_len)) if info_len > 0 else b''
+        # s_i = info_bys.decode(encoding='utf8') 可能触发UnicodeDecodeError
+        s_i = 'datalen:{},arrlen:{},bytes:{}'.format(self._data_len, len(info_bys), info_bys)
         self.clear()            # 先取出异常打印字符串,再clear
         raise PacketError(s_i)
         
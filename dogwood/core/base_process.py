@@ -1,40 +1,107 @@
 # -*- coding: UTF-8 -*-
 
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Event, Value
+from multiprocessing.connection import wait
+import queue
+import selectors
 import time
 from dogwood.core.helper import Helper
 from dogwood.core.logger import LogInit, Logger
+from dogwood.core.shm_queue import ShmQueue, ShmQueueDef
+from dogwood.core.waker import Waker
+
+class MsgBatch:
+    '''一帧内要跨进程发送的多个消息,打包成一个对象,只put一次(一次pickle,一次加锁,一次写管道)'''
+    __slots__ = ('msgs')
+    def __init__(self, msgs):
+        self.msgs = msgs
+        
+        
+class BatchStat:
+    '''统计跨进程的批量发送情况,用于观察IPC次数的减少'''
+    __slots__ = ('put_count', 'msg_count', 'max_size')
+    def __init__(self):
+        self.reset()
+        
+    def reset(self):
+        self.put_count = 0          # put次数
+        self.msg_count = 0          # 消息数
+        self.max_size = 0           # 单次最大消息数
+        
+    def add(self, size):
+        self.put_count += 1
+        self.msg_count += size
+        if size > self.max_size:
+            self.max_size = size
+            
+    def __str__(self):
+        avg_size = self.msg_count / self.put_count if self.put_count > 0 else 0
+        return 'put:{},msg:{},avg:{:.1f},max:{}'.format(self.put_count, self.msg_count, avg_size, self.max_size)
+    
 
 class BaseProcess(Process):
-    __slots__ = ('__event', '_run_flag', '__frame_min_time', '__frame_warn_time', '_log_name', '_in_queue', '_out_queue')
-    def __init__(self, log_name, event):
+    __slots__ = ('__event', '_run_flag', '_idle_wait_time', '__frame_warn_time', '__stat_time', '_log_name', '_in_queue', '_out_queue',
+                 '__use_shm', '__in_waker', '__out_waker', '_in_batch', '_out_batch', '_in_stat', '_out_stat', '__quit_event', '__quit_pulled',
+                 '__in_put_num', '__in_got_num', '__out_full', '__out_stash')
+    def __init__(self, log_name, event, shm_size=0):
+        '''shm_size大于0时,_in_queue和_out_queue使用该大小的共享内存队列ShmQueue,否则使用multiprocessing.Queue'''
         super().__init__()
         self.__event = event
-        self.__frame_min_time = 2      # 最小间隔毫秒数,默认2毫秒.当一帧时间消耗不足这个数字时，会Sleep这个数字减去消耗
+        self._idle_wait_time = 100     # 没有消息时最多阻塞等待的毫秒数.入队列来消息时会立即唤醒,不用等到超时
         self.__frame_warn_time = 1000         # 当一帧消耗时间大于这个数字时，会打印警告.默认为1000毫秒
+        self.__stat_time = 60000              # 打印批量发送统计的间隔毫秒数
         self._log_name = log_name
-        self._in_queue = Queue()           # 进程间通信队列,入队列
-        self._out_queue = Queue()          # 进程间通信队列,出队列
+        self.__use_shm = shm_size > 0
+        if self.__use_shm:
+            self._in_queue = ShmQueue(shm_size, MsgBatch)       # 进程间通信队列,入队列
+            self._out_queue = ShmQueue(shm_size, MsgBatch)      # 进程间通信队列,出队列
+        else:
+            self._in_queue = Queue()           # 进程间通信队列,入队列
+            self._out_queue = Queue()          # 进程间通信队列,出队列
+        self.__quit_event = Event()        # ShmQueue时退出信号不走入队列,因为ShmQueue只能有一个生产者,而quit可能在其它线程调用
+        self.__quit_pulled = False
+        self.__in_put_num = Value('Q', 0, lock=False)       # ShmQueue时调用者进程放进入队列的批量记录数,只有flush_msg修改
+        self.__in_got_num = 0              # ShmQueue时子进程从入队列取出的批量记录数,追上__in_put_num后才处理退出信号
+        self.__out_full = Value('b', 0, lock=False)         # ShmQueue时子进程有出队列满留下的消息,调用者取走消息后唤醒它重发
+        self.__out_stash = []              # ShmQueue时调用者flush_msg等入队列空间时先取出的出队列消息,pull_msgs时返回
+        self.__in_waker = Waker()          # 唤醒子进程.ShmQueue没有可等待的句柄,push和quit时用它唤醒
+        self.__out_waker = Waker()         # 唤醒调用者进程,作用同上
+        self._in_batch = []                # 调用者进程里一帧内push_msg的消息,flush_msg时一次发出
+        self._out_batch = []               # 子进程里一帧内_post_msg的消息,每帧结束时一次发出
+        self._in_stat = BatchStat()        # 入队列批量统计,在调用者进程里
+        self._out_stat = BatchStat()       # 出队列批量统计,在子进程里
         self._run_flag = False
         
     def run(self):
         LogInit(self._log_name)                                # 不同进程,都要初始化一次
         self.process_init()
         self.__event.set()
+        self._run_flag = True
+        self._run_loop()
+        self.__flush_out_end()
+        self.process_end()
+        
+    def _run_loop(self):
+        '''帧循环,_run_flag为False时返回.asyncio的网络进程重载为运行事件循环'''
         now_milli = Helper.get_program_milli_second()
         last_milli = now_milli
+        last_stat_milli = now_milli
         tick_milli = 0
-        self._run_flag = True
         while self._run_flag:
             now_milli = Helper.get_program_milli_second()
             self.run_frame(now_milli)
+            self._flush_out()
             tick_milli = now_milli - last_milli
             last_milli = now_milli
+            if now_milli - last_stat_milli >= self.__stat_time:
+                Logger().info('{}.out batch.{}'.format(self._log_name, self._out_stat))
+                self._out_stat.reset()
+                self._log_stat()
+                last_stat_milli = now_milli
             if tick_milli > self.__frame_warn_time:
                 Logger().warning('{}.Process主循环线程超期:帧耗时:{}.'.format(self._log_name, tick_milli))
             else:
-                time.sleep(self.__frame_min_time / 1000)
-        self.process_end()
+                self._wait_work(self._idle_wait_time / 1000)
                
     def process_init(self):                     
         '''子类需重载'''
@@ -47,12 +114,174 @@ class BaseProcess(Process):
     def process_end(self):                      
         '''子类需重载'''
         pass
+    
+    def _log_stat(self):
+        '''子类重载,和批量发送统计一起定时打印自己的统计'''
+        pass
+    
+    def _wait_work(self, timeout):
+        '''阻塞等待入队列的消息,最多timeout秒.网络进程在selector里等待,重载为空'''
+        wait(self._in_wait_list(), timeout)
+        
+    def _in_wait_list(self):
+        '''入队列有消息时可读的对象列表,可以放进select'''
+        if self.__use_shm:
+            return [self.__in_waker.reader]
+        return [self.__in_waker.reader, self._in_queue._reader]         # multiprocessing.Queue内部的读管道,有数据时可读
+    
+    def _register_wakeup(self, selector):
+        '''网络进程把入队列的可读对象注册进自己的selector,返回是否成功.
+        windows下multiprocessing.Queue的管道不能放进select,返回False,调用者要用较短的select超时'''
+        for obj in self._in_wait_list():
+            try:
+                selector.register(obj, selectors.EVENT_READ, self._on_wakeup)
+            except (ValueError, OSError):
+                return False
+        return True
+    
+    def _on_wakeup(self, fileobj, mask):
+        '''只是让select返回,消息在_pull_in_msgs里取'''
+        pass
+    
+    ####################################################################
+    # 以下在子进程里调用
+    ####################################################################
+    def _post_msg(self, msg):
+        '''向调用者进程发消息,先缓存,每帧结束时批量发出'''
+        self._out_batch.append(msg)
         
+    def _flush_out(self):
+        '''ShmQueue满时不阻塞,放不进去的留在_out_batch里下一帧再发,调用者可能正等着入队列的空间'''
+        if len(self._out_batch) == 0:
+            return
+        if not self.__use_shm:
+            self._out_stat.add(len(self._out_batch))
+            self._out_queue.put(MsgBatch(self._out_batch))
+            self._out_batch = []
+            return
+        msg_num, rec_num = self._out_queue.put_msgs(self._out_batch)
+        if rec_num > 0:
+            self._out_stat.add(msg_num)
+            self.__out_waker.wake()
+        if msg_num == len(self._out_batch):
+            self._out_batch = []
+            self.__out_full.value = 0
+        else:
+            self._out_batch = self._out_batch[msg_num:]
+            self.__out_full.value = 1
+        
+    def __flush_out_end(self):
+        '''退出前发出剩下的消息.ShmQueue满时调用者可能已经不再取消息(如在join里),最多等待EXIT_FLUSH_TIME'''
+        self._flush_out()
+        begin_time = time.perf_counter()
+        while len(self._out_batch) > 0:
+            if time.perf_counter() - begin_time >= ShmQueueDef.EXIT_FLUSH_TIME.value:
+                Logger().warning('{}.出队列满,退出时丢弃{}条消息'.format(self._log_name, len(self._out_batch)))
+                self._out_batch = []
+                break
+            time.sleep(ShmQueueDef.FULL_WAIT_TIME.value)
+            self._flush_out()
+        
+    def _pull_in_msgs(self):
+        '''取出入队列的所有消息,批量消息会被展开.调用过quit后,退出信号排在quit之前flush_msg的消息后面'''
+        self.__in_waker.clear()                 # 先清唤醒再取消息,取完之后的新消息一定会再次唤醒
+        if not self.__use_shm:                  # 退出信号在multiprocessing.Queue里,顺序由队列保证
+            return self.__drain_queue(self._in_queue)
+        is_quit = self.__quit_event.is_set()    # 先读退出标记再取消息,quit之前put的批次数此时已经确定
+        msg_list = self.__drain_queue(self._in_queue)
+        if is_quit and not self.__quit_pulled and self.__in_got_num >= self.__in_put_num.value:
+            self.__quit_pulled = True
+            msg_list.append(Helper.quit_signal())
+        return msg_list
+    
+    ####################################################################
+    # 以下在调用者进程里调用
+    ####################################################################
     def push_msg(self, msg):
-        self._in_queue.put(msg)
+        '''先缓存,调用者需要在帧结束时调用flush_msg'''
+        self._in_batch.append(msg)
+        
+    def flush_msg(self):
+        '''ShmQueue满时等子进程取走消息,等待时取出出队列的消息暂存,子进程不会因为出队列满而不取入队列,互相等待.
+        子进程已经退出时丢弃'''
+        if len(self._in_batch) == 0:
+            return
+        self._in_stat.add(len(self._in_batch))
+        msgs = self._in_batch
+        self._in_batch = []
+        if not self.__use_shm:
+            self._in_queue.put(MsgBatch(msgs))
+            return
+        while True:
+            msg_num, rec_num = self._in_queue.put_msgs(msgs)
+            self.__in_put_num.value += rec_num
+            self.__in_waker.wake()
+            if msg_num == len(msgs):
+                break
+            msgs = msgs[msg_num:]
+            self.__out_stash.extend(self.__drain_queue(self._out_queue))
+            if self.exitcode is not None:
+                Logger().error('{}.子进程已退出,丢弃{}条消息'.format(self._log_name, len(msgs)))
+                break
+            time.sleep(ShmQueueDef.FULL_WAIT_TIME.value)
+    
+    def quit(self):
+        '''通知子进程退出,可以在任意线程调用.子进程处理完quit之前flush_msg的消息才退出'''
+        if self.__use_shm:
+            self.__quit_event.set()
+        else:
+            self._in_queue.put(Helper.quit_signal())       # 排在已经put的消息后面,multiprocessing.Queue由后台线程写管道,不能用Event抢先
+        self.__in_waker.wake()
+        
+    def close_queues(self):
+        '''子进程join之后调用,释放共享内存队列和唤醒管道'''
+        for que in (self._in_queue, self._out_queue):
+            if type(que) is ShmQueue:
+                que.close()
+        self.__in_waker.close()
+        self.__out_waker.close()
     
     def pull_msg_empty(self):
-        return self._out_queue.empty()
+        return len(self.__out_stash) == 0 and self._out_queue.empty()
     
     def pull_msg(self):
+        if len(self.__out_stash) > 0:
+            return self.__out_stash.pop(0)
         return self._out_queue.get_nowait()
+    
+    def pull_msgs(self):
+        '''取出出队列的所有消息,批量消息会被展开'''
+        self.__out_waker.clear()
+        msg_list = self.__drain_queue(self._out_queue)
+        if not self.__use_shm:
+            return msg_list
+        if len(self.__out_stash) > 0:
+            msg_list = self.__out_stash + msg_list
+            self.__out_stash = []
+        if self.__out_full.value:               # 出队列有空间了,唤醒子进程发出留下的消息
+            self.__in_waker.wake()
+        return msg_list
+    
+    def out_wait_list(self):
+        '''出队列有消息时可读的对象列表,调用者的逻辑线程用来阻塞等待'''
+        if self.__use_shm:
+            return [self.__out_waker.reader]
+        return [self.__out_waker.reader, self._out_queue._reader]
+    
+    def in_batch_stat(self):
+        return self._in_stat
+    
+    def __drain_queue(self, que):
+        msg_list = []
+        while not que.empty():
+            try:
+                msg_obj = que.get_nowait()
+            except queue.Empty:
+                break
+            if type(msg_obj) is MsgBatch:
+                msg_list.extend(msg_obj.msgs)
+                if que is self._in_queue:
+                    self.__in_got_num += 1
+            else:
+                msg_list.append(msg_obj)
+        return msg_list
@@ -1,15 +1,20 @@
 # -*- coding: UTF-8 -*-
 
+import itertools
 import threading
-import time
 import queue
 import traceback
 import types
+from collections import deque
 from enum import Enum
 
+from multiprocessing.connection import wait
+
 from dogwood.core.helper import Helper
 from dogwood.core.logger import Logger
 from dogwood.core.timer_group import TimerGroup
+from dogwood.core.coroutine import CorouItem, CorouSleep, CorouWait, CorouTimeout
+from dogwood.core.waker import Waker
 
 class CoroutineOpe(Enum):
     COROUTINE_ADD = 0               # 增加一个协程
@@ -24,22 +29,44 @@ class CoroutineNotify:
         self.obj = obj                  # add时，是迭代器函数,push时,是msg
 
 
+class ThreadsafeHandle:
+    '''call_soon_threadsafe,call_later_threadsafe返回的句柄,任意线程都可以cancel'''
+    __slots__ = ('func', 'args', 'delay_milli', 'submit_milli', 'cancelled')
+    def __init__(self, func, args, delay_milli, submit_milli):
+        self.func = func
+        self.args = args
+        self.delay_milli = delay_milli      # 从submit_milli开始计算的延迟毫秒数
+        self.submit_milli = submit_milli
+        self.cancelled = False
+        
+    def cancel(self):
+        '''只是设置标记,还没执行的不再执行,正在执行的不受影响'''
+        self.cancelled = True
+        
+
 class BaseThread(threading.Thread):
-    __slots__ = ('__event', '__frame_min_time', '__frame_warn_time', '__frame_abort_time', '_msg_queue',  
-                 '_timer_group', '_corou_notify_queue', '__corou_tick', '__corou_dict')
+    __slots__ = ('__event', '__idle_wait_time', '__frame_warn_time', '__frame_abort_time', '_msg_queue',  
+                 '_timer_group', '_corou_notify_queue', '__corou_tick', '__corou_dict', '__corou_wait_timeout',
+                 '__corou_ready', '__corou_stepping', '__waker', '__call_queue', '__call_woken')
     def __init__(self, event):
         super().__init__()
         self.__event = event
-        self.__frame_min_time = 2                   # 最小帧时间, 默认2毫秒.当一帧时间消耗不足这个数字时，会Sleep这个数字减去消耗
+        self.__idle_wait_time = 16                  # 空闲时最多阻塞等待的毫秒数.有消息或唤醒时立即返回,有timer时等到timer触发
         self.__frame_warn_time = 1000               # 当一帧消耗时间大于这个数字时，会打印警告.默认为1000毫秒
         self.__frame_abort_time = 30000             # 当一帧消耗时间大于这个数字时，会放弃处理剩下的消息.默认为30秒
         self._msg_queue = queue.Queue()            # 消息队列,注意这里用了queue.Queue,不是multiprocessing.Queue,
                                                     #一是为了效率，二是有清空函数self.msg_queue.queue.clear(),线程安全
-        self._timer_group = TimerGroup()            # 计时函数集合
+        self._timer_group = TimerGroup()            # 计时函数集合,其时间轮是本线程所有timer共用的
         self._corou_notify_queue = queue.Queue()    # 协程相关的消息队列
-        self.__corou_tick = 1000                    # 假定每天消耗500万个，消耗到50亿需要1000天，服务器不太可能连续运行1000天
-        self.__corou_dict = {}                      # 字典，key为cid, value是迭代器函数
-        
+        self.__corou_tick = itertools.count(1000)   # 协程id,其它线程也会调用add_corou,next是原子的
+        self.__corou_dict = {}                      # 字典，key为cid, value是CorouItem
+        self.__corou_wait_timeout = 600000          # 协程等待push_corou_msg的默认超时毫秒数,见coroutine.py
+        self.__corou_ready = deque()                # 本帧内要恢复的协程,元素(cid, msg, 异常, seq),seq为None是push_corou_msg的消息
+        self.__corou_stepping = False               # 正在执行__corou_ready,这时恢复协程只排队,不递归
+        self.__waker = Waker()                      # 其它线程或本线程投递消息时,唤醒阻塞等待中的主循环
+        self.__call_queue = deque()                 # 其它线程投递的ThreadsafeHandle,deque的append和popleft是原子的,不用加锁
+        self.__call_woken = False                   # 投递后已经唤醒过,主循环等待前重置,之后的投递才再唤醒
+        self.set_corou_report_interval(600000)      # 每10分钟打印存活的协程,观察有没有泄漏
         
     def run(self):
         self.thread_init()
@@ -75,17 +102,89 @@ class BaseThread(threading.Thread):
                 self.process_timer(now_milli)           # 此处有了try,下级函数可以减少try
             except Exception as e:
                 traceback.print_exc()
+            try:
+                self.flush_frame()
+            except Exception as e:
+                traceback.print_exc()
             # 时间处理
             tick_milli = now_milli - last_milli
             last_milli = now_milli
             if tick_milli > self.__frame_warn_time:
                 Logger().warning('{}.主循环线程超期:帧耗时:{}.消息队列大小:{}'.format(cls_name, tick_milli, queue_size))
-            else:
-                time.sleep(self.__frame_min_time / 1000)
+            elif not b_quit:
+                self.__wait_work(now_milli)
             if b_quit:          # 退出
                 break
         self.thread_quit()
                 
+    def __wait_work(self, now_milli):
+        '''阻塞等待,直到子进程有消息、被wakeup唤醒、或者timer到期'''
+        self.__call_woken = False                   # 先重置再检查队列,见call_later_threadsafe
+        if not self._msg_queue.empty() or not self._corou_notify_queue.empty() or len(self.__call_queue) > 0:
+            return
+        timeout = self.__idle_wait_time
+        timer_wait = self._timer_group.next_wait(now_milli)
+        if timer_wait is not None and timer_wait < timeout:
+            timeout = timer_wait
+        if timeout > 0:
+            wait([self.__waker.reader] + self.wait_objects(), timeout / 1000)
+        self.__waker.clear()
+        
+    def wait_objects(self):
+        '''子类选择重载,返回可以阻塞等待的对象列表(如子进程出队列的wait_list),有数据时唤醒主循环'''
+        return []
+    
+    def wakeup(self):
+        '''唤醒阻塞等待中的主循环,任意线程都可以调用'''
+        self.__waker.wake()
+        
+    @property
+    def timer_wheel(self):
+        '''本线程的时间轮,只能在本线程里使用'''
+        return self._timer_group.wheel
+    
+    def call_later(self, delay_milli, func, *args):
+        '''delay_milli毫秒后在本线程执行func(*args),只能在本线程里调用,返回TimerHandle,可以cancel'''
+        return self._timer_group.wheel.call_later(delay_milli, func, *args)
+    
+    def call_soon_threadsafe(self, func, *args):
+        '''任意线程调用,在本线程的下一帧执行func(*args),返回ThreadsafeHandle'''
+        return self.call_later_threadsafe(0, func, *args)
+    
+    def call_later_threadsafe(self, delay_milli, func, *args):
+        '''任意线程调用,从调用时开始delay_milli毫秒后在本线程执行func(*args),返回ThreadsafeHandle.
+        投递只是一次deque.append,主循环等待前第一次投递时才唤醒,每帧process_timer时一次取出,延迟的放进本线程的时间轮'''
+        handle = ThreadsafeHandle(func, args, delay_milli, Helper.get_program_milli_second())
+        self.__call_queue.append(handle)
+        if not self.__call_woken:                   # 先append再看标记:主循环重置标记后才检查队列,漏看的投递一定会唤醒
+            self.__call_woken = True
+            self.__waker.wake()
+        return handle
+        
+    def __drain_call_queue(self, now_milli):
+        call_queue = self.__call_queue
+        wheel = self._timer_group.wheel
+        for _ in range(len(call_queue)):            # 只取本帧开始时已有的,执行中投递的留到下一帧
+            handle = call_queue.popleft()
+            if handle.cancelled:
+                continue
+            if handle.submit_milli + handle.delay_milli <= now_milli:
+                self.__run_threadsafe(handle)
+            else:
+                wheel.add_timer(handle.delay_milli, self.__run_threadsafe, 1, (handle,), handle.submit_milli)
+                
+    @staticmethod
+    def __run_threadsafe(handle):
+        if handle.cancelled:
+            return
+        try:
+            handle.func(*handle.args)
+        except Exception as e:
+            Logger().error('threadsafe call:%s:%s' % (repr(handle.func), e))
+        
+    def set_idle_wait_time(self, wait_milli):
+        self.__idle_wait_time = wait_milli
+                
     def thread_init(self):              # 子类选择重载
         pass
         
@@ -97,32 +196,82 @@ class BaseThread(threading.Thread):
     
     def process_timer(self, now_milli):            
         '''子类需重载,重载时需要调用super().process_timer(now_milli)'''
+        self.__drain_call_queue(now_milli)
         self._timer_group.run_timer(now_milli)
         self._corou_timer(now_milli)
     
+    def flush_frame(self):
+        '''每帧结束时调用,子类选择重载,用于把一帧内缓存的跨进程消息一次发出'''
+        pass
+    
     def thread_quit(self):              # 子类选择继承
         pass
         
     def quit(self):
         self._msg_queue.put(Helper.quit_signal())
+        self.wakeup()
 
     ####################################################################
     # 以下是协程相关函数
     ####################################################################
     def add_corou(self, gene_func):
-        if not type(gene_func) is types.GeneratorType:              # 判断类型
+        '''增加协程,返回cid.gene_func是生成器(cid = yield拿到cid)或async def的协程对象,见coroutine.py.
+        本线程里调用时立即开始执行,其它线程调用时在本线程的下一帧开始'''
+        if not type(gene_func) in (types.GeneratorType, types.CoroutineType):     # 判断类型
             Logger().warning('128099. gene_func not GeneratorType.{}'.format(type(gene_func)))
             return None
-        cur_id = self.__corou_tick
-        self.__corou_tick += 1
-        it_obj = gene_func
-        ntf = CoroutineNotify(CoroutineOpe.COROUTINE_ADD.value, cur_id, it_obj)
+        cur_id = next(self.__corou_tick)
+        if threading.get_ident() == self.ident:
+            self.__corou_add(cur_id, gene_func)
+            return cur_id
+        ntf = CoroutineNotify(CoroutineOpe.COROUTINE_ADD.value, cur_id, gene_func)
         self._corou_notify_queue.put(ntf)
+        self.wakeup()
         return cur_id
     
     def push_corou_msg(self, cid, msg):
+        '''把msg交给等待中的协程.本线程里调用时在本帧内恢复,不经过_corou_notify_queue'''
+        if threading.get_ident() == self.ident:
+            self.resume_corou(cid, msg)
+            return
         ntf = CoroutineNotify(CoroutineOpe.COROUTINE_PUSH_MSG.value, cid, msg)
         self._corou_notify_queue.put(ntf)
+        self.wakeup()
+        
+    def resume_corou(self, cid, msg):
+        '''只能在本线程里调用.在协程里调用时,等当前协程这一步执行完再恢复,不会递归'''
+        self.__corou_ready.append((cid, msg, None, None))
+        if not self.__corou_stepping:
+            self.__run_corou_ready()
+            
+    def throw_corou(self, cid, exc):
+        '''只能在本线程里调用,把异常抛进等待中的协程'''
+        self.__corou_ready.append((cid, None, exc, None))
+        if not self.__corou_stepping:
+            self.__run_corou_ready()
+        
+    def set_corou_wait_timeout(self, wait_milli):
+        '''协程yield None等待push_corou_msg的超时毫秒数,0表示不超时.超时抛出CorouTimeout,防止回复丢失的协程一直留在内存里'''
+        self.__corou_wait_timeout = wait_milli
+        
+    def set_corou_report_interval(self, interval_milli):
+        '''打印存活协程报告的间隔毫秒数,0表示不打印'''
+        self._timer_group.remove_timer_event('corou_report')
+        if interval_milli > 0:
+            self._timer_group.add_timer_event('corou_report', interval_milli, self.corou_report)
+        
+    def corou_num(self):
+        return len(self.__corou_dict)
+        
+    def corou_report(self, top_num=10):
+        '''打印存活协程数,以及存在时间最长的top_num个的cid,名字,存在毫秒数和状态'''
+        if len(self.__corou_dict) == 0:
+            return
+        now_milli = Helper.get_program_milli_second()
+        oldest = sorted(self.__corou_dict.items(), key=lambda kv: kv[1].create_milli)[:top_num]
+        desc_list = ['{}:{}:{}:{}'.format(cid, item.name, now_milli - item.create_milli, 'sleep' if item.sleeping else 'wait')
+                     for cid, item in oldest]
+        Logger().info('{}.协程数:{}.最老的:{}'.format(self.__class__.__name__, len(self.__corou_dict), ','.join(desc_list)))
         
     def _corou_timer(self, now_milli):
         temp_ntf_list = []
@@ -134,29 +283,100 @@ class BaseThread(threading.Thread):
                 Logger().error('234223 ntf_obj type error.{}'.format(ntf_obj))
                 continue
             if ntf_obj.ope == CoroutineOpe.COROUTINE_ADD.value:
-                cid = ntf_obj.cid
-                gene_obj = ntf_obj.obj
-                self.__corou_dict[cid] = gene_obj
-                try:
-                    gene_obj.send(None)
-                    gene_obj.send(cid)
-                except StopIteration:
-                    self._safe_del_corou_item(cid)
+                self.__corou_add(ntf_obj.cid, ntf_obj.obj)
             elif ntf_obj.ope == CoroutineOpe.COROUTINE_PUSH_MSG.value:
-                cid = ntf_obj.cid
-                msg = ntf_obj.obj
-                it_obj = self.__corou_dict.get(cid, None)
-                if it_obj is None:
-                    Logger().warning('434679 cid not in __corou_dict keys .{}'.format(cid))
-                    continue
-                try:
-                    it_obj.send(msg)
-                except StopIteration:
-                    self._safe_del_corou_item(cid)
+                self.resume_corou(ntf_obj.cid, ntf_obj.obj)
             else:
                 Logger().error('531238 ntf_obj ope error.{}'.format(ntf_obj.ope))
                 continue
             
+    def __corou_add(self, cid, gene):
+        item = CorouItem(gene, Helper.get_program_milli_second())
+        self.__corou_dict[cid] = item
+        self.__corou_ready.append((cid, None, None, item.seq))
+        if not self.__corou_stepping:
+            self.__run_corou_ready()
+            
+    def __run_corou_ready(self):
+        '''依次执行就绪的协程,执行中恢复的协程排在后面,都在本帧内执行完'''
+        self.__corou_stepping = True
+        try:
+            ready = self.__corou_ready
+            while len(ready) > 0:
+                cid, msg, exc, seq = ready.popleft()
+                item = self.__corou_dict.get(cid, None)
+                if item is None:
+                    if seq is None:
+                        Logger().warning('434679 cid not in __corou_dict keys .{}'.format(cid))
+                    continue
+                if seq is None:                     # push_corou_msg的消息
+                    if item.sleeping:
+                        Logger().warning('434680 corou sleeping, msg dropped.{}.{}'.format(cid, item.name))
+                        continue
+                elif seq != item.seq:               # 定时器到期前协程已经被消息恢复过
+                    continue
+                item.cancel_timer()
+                self.__corou_resume(cid, item, msg, exc)
+        finally:
+            self.__corou_stepping = False
+            
+    def __corou_resume(self, cid, item, msg, exc):
+        '''向协程send消息或throw异常,按yield的值设置超时或睡眠'''
+        try:
+            if not item.started:
+                item.started = True
+                if type(item.gene) is types.GeneratorType:     # 生成器先执行到cid = yield,再把cid发进去
+                    item.gene.send(None)
+                    msg = cid
+            if exc is None:
+                ret = item.gene.send(msg)
+            else:
+                ret = item.gene.throw(exc)
+        except StopIteration:
+            self._safe_del_corou_item(cid)
+            return
+        except Exception as e:
+            self.__on_corou_error(cid, item, e)
+            return
+        item.seq += 1
+        wheel = self._timer_group.wheel
+        if type(ret) is CorouSleep:
+            item.sleeping = True
+            item.timer = wheel.call_later(ret.milli, self.__corou_wake, cid, item.seq, None)
+            return
+        item.sleeping = False
+        timeout = self.__corou_wait_timeout
+        if type(ret) is CorouWait and ret.timeout is not None:
+            timeout = ret.timeout
+        if timeout > 0:
+            item.timer = wheel.call_later(timeout, self.__corou_wake, cid, item.seq, timeout)
+        if type(ret) is CorouWait:
+            item.cancel = ret.cancel
+        if type(ret) is CorouWait and ret.start is not None:
+            try:
+                ret.start(cid)
+            except Exception as e:                  # 发起请求失败,抛进协程里
+                self.__corou_ready.append((cid, None, e, item.seq))
+            
+    def __corou_wake(self, cid, seq, timeout):
+        '''CorouSleep到期(timeout为None)或等待超时'''
+        item = self.__corou_dict.get(cid, None)
+        if item is None:
+            return
+        item.timer = None
+        exc = None if timeout is None else CorouTimeout('{}.{}.{}'.format(cid, item.name, timeout))
+        self.__corou_ready.append((cid, None, exc, seq))
+        if not self.__corou_stepping:
+            self.__run_corou_ready()
+        
+    def __on_corou_error(self, cid, item, e):
+        '''协程抛出了异常(包括没有捕获的CorouTimeout),结束并删除'''
+        Logger().error('corou error.{}.{}.{}'.format(cid, item.name, e))
+        if not isinstance(e, CorouTimeout):
+            traceback.print_exc()
+        self._safe_del_corou_item(cid)
+            
     def _safe_del_corou_item(self, cid):
-        if cid in self.__corou_dict.keys():
-            del self.__corou_dict[cid]
\ No newline at end of file
+        item = self.__corou_dict.pop(cid, None)
+        if item is not None:
+            item.cancel_timer()
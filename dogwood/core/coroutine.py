@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+
+'''
+BaseThread.add_corou的协程,可以是生成器,也可以是async def.
+生成器先用cid = yield拿到cid,之后可以yield:
+    msg = yield                         等待push_corou_msg,超过BaseThread的默认等待时间(set_corou_wait_timeout)抛出CorouTimeout
+    msg = yield CorouWait(5000)         等待push_corou_msg,5秒没有收到抛出CorouTimeout
+    yield CorouSleep(1000)              1秒后继续,期间push_corou_msg的消息丢弃
+async def里用await代替yield:
+    await CorouSleep(1000)
+    msg = await CorouWait(5000, start)  start(cid)里发起请求(如数据库,向其它服务器的请求),回复时用cid调用push_corou_msg
+    ret = await game_main.mysql_monitor.request(notify)
+    ret_list = await game_main.mysql_monitor.gather([notify1, notify2])     多个数据库请求同时发出,都回复后一起返回
+协程在本线程里被恢复时(如数据库结果,本线程的push_corou_msg)在同一帧内继续执行.
+超时抛出CorouTimeout后,迟到的消息可能在协程下一次等待时收到,捕获了CorouTimeout继续等待的协程要自己校验消息
+'''
+
+class CorouTimeout(Exception):
+    '''等待push_corou_msg超时,抛进协程里'''
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'CorouTimeout: {}'.format(self.msg)
+
+
+class CorouSleep:
+    __slots__ = ('milli')
+    def __init__(self, milli):
+        self.milli = milli
+
+    def __await__(self):
+        yield self
+
+
+class CorouWait:
+    __slots__ = ('timeout', 'start', 'cancel')
+    def __init__(self, timeout=None, start=None, cancel=None):
+        self.timeout = timeout              # 毫秒,0表示不超时,None使用BaseThread的默认等待时间
+        self.start = start                  # 开始等待后调用start(cid),抛出的异常抛进协程里
+        self.cancel = cancel                # 等待结束(收到消息,超时,异常)时调用cancel(),清理start里登记的状态
+
+    def __await__(self):
+        msg = yield self
+        return msg
+
+
+class CorouItem:
+    '''BaseThread里一个协程的状态'''
+    __slots__ = ('gene', 'create_milli', 'timer', 'cancel', 'sleeping', 'started', 'seq')
+    def __init__(self, gene, create_milli):
+        self.gene = gene                    # 生成器或协程对象
+        self.create_milli = create_milli
+        self.timer = None                   # 超时或睡眠的TimerHandle
+        self.cancel = None                  # 正在等待的CorouWait.cancel
+        self.sleeping = False               # 在CorouSleep里,不接收消息
+        self.started = False
+        self.seq = 0                        # 每yield一次加1,过期的定时器不恢复协程
+
+    @property
+    def name(self):
+        return getattr(self.gene, '__qualname__', repr(self.gene))
+
+    def cancel_timer(self):
+        '''等待结束,取消定时器,调用CorouWait.cancel'''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.cancel is not None:
+            cancel = self.cancel
+            self.cancel = None
+            cancel()
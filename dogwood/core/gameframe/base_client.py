@@ -1,10 +1,8 @@
 # -*- coding: UTF-8 -*-
 
 from enum import Enum
-import copy
 
 from dogwood.core.logger import Logger
-from dogwood.core.network.sock_id import SockId
 
 class ClientDef(Enum):
     STATUS_EMPTY = 0        # 空状态
@@ -20,17 +18,26 @@ class ClientError(Exception):
         return 'ClientError: {}'.format(self.msg)
 
 class ClientMgr:
-    __slots__ = ('sid_dict', 'uid_dict', 'account_new_login_dict')
-    def __init__(self):
+    __slots__ = ('sid_dict', 'uid_dict', 'account_new_login_dict', 'negotiate_set', 'timer_wheel', 'tick_dict')
+    def __init__(self, timer_wheel=None):
+        '''timer_wheel: 所有客户端共用的时间轮(TimerWheel),BaseClient.add_timer_event使用'''
         self.sid_dict = {}                              # 以sock_id为key的字典
         self.uid_dict = {}                              # 以user_id为key的字典
         self.account_new_login_dict = {}                # 帐号在新的地方登陆的字典,以uid为Key,value是新登陆的client
+        self.negotiate_set = set()                      # 等待第一个BasePacket确定编码的sock_id
+        self.timer_wheel = timer_wheel
+        self.tick_dict = {}                             # 重载了run_timer的客户端,以sock_id为key,每帧调用.没有重载的不占用每帧的时间
     
-    def on_net_connect(self, sock_id):
+    def on_net_connect(self, sock_id, codec_name=None, negotiate=False):
+        '''codec_name: 回复时默认使用的编码. negotiate: 是否改用收到的第一个BasePacket的编码'''
         if not sock_id in self.sid_dict.keys():
             raise ClientError('on_net_connect error, sock_id not exist.{}'.format(sock_id))
             return
-        self.sid_dict[sock_id].on_net_connect()
+        client = self.sid_dict[sock_id]
+        client.set_codec(codec_name)
+        if negotiate:
+            self.negotiate_set.add(sock_id)
+        client.on_net_connect()
     
     def on_net_disconnect(self, sock_id):
         if not sock_id in self.sid_dict.keys():
@@ -43,6 +50,10 @@ class ClientMgr:
             raise ClientError('push_net_msg error, sock_id not exist.{}'.format(sock_id))
             return
         client = self.sid_dict[sock_id]
+        if sock_id in self.negotiate_set:
+            if msg.codec is not None:                           # StructPacket没有编码,等下一个包
+                self.negotiate_set.discard(sock_id)
+                client.set_codec(msg.codec)
         client.on_net(msg)
         
     def push_module_msg(self, user_id, msg):
@@ -62,6 +73,8 @@ class ClientMgr:
         return False
     
     def on_client_quit(self, sock_id, user_id):
+        self.negotiate_set.discard(sock_id)
+        self.tick_dict.pop(sock_id, None)
         if sock_id in self.sid_dict.keys():
             del self.sid_dict[sock_id]
         else:
@@ -81,6 +94,8 @@ class ClientMgr:
     
     def add_sid_client(self, sock_id, client):
         self.sid_dict[sock_id] = client
+        if type(client).run_timer is not BaseClient.run_timer:
+            self.tick_dict[sock_id] = client
         
     def user_id_exist(self, user_id):
         return user_id in self.uid_dict.keys()
@@ -92,17 +107,18 @@ class ClientMgr:
         return len(self.sid_dict)
         
     def run_timer(self, now_milli):
-        for clt in self.sid_dict.values():
+        '''只调用重载了run_timer的客户端,定时逻辑建议用BaseClient.add_timer_event'''
+        for clt in list(self.tick_dict.values()):               # run_timer里可能下线
             clt.run_timer(now_milli)
                 
     
 class BaseClient:
-    __slots__ = ('_mgr', '_sock_id', '_user_id', '_status')
+    __slots__ = ('_mgr', '_sock_id', '_user_id', '_status', '_codec', '_timer_dict')
     def __init__(self, mgr, sock_id):
         '''
     paras:
     mgr: ClientMgr对象
-    sock_id: SockId 类型,唯一网络表示
+    sock_id: 整数,唯一网络表示,见sock_id.py
             子 类重载：
             需要调用：super().__init__(mgr, sock_id)
         '''
@@ -111,15 +127,21 @@ class BaseClient:
             return
         
         self._mgr = mgr
-        self._sock_id = copy.deepcopy(sock_id)
+        self._sock_id = sock_id
         self._user_id = None
         self._status = ClientDef.STATUS_EMPTY.value
+        self._codec = None              # 回复BasePacket时使用的编码,None为json
+        self._timer_dict = None         # add_timer_event加的timer,key event_name, value TimerHandle.没有timer的客户端为None
         
         self._mgr.add_sid_client(self._sock_id, self)
         
     def quit(self):       
         ''''子类重载的时候,要注意调用super().quit(),否则内存泄漏'''                             
         self._status = ClientDef.STATUS_EMPTY.value
+        if self._timer_dict is not None:
+            for handle in self._timer_dict.values():
+                handle.cancel()
+            self._timer_dict = None
         sock_id = self._sock_id
         user_id = self._user_id
         self._mgr.on_client_quit(sock_id, user_id)
@@ -138,6 +160,34 @@ class BaseClient:
     @property
     def user_id(self):
         return self._user_id
+    
+    @property
+    def codec(self):
+        '''打包时使用: pack.pack(self.codec)'''
+        return self._codec
+    
+    def set_codec(self, codec_name):
+        self._codec = codec_name
+        
+    def add_timer_event(self, event_name, ticker, func, exe_num=0):
+        '''和TimerGroup.add_timer_event一样,timer放在ClientMgr的时间轮里,到期才执行,quit时自动取消.返回是否成功'''
+        if self._timer_dict is None:
+            self._timer_dict = {}
+        old = self._timer_dict.get(event_name, None)
+        if old is not None and old.active:
+            Logger().error('client event_name exist. {}.{}'.format(self._sock_id, event_name))
+            return False
+        handle = self._mgr.timer_wheel.add_timer(ticker, func, exe_num)
+        handle.name = event_name
+        self._timer_dict[event_name] = handle
+        return True
+    
+    def remove_timer_event(self, event_name):
+        if self._timer_dict is None:
+            return
+        handle = self._timer_dict.pop(event_name, None)
+        if handle is not None:
+            handle.cancel()
         
     def on_net_connect(self):
         self._status = ClientDef.STATUS_NET_CONNECT.value
@@ -163,7 +213,7 @@ class BaseClient:
         pass
     
     def run_timer(self, now_milli):
-        '''子类需重写'''
+        '''子类选择重写,重写了的每帧调用.只是定时执行的逻辑用add_timer_event,不用每帧调用'''
         pass
 
         
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 from dogwood.core.logger import Logger
 from dogwood.core.base_thread import BaseThread
+from dogwood.core.network.sock_id import net_sock_id, sock_net_id
 from dogwood.core.network.net_notify import NetNotify
 from dogwood.core.network.net_def import NeTDef
 from dogwood.core.gameframe.net_packet_split import NetPacketSplit, NetSplitMgr, NetSplitError
@@ -20,13 +21,19 @@ class BaseGameMain(BaseThread, metaclass=Singleton):
         super().__init__(event)
         
         self._mysql_monitor = MySqlMonitor(self)         # mysql操作器
-        self._client_mgr = ClientMgr()                   # 管理所有客户端连接
+        self._client_mgr = ClientMgr(self.timer_wheel)   # 管理所有客户端连接,客户端的timer放在本线程的时间轮里
         self._net_split_mgr = NetSplitMgr()              # 网络粘包处理的管理器
         self._net_dict = {}                              # 网络监听进程字典
+        self._timer_group.add_timer_event('net_batch_stat', 60000, self.log_batch_stat)
         
     def add_net(self, net_process):
         self._net_dict[net_process.net_id] = net_process
         
+    def add_net_group(self, listen_group):
+        '''ListenGroup里的每个进程有自己的net_id,都加进_net_dict,发送和关闭时按sock_id高位的net_id找到对应进程'''
+        for net_process in listen_group.procs:
+            self.add_net(net_process)
+        
     def thread_init(self):              # 重载
         super().thread_init()
         self.create_db_monitor()
@@ -49,25 +56,27 @@ class BaseGameMain(BaseThread, metaclass=Singleton):
         
     def fill_msg_queue(self):                               # 重载父类   
         for net_proc in self._net_dict.values(): 
-            while not net_proc.pull_msg_empty():
-                msg_obj = net_proc.pull_msg()
+            for msg_obj in net_proc.pull_msgs():
                 self._msg_queue.put(msg_obj)
         
     def process_msg(self, msg_obj):                     # 重载父类
         '''子类重载时,记得调用super().process_msg'''
         if type(msg_obj) is NetNotify:                      # 只处理网络消息
             if msg_obj.ope == NeTDef.CONNECT.value:             #新连接连上
-                try:
-                    self.create_packet_split(msg_obj.sid)           # 创建粘包处理器
-                except NetSplitError as e:
-                    Logger().warning(e)
+                if not self.split_in_net(msg_obj.sid):
+                    try:
+                        self.create_packet_split(msg_obj.sid)           # 创建粘包处理器
+                    except NetSplitError as e:
+                        Logger().warning(e)
                 try:
                     client = self.create_client(msg_obj.sid)
-                    self._client_mgr.on_net_connect(msg_obj.sid)
+                    option = self._net_dict[sock_net_id(msg_obj.sid)].option
+                    self._client_mgr.on_net_connect(msg_obj.sid, option.packet_codec, option.packet_codec_negotiate)
                 except ClientError as e:
                     Logger().warning(e)
             elif msg_obj.ope == NeTDef.DISCONNECT.value:        # 连接关闭
-                self._net_split_mgr.remove_split(msg_obj.sid)     # 关闭粘包处理
+                if not self.split_in_net(msg_obj.sid):
+                    self._net_split_mgr.remove_split(msg_obj.sid)     # 关闭粘包处理
                 try:
                     self._client_mgr.on_net_disconnect(msg_obj.sid)     # 关闭客户端
                 except ClientError as e:
@@ -85,12 +94,24 @@ class BaseGameMain(BaseThread, metaclass=Singleton):
                             Logger().warning(e)
                 except PacketError as e:
                     Logger().warning(e)
+            elif msg_obj.ope == NeTDef.RECV_PACKETS.value:      # 网络进程里已经做完粘包处理的消息
+                for pack in msg_obj.buf:
+                    try:
+                        self._client_mgr.push_net_msg(msg_obj.sid, pack)
+                    except ClientError as e:
+                        Logger().warning(e)
             elif msg_obj.ope == NeTDef.CLIENT_CONNECT_FAIL.value:           # 作为客户端,连远程服务器失败
                 self.on_client_connect_fail(msg_obj.sid)
                 
+    def split_in_net(self, sock_id):
+        '''该连接所在的网络进程是否已经做了粘包处理'''
+        net_proc = self._net_dict.get(sock_net_id(sock_id), None)
+        return net_proc is not None and net_proc.option.split_in_net
+                
     def create_packet_split(self, sock_id):
         '''子类要重载，返回自己的粘包处理类'''
-        split = NetPacketSplit(sock_id)
+        option = self._net_dict[sock_net_id(sock_id)].option
+        split = NetPacketSplit(sock_id, option.max_message_len, option.lazy_packet)
         self._net_split_mgr.add_split(sock_id, split)
     
     def create_client(self, sock_id):
@@ -104,6 +125,27 @@ class BaseGameMain(BaseThread, metaclass=Singleton):
         self._mysql_monitor.run_timer(now_milli)
         self._client_mgr.run_timer(now_milli)
         
+    def wait_objects(self):
+        '''重载父类,网络进程和数据库进程有消息时唤醒主循环'''
+        obj_list = super().wait_objects()
+        for net_proc in self._net_dict.values():
+            obj_list.extend(net_proc.out_wait_list())
+        obj_list.extend(self._mysql_monitor.wait_objects())
+        return obj_list
+        
+    def flush_frame(self):
+        '''重载父类,一帧内发给网络进程和数据库进程的消息在这里一次发出'''
+        super().flush_frame()
+        for net_proc in self._net_dict.values():
+            net_proc.flush_msg()
+        self._mysql_monitor.flush_notify()
+        
+    def log_batch_stat(self):
+        for net_proc in self._net_dict.values():
+            stat = net_proc.in_batch_stat()
+            Logger().info('net:{}.in batch.{}'.format(net_proc.net_id, stat))
+            stat.reset()
+        
     def on_client_connect_fail(self, sock_id):
         '''子类选择重载,添加自己的连远程服务器失败处理,如果不存在连接远程服务器,则不需要'''
         pass
@@ -113,11 +155,26 @@ class BaseGameMain(BaseThread, metaclass=Singleton):
             ntif = NetNotify(sock_id, NeTDef.SERVER_CLOSE.value)
         else: 
             ntif = NetNotify(sock_id, NeTDef.CLIENT_CLOSE.value)
-        self._net_dict[sock_id.net_id].push_msg(ntif)
+        self._net_dict[sock_net_id(sock_id)].push_msg(ntif)
         
     def send_socket_msg(self, sock_id, buffer):
         ntif = NetNotify(sock_id, NeTDef.SEND.value, buffer)
-        self._net_dict[sock_id.net_id].push_msg(ntif)
+        self._net_dict[sock_net_id(sock_id)].push_msg(ntif)
+        
+    def broadcast(self, sock_ids, buffer):
+        '''同一份数据发给多个连接,如房间和聊天广播.buffer只打包一次,
+        按网络进程分组,每个网络进程只发一个消息,由网络进程放进各连接的发送缓冲区'''
+        net_sid_dict = {}                       # key net_id, value sock_id列表
+        for sock_id in sock_ids:
+            net_id = sock_net_id(sock_id)
+            sid_list = net_sid_dict.get(net_id, None)
+            if sid_list is None:
+                sid_list = []
+                net_sid_dict[net_id] = sid_list
+            sid_list.append(sock_id)
+        for net_id, sid_list in net_sid_dict.items():
+            ntif = NetNotify(net_sock_id(net_id), NeTDef.BROADCAST.value, (sid_list, buffer))
+            self._net_dict[net_id].push_msg(ntif)
         
     @property
     def mysql_monitor(self):
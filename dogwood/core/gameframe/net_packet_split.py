@@ -1,10 +1,7 @@
 # -*- coding: UTF-8 -*-
 
-import copy
-
 from dogwood.core.logger import Logger
-from dogwood.core.network.sock_id import SockId
-from dogwood.core.base_packet import BasePacket, PacketSplit
+from dogwood.core.base_packet import BasePacket, PacketSplit, PacketDef
 
 class NetSplitError(Exception):
     def __init__(self, msg):
@@ -46,15 +43,19 @@ class NetSplitMgr:
     
 class NetPacketSplit:
     __slots__ = ('sock_id', 'pack_split')
-    def __init__(self, sock_id):
-        self.sock_id = copy.deepcopy(sock_id)
-        self.pack_split = PacketSplit()
+    def __init__(self, sock_id, max_message_len=None, lazy=False):
+        self.sock_id = sock_id
+        self.pack_split = PacketSplit(max_message_len, lazy)
         
     def deal_with_bytes(self, bys):
+        '''bys可能比粘包缓冲区大(一次读取合并的多段数据,websocket的多个消息),分段放进去'''
         ret_list = []
-        if self.pack_split.push_data(bys):
+        view = memoryview(bys)
+        for pos in range(0, len(view), PacketDef.SPLIT_PUSH_SIZE.value):
+            if not self.pack_split.push_data(view[pos:pos + PacketDef.SPLIT_PUSH_SIZE.value]):
+                break
             try:
-                ret_list = self.pack_split.split()
+                ret_list.extend(self.pack_split.split())
             except Exception as e:
                 raise e                                         #留给调用者处理
         return ret_list
@@ -4,14 +4,39 @@ import queue
 from multiprocessing import Event as PeEvent
 
 from dogwood.core.mysql.mysql_process import MySqlProcess
+from dogwood.core.coroutine import CorouWait
+from dogwood.core.logger import Logger
+
+class MySqlGatherError(Exception):
+    '''gather的fail_fast时第一个失败的请求,或者请求的alias不存在'''
+    def __init__(self, msg, notify=None):
+        self.msg = msg
+        self.notify = notify                # 失败的MySqlNotify
+        
+    def __str__(self):
+        return 'MySqlGatherError: {}'.format(self.msg)
+    
+    
+class MySqlGather:
+    '''一次gather的状态,结果按请求的顺序放在result_list里'''
+    __slots__ = ('cid', 'gid', 'result_list', 'remain', 'fail_fast')
+    def __init__(self, gid, num, fail_fast):
+        self.cid = None
+        self.gid = gid                      # gather序号,协程超时后又发起gather时,区分上一次迟到的回复
+        self.result_list = [None] * num
+        self.remain = num
+        self.fail_fast = fail_fast
+        
 
 class MySqlMonitor:
-    __slots__ = ('_game_main_thread', '_proc_dict', '_index_dict', '_result_queue')
+    __slots__ = ('_game_main_thread', '_proc_dict', '_index_dict', '_result_queue', '_gather_dict', '_gather_tick')
     def __init__(self, game_main_thread):
         self._game_main_thread = game_main_thread   # 游戏主线程,用于调用协程
         self._proc_dict = {}                        #key为alias,value是mysql进程数组
         self._index_dict = {}                       # 执行的索引数组
         self._result_queue = queue.Queue()          # 返回结果的队列
+        self._gather_dict = {}                      # 等待中的gather,key为协程cid, value是MySqlGather
+        self._gather_tick = 0
     
     def add_mysql_process(self, alias, num, mysql_host, mysql_port, mysql_user, mysql_pwd, mysql_db, charset='utf8mb4'):
         proc_list = []
@@ -27,8 +52,10 @@ class MySqlMonitor:
         if alias in self._proc_dict.keys():
             proc_list = self._proc_dict[alias]
             for proc in proc_list:
+                proc.flush_msg()
                 proc.quit()
                 proc.join()
+                proc.close_queues()
             del self._proc_dict[alias]
         if alias in self._index_dict.keys():
             del self._index_dict[alias]
@@ -36,8 +63,10 @@ class MySqlMonitor:
     def close_all(self):
         for k, proc_list in self._proc_dict.items():
             for proc in proc_list:
+                proc.flush_msg()
                 proc.quit()
                 proc.join()
+                proc.close_queues()
         self._proc_dict.clear()
         self._index_dict.clear()
         
@@ -50,16 +79,79 @@ class MySqlMonitor:
             proc.push_msg(notify)
             self._index_dict[notify.alias] += 1
             
+    def request(self, notify, timeout=None):
+        '''协程里等待数据库结果: ret = await mysql_monitor.request(notify),生成器里用yield.
+        notify.call_id由协程的cid填写,timeout为None时使用BaseThread的默认等待时间'''
+        def start(cid):
+            notify.call_id = cid
+            self.push_notify(notify)
+        return CorouWait(timeout, start)
+    
+    def gather(self, notify_list, timeout=None, fail_fast=False):
+        '''协程里同时发出多个数据库请求,都回复后一起返回: ret_list = await mysql_monitor.gather([notify1, notify2]).
+        请求按push_notify轮流分给alias的各个数据库进程,在同一帧里发出,耗时是最慢的一个而不是所有的和.
+        返回的列表和notify_list顺序一致,由调用者检查success.fail_fast为True时第一个success为False的回复
+        立即抛出MySqlGatherError(其余的回复丢弃),注意SELECT_ONE没有记录时success也为False'''
+        self._gather_tick += 1
+        gather = MySqlGather(self._gather_tick, len(notify_list), fail_fast)
+        def start(cid):
+            for notify in notify_list:
+                if notify.alias not in self._proc_dict.keys():
+                    raise MySqlGatherError('alias not exist.{}'.format(notify.alias), notify)
+            if len(notify_list) == 0:
+                self._game_main_thread.resume_corou(cid, [])
+                return
+            gather.cid = cid
+            self._gather_dict[cid] = gather
+            for index, notify in enumerate(notify_list):
+                notify.call_id = (cid, gather.gid, index)       # 回复时按序号放到result_list里
+                self.push_notify(notify)
+        def cancel():
+            if gather.cid is not None and self._gather_dict.get(gather.cid, None) is gather:      # 超时等,不再等剩下的回复
+                del self._gather_dict[gather.cid]
+        return CorouWait(timeout, start, cancel)
+            
+    def flush_notify(self):
+        '''一帧内push_notify的请求一次发给各数据库进程'''
+        for k, proc_list in self._proc_dict.items():
+            for proc in proc_list:
+                proc.flush_msg()
+            
+    def wait_objects(self):
+        '''数据库进程有返回结果时可读的对象列表'''
+        obj_list = []
+        for k, proc_list in self._proc_dict.items():
+            for proc in proc_list:
+                obj_list.extend(proc.out_wait_list())
+        return obj_list
+            
     def run_timer(self, now_milli):
         for k, proc_list in self._proc_dict.items():
             for proc in proc_list:
-                while not proc.pull_msg_empty():
-                    msg_obj = proc.pull_msg()
+                for msg_obj in proc.pull_msgs():
                     self._result_queue.put(msg_obj)
         while not self._result_queue.empty():
             msg_obj = self._result_queue.get_nowait()
             self.process_result(msg_obj)
 
     def process_result(self, notify):
-        self._game_main_thread.push_corou_msg(notify.call_id, notify)
+        if type(notify.call_id) is tuple:
+            self.__gather_result(notify)
+            return
+        self._game_main_thread.resume_corou(notify.call_id, notify)         # 在主线程的run_timer里,本帧内恢复协程
+        
+    def __gather_result(self, notify):
+        cid, gid, index = notify.call_id
+        gather = self._gather_dict.get(cid, None)
+        if gather is None or gather.gid != gid:     # 已经超时或者fail_fast失败了
+            Logger().warning('mysql gather result late.{}.{}.{}'.format(cid, gid, index))
+            return
+        gather.result_list[index] = notify
+        gather.remain -= 1
+        if gather.fail_fast and not notify.success:
+            del self._gather_dict[cid]
+            self._game_main_thread.throw_corou(cid, MySqlGatherError('request fail.{}.{}'.format(cid, index), notify))
+        elif gather.remain == 0:
+            del self._gather_dict[cid]
+            self._game_main_thread.resume_corou(cid, gather.result_list)
         
\ No newline at end of file
@@ -39,10 +39,7 @@ class MySqlProcess(BaseProcess):
             if (now_milli - self.__last_reconn) > 60000:         # 每60秒重连一次
                 self.mysql_op.open_mysql()
                 self.__last_reconn = now_milli
-        notify_list = []
-        while not self._in_queue.empty():
-            nf = self._in_queue.get_nowait()
-            notify_list.append(nf)
+        notify_list = self._pull_in_msgs()
         for nf in notify_list:
             if type(nf) is str and nf.lower() == Helper.quit_signal():
                 self._run_flag = False
@@ -71,16 +68,13 @@ class MySqlProcess(BaseProcess):
                 sql_list = nf.sqls
                 nf.success = self.mysql_op.execute_multi_sql(sql_list)
             nf.status = MNTDef.RET.value
-            self._out_queue.put(nf)
+            self._post_msg(nf)
         
         self.__time_group.run_timer(Helper.get_program_milli_second())
             
     def keep_alive(self):
         self.mysql_op.keep_alive()
         
-    def quit(self):
-        self._in_queue.put(Helper.quit_signal())
-                
     @property
     def alias(self):
         return self.__alias
@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+
+from dogwood.core.logger import Logger
+from dogwood.core.network.sock_id import net_sock_id
+from dogwood.core.network.net_notify import NetNotify
+from dogwood.core.network.net_def import NeTDef
+from dogwood.core.network.aio_net_process import AioNetProtocol, AioNetProcess
+
+class AioClientConnect(AioNetProcess):
+    '''asyncio实现的ClientConnect,构造参数和发给逻辑线程的消息都和ClientConnect一样,可以直接替换'''
+    __slots__ = ('__server_host', '__server_port', '__connect_tasks')
+    def __init__(self, log_name, event, net_id, server_host, server_port, option=None):
+        super().__init__(log_name, event, net_id, option)
+        self.__server_host = server_host
+        self.__server_port = server_port
+        self.__connect_tasks = set()            # 正在连接的task,退出时取消
+
+    def on_notify(self, nf):
+        if nf.ope == NeTDef.CLIENT_CREATE.value:
+            task = self._loop.create_task(self.__connect())
+            self.__connect_tasks.add(task)
+            task.add_done_callback(self.__connect_tasks.discard)
+
+    async def __connect(self):
+        '''连接成功后由AioNetProtocol.connection_made发CONNECT,失败或超时发CLIENT_CONNECT_FAIL'''
+        coro = self._loop.create_connection(lambda: AioNetProtocol(self), self.__server_host, self.__server_port)
+        try:
+            await asyncio.wait_for(coro, self._option.connect_timeout / 1000)
+        except (OSError, asyncio.TimeoutError) as e:
+            Logger().info('{} aio connect fail.{}:{}.{}'.format(self._net_id, self.__server_host, self.__server_port, repr(e)))
+            self.post_net_msg(NetNotify(net_sock_id(self._net_id), NeTDef.CLIENT_CONNECT_FAIL.value))
+
+    def close_all(self):
+        for task in list(self.__connect_tasks):
+            task.cancel()
+        super().close_all()
+
+    @property
+    def is_server(self):
+        return False
+
+    @property
+    def far_addr(self):
+        return (self.__server_host, self.__server_port)
@@ -0,0 +1,262 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+
+try:
+    import uvloop                       # 可选,安装了就使用
+except ImportError:
+    uvloop = None
+
+from dogwood.core.helper import Helper
+from dogwood.core.base_process import BaseProcess
+from dogwood.core.logger import Logger
+from dogwood.core.network.sock_id import SockIdAlloc, sock_net_id, sock_id_str
+from dogwood.core.network.net_notify import NetNotify
+from dogwood.core.network.net_def import NeTDef
+from dogwood.core.network.net_option import NetOption
+from dogwood.core.network.idle_reaper import IdleReaper
+from dogwood.core.base_packet import PacketDef, PacketSplit, PacketError
+
+class AioNetProtocol(asyncio.Protocol):
+    '''一个连接,收到的数据和连接状态通过所属的AioNetProcess发给逻辑线程'''
+    __slots__ = ('__net_proc', '__sid', '__transport', '__split', 'out_list')
+    def __init__(self, net_proc):
+        self.__net_proc = net_proc
+        self.__sid = None
+        self.__transport = None
+        self.__split = PacketSplit(net_proc.option.max_message_len, net_proc.option.lazy_packet) if net_proc.option.split_in_net else None
+        self.out_list = []                  # 本批消息里要发送的数据,处理完一批消息后用writelines一次写入
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        if self.__net_proc.is_server:
+            self.__sid = self.__net_proc.sid_alloc.alloc(transport.get_extra_info('peername'))
+        else:
+            self.__sid = self.__net_proc.sid_alloc.alloc(transport.get_extra_info('sockname'))
+        self.__net_proc.on_connection_made(self)
+
+    def data_received(self, data):
+        reaper = self.__net_proc.reaper
+        if reaper is not None:
+            reaper.touch(self)
+        if self.__split is None:
+            self.__net_proc.post_net_msg(NetNotify(self.__sid, NeTDef.RECV.value, data))
+            return
+        view = memoryview(data)             # transport一次给的数据可能比粘包缓冲区大,分段放进去
+        pack_list = []
+        for pos in range(0, len(view), PacketDef.SPLIT_PUSH_SIZE.value):
+            if not self.__split.push_data(view[pos:pos + PacketDef.SPLIT_PUSH_SIZE.value]):
+                self.__transport.abort()
+                return
+            try:
+                pack_list.extend(self.__split.split())
+            except PacketError as e:
+                Logger().warning('{}.{}'.format(self.__net_proc.sid_alloc.desc(self.__sid), e))
+        if len(pack_list) > 0:
+            self.__net_proc.post_net_msg(NetNotify(self.__sid, NeTDef.RECV_PACKETS.value, pack_list))
+
+    def pause_writing(self):
+        '''发送缓冲区超过option.send_high_water,慢客户端直接断开,不等待'''
+        Logger().warning('aio send buffer over high water, close.{}.{}'.format(self.__net_proc.sid_alloc.desc(self.__sid), self.__transport.get_write_buffer_size()))
+        self.__transport.abort()
+
+    def connection_lost(self, exc):
+        self.__net_proc.on_connection_lost(self)
+
+    def flush_out(self):
+        if len(self.out_list) == 0:
+            return
+        self.__transport.writelines(self.out_list)
+        self.out_list = []
+
+    @property
+    def sid(self):
+        return self.__sid
+
+    @property
+    def transport(self):
+        return self.__transport
+
+
+class AioNetProcess(BaseProcess):
+    '''asyncio事件循环的网络进程基类,和selectors实现的网络进程发给逻辑线程的NetNotify完全一样.
+    安装了uvloop时使用uvloop.写缓冲和发送由transport完成,发送缓冲区超过option.send_high_water时断开'''
+    __slots__ = ('_net_id', '__sid_alloc', '_option', '_loop', '_sid_proto_dict', '__dirty_set', '__flush_pending', '__quitting', '__reaper')
+    def __init__(self, log_name, event, net_id, option=None):
+        if option is None:
+            option = NetOption()
+        super().__init__(log_name, event, option.shm_queue_size)
+        self._net_id = net_id
+        self.__sid_alloc = SockIdAlloc(net_id)  # 分配sock_id,记录连接地址
+        self._option = option
+        self._loop = None                       # 在子进程里创建
+        self._sid_proto_dict = {}               # key sock_id, value AioNetProtocol
+        self.__dirty_set = set()                # 本批消息里有数据要发送的连接
+        self.__flush_pending = False            # 是否已经安排了本轮事件循环的出队列发送
+        self.__quitting = False
+        self.__reaper = None                    # IdleReaper,设置了option.idle_timeout或heartbeat_interval时在process_init里创建
+
+    def process_init(self):
+        if uvloop is not None:
+            self._loop = uvloop.new_event_loop()
+        else:
+            self._loop = asyncio.SelectorEventLoop()
+        asyncio.set_event_loop(self._loop)
+        self.__register_wakeup()
+        if self._option.idle_timeout > 0 or self._option.heartbeat_interval > 0:
+            self.__reaper = IdleReaper(self._option.idle_timeout, self._option.heartbeat_interval, Helper.get_program_milli_second())
+            self._loop.call_later(NeTDef.IDLE_CHECK_TICK.value / 1000, self.__check_idle)
+        self.aio_init()
+
+    def aio_init(self):
+        '''子类重载,在事件循环里创建监听等'''
+        pass
+
+    def _run_loop(self):
+        '''重载父类,运行事件循环,直到收到退出信号'''
+        self._loop.run_forever()
+
+    def process_end(self):
+        self._loop.run_until_complete(asyncio.sleep(0))        # 让关闭的连接和取消的task执行完回调
+        self._loop.close()
+
+    def __register_wakeup(self):
+        '''入队列的可读对象注册进事件循环,有消息时立即处理.
+        不能注册时(windows下multiprocessing.Queue的管道)定时轮询'''
+        try:
+            for obj in self._in_wait_list():
+                self._loop.add_reader(obj, self.__on_in_msgs)
+        except (ValueError, OSError, NotImplementedError):
+            self.__poll_in_msgs()
+
+    def __poll_in_msgs(self):
+        self.__on_in_msgs()
+        if not self.__quitting:
+            self._loop.call_later(NeTDef.SELECT_TIME_OUT.value, self.__poll_in_msgs)
+
+    def __on_in_msgs(self):
+        notify_list = self._pull_in_msgs()
+        for nf in notify_list:
+            if type(nf) is str and nf.lower() == Helper.quit_signal():
+                self.__quit()
+                return
+            sid = nf.sid
+            if sock_net_id(sid) != self._net_id:
+                Logger().warning('aio net.net_id error.{}.{}'.format(self._net_id, sock_id_str(sid)))
+                continue
+            if nf.ope == NeTDef.SEND.value:
+                self.__send_msg(sid, nf.buf)
+            elif nf.ope == NeTDef.BROADCAST.value:
+                self.__broadcast(nf.buf)
+            elif nf.ope == NeTDef.SERVER_CLOSE.value or nf.ope == NeTDef.CLIENT_CLOSE.value:
+                self.__close_conn(sid)
+            else:
+                self.on_notify(nf)
+        for proto in self.__dirty_set:
+            proto.flush_out()
+        self.__dirty_set.clear()
+
+    def on_notify(self, nf):
+        '''子类重载,处理SEND和关闭以外的消息,如CLIENT_CREATE'''
+        pass
+
+    def __send_msg(self, sock_id, buf):
+        proto = self._sid_proto_dict.get(sock_id, None)
+        if proto is None:
+            Logger().warning('aio net send_msg. sid not exist. {}'.format(self.__sid_alloc.desc(sock_id)))
+            return
+        proto.out_list.append(buf)
+        self.__dirty_set.add(proto)
+
+    def __broadcast(self, broadcast_buf):
+        sid_list, buf = broadcast_buf
+        for sid in sid_list:
+            proto = self._sid_proto_dict.get(sid, None)
+            if proto is None:                       # 逻辑线程还没收到DISCONNECT的连接,跳过
+                continue
+            proto.out_list.append(buf)
+            self.__dirty_set.add(proto)
+            
+    def __close_conn(self, sock_id):
+        proto = self._sid_proto_dict.get(sock_id, None)
+        if proto is None:
+            Logger().warning('aio net close.sid not exist. {}'.format(self.__sid_alloc.desc(sock_id)))
+            return
+        proto.flush_out()                   # 先写入本批里的数据,transport.close会发完缓冲区再关闭
+        self.__dirty_set.discard(proto)
+        proto.transport.close()
+
+    def __check_idle(self):
+        '''定时检查,空闲超时的连接断开,由connection_lost向逻辑线程发DISCONNECT.空闲超过心跳间隔的连接发心跳'''
+        if self.__quitting:
+            return
+        expired_list, heartbeat_list = self.__reaper.check(Helper.get_program_milli_second())
+        for proto in expired_list:
+            Logger().info('aio idle timeout, close.{}'.format(self.__sid_alloc.desc(proto.sid)))
+            proto.transport.abort()
+        if len(self._option.heartbeat_data) > 0:
+            for proto in heartbeat_list:
+                proto.transport.write(self._option.heartbeat_data)
+        self._loop.call_later(NeTDef.IDLE_CHECK_TICK.value / 1000, self.__check_idle)
+    
+    def __quit(self):
+        self.__quitting = True
+        self.close_all()
+        self._loop.stop()
+
+    def close_all(self):
+        '''退出时调用,子类重载时需调用super().close_all()'''
+        for proto in list(self._sid_proto_dict.values()):
+            proto.transport.abort()
+
+    ####################################################################
+    # 以下由AioNetProtocol调用
+    ####################################################################
+    def post_net_msg(self, nf):
+        '''先缓存,本轮事件循环的回调都执行完后一次发给逻辑线程'''
+        self._post_msg(nf)
+        if not self.__flush_pending:
+            self.__flush_pending = True
+            self._loop.call_soon(self.__flush_out)
+
+    def __flush_out(self):
+        self.__flush_pending = False
+        self._flush_out()
+
+    def on_connection_made(self, proto):
+        self._sid_proto_dict[proto.sid] = proto
+        proto.transport.set_write_buffer_limits(high=self._option.send_high_water)
+        if self.__reaper is not None:
+            self.__reaper.add(proto)
+        self.post_net_msg(NetNotify(proto.sid, NeTDef.CONNECT.value, self.__sid_alloc.addr(proto.sid)))
+
+    def on_connection_lost(self, proto):
+        if self._sid_proto_dict.pop(proto.sid, None) is None:
+            return
+        self.__dirty_set.discard(proto)
+        if self.__reaper is not None:
+            self.__reaper.remove(proto)
+        self.__sid_alloc.free(proto.sid)
+        if not self.__quitting:
+            self.post_net_msg(NetNotify(proto.sid, NeTDef.DISCONNECT.value))
+
+    @property
+    def net_id(self):
+        return self._net_id
+
+    @property
+    def sid_alloc(self):
+        return self.__sid_alloc
+
+    @property
+    def option(self):
+        return self._option
+    
+    @property
+    def reaper(self):
+        return self.__reaper
+
+    @property
+    def is_server(self):
+        '''子类重载'''
+        return True
@@ -0,0 +1,27 @@
+# -*- coding: UTF-8 -*-
+
+from dogwood.core.logger import Logger
+from dogwood.core.network.net_def import NeTDef
+from dogwood.core.network.aio_net_process import AioNetProtocol, AioNetProcess
+
+class AioServerListen(AioNetProcess):
+    '''asyncio实现的ServerListen,构造参数和发给逻辑线程的消息都和ServerListen一样,可以直接替换'''
+    __slots__ = ('__port', '__server')
+    def __init__(self, log_name, event, net_id, port, option=None):
+        super().__init__(log_name, event, net_id, option)
+        self.__port = port
+        self.__server = None
+
+    def aio_init(self):
+        coro = self._loop.create_server(lambda: AioNetProtocol(self), '0.0.0.0', self.__port,
+                                        backlog=NeTDef.LISTEN_NUM.value, reuse_port=self._option.reuse_port or None)
+        self.__server = self._loop.run_until_complete(coro)
+        Logger().info('aio %s 监听启动. 端口:%d' % (self._log_name, self.__port))
+
+    def close_all(self):
+        self.__server.close()
+        super().close_all()
+
+    @property
+    def port(self):
+        return self.__port
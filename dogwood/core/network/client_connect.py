@@ -1,44 +1,78 @@
 # -*- coding: UTF-8 -*-
 
 import socket, selectors
+import errno, os
+from collections import deque
 import platform
 
 from dogwood.core.helper import Helper
 from dogwood.core.base_process import BaseProcess
 from dogwood.core.logger import LogInit, Logger
-from dogwood.core.network.sock_id import SockId
+from dogwood.core.network.sock_id import SockIdAlloc, net_sock_id, sock_net_id, sock_id_str
 from dogwood.core.network.net_notify import NetNotify
 from dogwood.core.network.net_def import NeTDef
-from dogwood.core.base_packet import PacketDef
+from dogwood.core.network.net_option import NetOption
+from dogwood.core.network.send_buffer import SendBuffer
+from dogwood.core.network.idle_reaper import IdleReaper
+from dogwood.core.base_packet import PacketDef, PacketSplit, PacketError
+
+_CONNECTING_ERRNO = (0, errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))     # 非阻塞connect_ex的正常返回值
 
 class ClientConnect(BaseProcess):
-    __slots__ = ('__net_id', '__server_host', '__server_port', '__selector', '__sock_sid_dict', '__sid_sock_dict')
-    def __init__(self, log_name, event, net_id, server_host, server_port):
-        super().__init__(log_name, event)
+    __slots__ = ('__net_id', '__sid_alloc', '__server_host', '__server_port', '__selector', '__select_time', '__option', '__sock_sid_dict', '__sid_sock_dict', '__split_dict', '__send_buf_dict', '__dirty_set', '__connecting_dict', '__connect_deque', '__recv_view', '__reaper')
+    def __init__(self, log_name, event, net_id, server_host, server_port, option=None):
+        if option is None:
+            option = NetOption()
+        super().__init__(log_name, event, option.shm_queue_size)
         self.__net_id = net_id
+        self.__sid_alloc = SockIdAlloc(net_id)                         # 分配sock_id,记录连接地址
         self.__server_host = server_host
         self.__server_port = server_port
+        self.__option = option
         self.__selector = selectors.DefaultSelector()
+        self.__select_time = NeTDef.SELECT_TIME_OUT.value
         self.__sock_sid_dict = {}
         self.__sid_sock_dict = {}
+        self.__split_dict = {}                          # key sock, value PacketSplit. 只在option.split_in_net时使用
+        self.__send_buf_dict = {}                       # key sock, value SendBuffer
+        self.__dirty_set = set()                        # 本帧有新数据要发送的sock
+        self.__connecting_dict = {}                     # 正在连接的sock, key sock, value 超时时间
+        self.__connect_deque = deque()                  # (超时时间, sock),超时时间相同,按连接顺序排列
+        self.__recv_view = None                         # recv_into用的缓冲区,在process_init里创建
+        self.__reaper = None                            # IdleReaper,设置了option.idle_timeout或heartbeat_interval时在process_init里创建
         
     def process_init(self):
-        self.__create_selector_socket()
+        self.__create_recv_view()
+        if self.__option.idle_timeout > 0 or self.__option.heartbeat_interval > 0:
+            self.__reaper = IdleReaper(self.__option.idle_timeout, self.__option.heartbeat_interval, Helper.get_program_milli_second())
+        if self._register_wakeup(self.__selector):            # 入队列有消息时select会立即返回
+            self.__select_time = NeTDef.SELECT_IDLE_TIME_OUT.value
+        else:
+            self.__create_selector_socket()     # linux下未连接的socket一直可读,select不会阻塞,只在没有唤醒管道时使用
+    
+    def __create_recv_view(self):
+        '''recv_into用的缓冲区,进程里所有连接共用.在子进程里创建,memoryview不能pickle'''
+        recv_size = self.__option.recv_size
+        if self.__option.split_in_net:          # 每次读到的数据要能放进粘包缓冲区(还有未拼完的半个包)
+            recv_size = min(recv_size, PacketDef.SPLIT_PUSH_SIZE.value)
+        self.__recv_view = memoryview(bytearray(recv_size))
+    
+    def _wait_work(self, timeout):
+        '''重载父类,在run_frame的select里等待'''
+        pass
     
     def run_frame(self, now_milli):
         try:
-            events = self.__selector.select(NeTDef.SELECT_TIME_OUT.value)
+            events = self.__selector.select(self.__select_time)
         except Exception as e:
             Logger().error('{}.{}'.format(self.__net_id,e))
             return     
         for key, mask in events:
             callback = key.data
             callback(key.fileobj, mask)
+        self.__check_connect_timeout(now_milli)
         # 以下处理外界的消息,发关消息或关闭socket,或者退出进程
-        notify_list = []
-        while not self._in_queue.empty():
-            nf = self._in_queue.get_nowait()
-            notify_list.append(nf)
+        notify_list = self._pull_in_msgs()
         send_count = 0
         for nf in notify_list:
             if type(nf) is str and nf.lower() == Helper.quit_signal():
@@ -46,97 +80,247 @@ class ClientConnect(BaseProcess):
                 self._run_flag = False
                 break               # 此处break, 因为已经close_all， 服务端类此处是continue
             sid = nf.sid
-            if sid.net_id != self.__net_id:
-                Logger().warning('client connect.net_id error.{}.{}.'.format(self.__net_id, sid))
+            if sock_net_id(sid) != self.__net_id:
+                Logger().warning('client connect.net_id error.{}.{}.'.format(self.__net_id, sock_id_str(sid)))
                 continue
             if nf.ope == NeTDef.CLIENT_CREATE.value:
                 if platform.system().lower() == 'windows':       
                     '''windows select模型超过509连接会报错'''
-                    conn_num = len(self.__sock_sid_dict)
+                    conn_num = len(self.__sock_sid_dict) + len(self.__connecting_dict)
                     if conn_num >= NeTDef.WINDOWS_SELECT_MAX.value:
                         Logger().error('client connect windows下select连接树超出数量.{}:{}'.format(self.__net_id, conn_num))
                         continue
-                self.__create_socket()
+                self.__create_socket(now_milli)
             elif nf.ope == NeTDef.CLIENT_CLOSE.value:
+                if sid in self.__sid_sock_dict.keys():
+                    sock_close = self.__sid_sock_dict[sid]
+                    try:
+                        self.__send_buf_dict[sock_close].flush(sock_close)      # 关闭前把缓冲区里的数据尽量发出去
+                    except OSError:
+                        pass
                 self.__close_socket(sid, True)
             elif nf.ope == NeTDef.SEND.value:
                 self.__send_msg(sid, nf.buf)
                 send_count += 1
                 if send_count >= NeTDef.MAX_TRANSMIT_ONE_FRAME.value:
                     continue
+            elif nf.ope == NeTDef.BROADCAST.value:
+                self.__broadcast(nf.buf)
+        if self.__reaper is not None:
+            self.__check_idle(now_milli)
+        self.__flush_dirty()
                 
-    def __create_socket(self):
+    def __create_socket(self, now_milli):
+        '''非阻塞连接,不等待连接结果.注册EVENT_WRITE,可写时在__on_connect里检查是否连接成功'''
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        #sock.setblocking(False) 这里不能设,否则会出现BlockingIOError: [WinError 10035]
+        sock.setblocking(False)
         far_address = (self.__server_host, self.__server_port)
-        try: 
-            sock.connect(far_address)           
-        except Exception as e:
-            Logger().info(e)
-            sock_id = SockId(self.__net_id)
-            nf = NetNotify(sock_id, NeTDef.CLIENT_CONNECT_FAIL.value)
-            self._out_queue.put(nf) 
+        try:
+            err = sock.connect_ex(far_address)
+        except OSError as e:                    # 如域名解析失败
+            err = e
+        if not err in _CONNECTING_ERRNO:
+            Logger().info('{} connect error.{}'.format(self.__net_id, err))
+            sock.close()
+            self.__post_connect_fail()
+            return
+        deadline = now_milli + self.__option.connect_timeout
+        self.__connecting_dict[sock] = deadline
+        self.__connect_deque.append((deadline, sock))
+        self.__selector.register(sock, selectors.EVENT_WRITE, self.__on_connect)
+        
+    def __on_connect(self, sock, mask):
+        '''正在连接的sock可写,说明连接有结果了,用SO_ERROR判断是否成功'''
+        del self.__connecting_dict[sock]
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err != 0:
+            Logger().info('{} connect fail.{}'.format(self.__net_id, os.strerror(err)))
+            self.__selector.unregister(sock)
+            sock.close()
+            self.__post_connect_fail()
             return
-        sock_id = SockId(self.__net_id)
-        sock_id.set_data(sock.getsockname())
+        
+        sock_id = self.__sid_alloc.alloc(sock.getsockname())
         self.__sid_sock_dict[sock_id] = sock
         self.__sock_sid_dict[sock] = sock_id
-        self.__selector.register(sock, selectors.EVENT_READ, self.__on_read)
+        if self.__option.split_in_net:
+            self.__split_dict[sock] = PacketSplit(self.__option.max_message_len, self.__option.lazy_packet)
+        self.__send_buf_dict[sock] = SendBuffer()
+        self.__selector.modify(sock, selectors.EVENT_READ, self.__on_event)
+        if self.__reaper is not None:
+            self.__reaper.add(sock)
         
-        nf = NetNotify(sock_id, NeTDef.CONNECT.value)
-        self._out_queue.put(nf)
+        nf = NetNotify(sock_id, NeTDef.CONNECT.value, self.__sid_alloc.addr(sock_id))
+        self._post_msg(nf)
+    
+    def __check_connect_timeout(self, now_milli):
+        '''超时还没有连接结果的sock,关闭并通知逻辑线程连接失败'''
+        connect_deque = self.__connect_deque
+        while len(connect_deque) > 0 and connect_deque[0][0] <= now_milli:
+            deadline, sock = connect_deque.popleft()
+            if not sock in self.__connecting_dict:      # 已经有结果了
+                continue
+            del self.__connecting_dict[sock]
+            Logger().info('{} connect time out.{}:{}'.format(self.__net_id, self.__server_host, self.__server_port))
+            self.__selector.unregister(sock)
+            sock.close()
+            self.__post_connect_fail()
+            
+    def __post_connect_fail(self):
+        nf = NetNotify(net_sock_id(self.__net_id), NeTDef.CLIENT_CONNECT_FAIL.value)
+        self._post_msg(nf)
     
     def __create_selector_socket(self):
         '''专门用来创建selector用的socket，因为不建一个这样的socket,self.selector.select()会报错
 此socket不连服务端'''
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock_id = SockId(self.__net_id)
-        sock_id.set_data(('127.0.0.1', 1))
+        sock_id = self.__sid_alloc.alloc(('127.0.0.1', 1))
         self.__sid_sock_dict[sock_id] = sock
         self.__sock_sid_dict[sock] = sock_id
         self.__selector.register(sock, selectors.EVENT_READ, self.__on_read)
         
+    def __on_event(self, sock, mask):
+        '''连接的selector回调.有数据待发时才注册EVENT_WRITE'''
+        if mask & selectors.EVENT_READ:
+            self.__on_read(sock, mask)
+        if (mask & selectors.EVENT_WRITE) and (sock in self.__send_buf_dict):       # 读的时候可能已经关闭
+            self.__flush_sock(sock)
+        
     def __on_read(self, sock, mask):
+        '''一次可读事件里循环recv_into直到读空或超出本连接的预算,读到的数据合并成一个消息发给逻辑线程'''
         sid = self.__sock_sid_dict[sock]
+        if self.__reaper is not None:
+            self.__reaper.touch(sock)
+        recv_view = self.__recv_view
+        recv_size = len(recv_view)
+        budget = self.__option.recv_budget
+        msg_list = []               # option.split_in_net时为BasePacket列表,否则为bytes列表
+        peer_closed = False
         try:
-            msg = sock.recv(PacketDef.PER_RECV_SIZE.value)      #linux下，创建后就会执行
-            if (not msg) or (len(msg) == 0):
-                self.__close_socket(sid, True)
-                return
-            ntif = NetNotify(sid, NeTDef.RECV.value, msg)
-            self._out_queue.put(ntif)
+            while budget > 0:
+                recv_len = sock.recv_into(recv_view)
+                if recv_len == 0:
+                    peer_closed = True
+                    break
+                budget -= recv_len
+                if self.__option.split_in_net:
+                    if not self.__split_msg(sock, sid, recv_view[:recv_len], msg_list):
+                        peer_closed = True
+                        break
+                else:
+                    msg_list.append(bytes(recv_view[:recv_len]))
+                if recv_len < recv_size:        # 没读满,内核缓冲区已经读空,省一次返回EAGAIN的recv
+                    break
+        except (BlockingIOError, InterruptedError):
+            pass
         except ConnectionResetError as err:
-            #Logger().info('ConnectionResetError:{} {}'.format(sid, err))
-            self.__close_socket(sid, True)           
+            #Logger().info('ConnectionResetError:{} {}'.format(self.__sid_alloc.desc(sid), err))
+            self.__close_socket(sid, True)
+            return
         except Exception as e:
             if (type(e) is OSError) and (e.errno == 107):
-                pass             # linux下，没连接上就会recv
-            else:
-                Logger().info('{}:{}:{}'.format(sid, e, type(e)))
-                self.__close_socket(sid, True)
+                return             # linux下，没连接上就会recv
+            Logger().info('{}:{}:{}'.format(self.__sid_alloc.desc(sid), e, type(e)))
+            self.__close_socket(sid, True)
+            return
+        self.__post_recv(sid, msg_list)
+        if peer_closed:
+            self.__close_socket(sid, True)
+            
+    def __post_recv(self, sid, msg_list):
+        if len(msg_list) == 0:
+            return
+        if self.__option.split_in_net:
+            ntif = NetNotify(sid, NeTDef.RECV_PACKETS.value, msg_list)
+        elif len(msg_list) == 1:
+            ntif = NetNotify(sid, NeTDef.RECV.value, msg_list[0])
+        else:
+            ntif = NetNotify(sid, NeTDef.RECV.value, b''.join(msg_list))
+        self._post_msg(ntif)
+            
+    def __split_msg(self, sock, sid, msg, pack_list):
+        '''在网络进程里做粘包处理和解码,完整的包放进pack_list.缓冲区溢出返回False,需要关闭连接'''
+        split = self.__split_dict[sock]
+        if not split.push_data(msg):
+            return False
+        try:
+            pack_list.extend(split.split())
+        except PacketError as e:
+            Logger().warning('{}.{}'.format(self.__sid_alloc.desc(sid), e))
+        return True
     
     def __send_msg(self, sock_id, buf):
-        if sock_id in self.__sid_sock_dict.keys():
-            try:
-                self.__sid_sock_dict[sock_id].send(buf)
-            except Exception as e:
-                Logger().warning(e)
-        else:
-            Logger().warning('client send_msg. sid not exist. {}'.format(sock_id))
+        '''放进发送缓冲区,本帧消息处理完后在__flush_dirty里统一发送'''
+        if not sock_id in self.__sid_sock_dict.keys():
+            Logger().warning('client send_msg. sid not exist. {}'.format(self.__sid_alloc.desc(sock_id)))
+            return
+        sock = self.__sid_sock_dict[sock_id]
+        send_buf = self.__send_buf_dict[sock]
+        send_buf.push(buf)
+        if send_buf.pending_len > self.__option.send_high_water:
+            Logger().warning('client send buffer over high water, close.{}.{}'.format(self.__sid_alloc.desc(sock_id), send_buf.pending_len))
+            self.__close_socket(sock_id, True)
+            return
+        self.__dirty_set.add(sock)
+    
+    def __broadcast(self, broadcast_buf):
+        '''同一份数据放进每个连接的发送缓冲区,只是引用,不拷贝'''
+        sid_list, buf = broadcast_buf
+        for sid in sid_list:
+            if sid in self.__sid_sock_dict:         # 逻辑线程还没收到DISCONNECT的连接,跳过
+                self.__send_msg(sid, buf)
+    
+    def __check_idle(self, now_milli):
+        '''空闲超时的连接关闭,向逻辑线程发DISCONNECT.空闲超过心跳间隔的连接发心跳'''
+        expired_list, heartbeat_list = self.__reaper.check(now_milli)
+        for sock in expired_list:
+            sid = self.__sock_sid_dict[sock]
+            Logger().info('idle timeout, close.{}'.format(self.__sid_alloc.desc(sid)))
+            self.__close_socket(sid, True)
+        if len(self.__option.heartbeat_data) == 0:
+            return
+        for sock in heartbeat_list:
+            self.__send_msg(self.__sock_sid_dict[sock], self.__option.heartbeat_data)
+    
+    def __flush_dirty(self):
+        dirty_set = self.__dirty_set
+        self.__dirty_set = set()            # __flush_sock里可能会关闭连接,从__dirty_set里删除
+        for sock in dirty_set:
+            self.__flush_sock(sock)
+    
+    def __flush_sock(self, sock):
+        send_buf = self.__send_buf_dict[sock]
+        try:
+            done = send_buf.flush(sock)
+        except OSError as e:
+            sid = self.__sock_sid_dict[sock]
+            Logger().info('{}.{}'.format(self.__sid_alloc.desc(sid), e))
+            self.__close_socket(sid, True)
+            return
+        if done == send_buf.wait_writable:          # 发完了取消EVENT_WRITE,没发完注册EVENT_WRITE
+            send_buf.wait_writable = not done
+            events = selectors.EVENT_READ if done else selectors.EVENT_READ | selectors.EVENT_WRITE
+            self.__selector.modify(sock, events, self.__on_event)
     
     def __close_socket(self, sock_id, b_out):
         if not sock_id in self.__sid_sock_dict.keys():
-            Logger().warning('close sock id not exist.{}'.format(sock_id))            
+            Logger().warning('close sock id not exist.{}'.format(self.__sid_alloc.desc(sock_id)))            
             return
         sock = self.__sid_sock_dict[sock_id]
         sock.close()
         self.__selector.unregister(sock)
         del self.__sid_sock_dict[sock_id]
         del self.__sock_sid_dict[sock]
+        self.__split_dict.pop(sock, None)
+        self.__send_buf_dict.pop(sock, None)
+        self.__dirty_set.discard(sock)
+        if self.__reaper is not None:
+            self.__reaper.remove(sock)
+        self.__sid_alloc.free(sock_id)
         
         if b_out:
             nf = NetNotify(sock_id, NeTDef.DISCONNECT.value)
-            self._out_queue.put(nf)
+            self._post_msg(nf)
         
     def __close_all(self):
         del_arr = []
@@ -144,14 +328,20 @@ class ClientConnect(BaseProcess):
             del_arr.append(k)
         for d in del_arr:
             self.__close_socket(d, False)
-        
-    def quit(self):
-        self._in_queue.put(Helper.quit_signal())
+        for sock in self.__connecting_dict.keys():
+            self.__selector.unregister(sock)
+            sock.close()
+        self.__connecting_dict.clear()
+        self.__connect_deque.clear()
         
     @property
     def net_id(self):
         return self.__net_id
         
+    @property
+    def option(self):
+        return self.__option
+        
     @property
     def far_addr(self):
         return (self.__server_addr, self.__server_port)
@@ -0,0 +1,78 @@
+# -*- coding: UTF-8 -*-
+
+from dogwood.core.network.net_def import NeTDef
+
+class IdleReaper:
+    '''网络进程里的空闲连接检查.
+    连接按下次检查时间放进时间桶(粒度NeTDef.IDLE_CHECK_TICK毫秒),每帧只处理到期的桶,不遍历所有连接.
+    收到数据时touch只记录时间,不移动桶;桶到期时按最后活跃时间决定超时,发心跳,或者放进新的桶,
+    所以每个连接每个检查周期最多被处理一次.
+    key为连接对象(conn或sock),每次add的key必须是新对象,remove后留在桶里的key到期时丢弃'''
+    __slots__ = ('__idle_timeout', '__heartbeat_interval', '__now_milli', '__active_dict', '__bucket_dict', '__check_index')
+    def __init__(self, idle_timeout, heartbeat_interval, now_milli):
+        '''idle_timeout: 超过这么多毫秒没有收到数据算超时,0不检查. heartbeat_interval: 空闲这么多毫秒后发心跳,0不发'''
+        self.__idle_timeout = idle_timeout
+        self.__heartbeat_interval = heartbeat_interval
+        self.__now_milli = now_milli            # 上次check的时间,touch时使用,最多差一帧
+        self.__active_dict = {}                 # key 连接, value 最后收到数据的时间
+        self.__bucket_dict = {}                 # key 桶序号(时间/IDLE_CHECK_TICK), value 到期要检查的连接列表
+        self.__check_index = now_milli // NeTDef.IDLE_CHECK_TICK.value     # 下一个要检查的桶
+
+    def add(self, key):
+        self.__active_dict[key] = self.__now_milli
+        self.__put(key, self.__next_check(self.__now_milli, self.__now_milli))
+
+    def remove(self, key):
+        self.__active_dict.pop(key, None)
+
+    def touch(self, key):
+        '''收到数据时调用,只记录时间'''
+        self.__active_dict[key] = self.__now_milli
+
+    def check(self, now_milli):
+        '''每帧调用,返回(超时的连接列表, 需要发心跳的连接列表).超时的连接已经移除,调用者负责关闭'''
+        self.__now_milli = now_milli
+        expired_list = []
+        heartbeat_list = []
+        end_index = now_milli // NeTDef.IDLE_CHECK_TICK.value
+        while self.__check_index <= end_index:
+            bucket = self.__bucket_dict.pop(self.__check_index, None)
+            self.__check_index += 1
+            if bucket is None:
+                continue
+            for key in bucket:
+                last_milli = self.__active_dict.get(key, None)
+                if last_milli is None:              # 已经remove
+                    continue
+                idle = now_milli - last_milli
+                if self.__idle_timeout > 0 and idle >= self.__idle_timeout:
+                    del self.__active_dict[key]
+                    expired_list.append(key)
+                    continue
+                if self.__heartbeat_interval > 0 and idle >= self.__heartbeat_interval:
+                    heartbeat_list.append(key)      # 对端一直没有数据时,每个心跳间隔发一次
+                self.__put(key, self.__next_check(last_milli, now_milli))
+        return expired_list, heartbeat_list
+
+    def __next_check(self, last_milli, now_milli):
+        next_milli = None
+        if self.__heartbeat_interval > 0:
+            next_milli = last_milli + self.__heartbeat_interval
+            if next_milli <= now_milli:             # 刚发过心跳
+                next_milli = now_milli + self.__heartbeat_interval
+        if self.__idle_timeout > 0:
+            timeout_milli = last_milli + self.__idle_timeout
+            if next_milli is None or timeout_milli < next_milli:
+                next_milli = timeout_milli
+        return next_milli
+
+    def __put(self, key, check_milli):
+        index = max(-(-check_milli // NeTDef.IDLE_CHECK_TICK.value), self.__check_index)      # 向上取整,桶到期时一定已经到了检查时间
+        bucket = self.__bucket_dict.get(index, None)
+        if bucket is None:
+            self.__bucket_dict[index] = [key]
+        else:
+            bucket.append(key)
+
+    def __len__(self):
+        return len(self.__active_dict)
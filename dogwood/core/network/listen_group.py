@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+from multiprocessing import Event as PeEvent
+
+from dogwood.core.logger import Logger
+from dogwood.core.network.net_option import NetOption
+
+class ListenGroup:
+    '''同一端口的一组监听进程(ServerListen或WSServerListen),网络读写可以用满多核.
+    linux下各进程用SO_REUSEPORT各自绑定同一端口,由内核把新连接均匀分给各进程.
+    第i个进程的net_id为net_id_base+i,连接的sock_id高位是所在进程的net_id,
+    所以逻辑线程send_socket_msg/close_socket时直接按net_id找到对应进程'''
+    __slots__ = ('__net_id_base', '__port', '__proc_list', '__event_list')
+    def __init__(self, listen_cls, log_name, net_id_base, port, worker_num, option=None):
+        '''listen_cls: ServerListen或WSServerListen. 各进程共用option,会修改option.reuse_port.
+        不支持SO_REUSEPORT的平台(windows)只启动一个进程'''
+        if option is None:
+            option = NetOption()
+        if worker_num > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            Logger().warning('ListenGroup.平台不支持SO_REUSEPORT,只启动一个监听进程.{}'.format(log_name))
+            worker_num = 1
+        option.reuse_port = worker_num > 1
+        self.__net_id_base = net_id_base
+        self.__port = port
+        self.__proc_list = []
+        self.__event_list = []
+        for i in range(worker_num):
+            event = PeEvent()
+            proc = listen_cls('{}_{}'.format(log_name, i), event, net_id_base + i, port, option)
+            self.__proc_list.append(proc)
+            self.__event_list.append(event)
+
+    def start(self):
+        '''启动所有监听进程,等到全部监听成功后返回'''
+        for proc in self.__proc_list:
+            proc.start()
+        for event in self.__event_list:
+            event.wait()
+
+    def close_all(self):
+        for proc in self.__proc_list:
+            proc.quit()
+        for proc in self.__proc_list:
+            proc.join()
+            proc.close_queues()
+
+    def has_net_id(self, net_id):
+        return self.__net_id_base <= net_id < self.__net_id_base + len(self.__proc_list)
+
+    @property
+    def procs(self):
+        return self.__proc_list
+
+    @property
+    def net_id_base(self):
+        return self.__net_id_base
+
+    @property
+    def port(self):
+        return self.__port
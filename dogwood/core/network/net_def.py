@@ -6,7 +6,7 @@ class NeTDef(Enum):
     '''netnotify type'''
     SEND = 0
     RECV = 1
-    CONNECT = 2         # 不管是作为服务端还是客户端,都发这个消息
+    CONNECT = 2         # 不管是作为服务端还是客户端,都发这个消息,buf为对端(服务端)或本端(客户端)的(地址, 端口)
     DISCONNECT = 3       # 不管是主动还是被动,都向逻辑线程使用这个定义
     
     SERVER_CLOSE = 4            # 服务端主动关闭一个客户端
@@ -14,10 +14,15 @@ class NeTDef(Enum):
     CLIENT_CREATE = 5          # 客户端创建一个连接
     CLIENT_CLOSE = 6            # 客户端关闭一个连接
     CLIENT_CONNECT_FAIL = 7     # 作为客户端,连远程服务器失败
+    RECV_PACKETS = 8            # 网络进程里已经做完粘包处理,buf为BasePacket列表
+    BROADCAST = 9               # 同一份数据发给同一网络进程的多个连接,buf为(sock_id列表, 数据),sid为net_sock_id(net_id)
     
     LISTEN_NUM = 100                  # 监听一次数量
-    SELECT_TIME_OUT = 0.016           # select timeout. 16毫秒,每秒60帧
+    SELECT_TIME_OUT = 0.016           # select timeout. 16毫秒,每秒60帧.入队列不能注册进select时使用
+    SELECT_IDLE_TIME_OUT = 0.1        # 入队列注册进select后的timeout,有消息时会立即唤醒,只有空闲时才会等这么久
     MAX_TRANSMIT_ONE_FRAME = 1024       # 每一帧发送的最大数量包,发不了的下一帧
+    SEND_IOV_MAX = 512                  # 一次sendmsg最多合并的包数量,linux的IOV_MAX是1024
+    IDLE_CHECK_TICK = 250               # 空闲连接检查的时间桶粒度,毫秒
     
     WINDOWS_SELECT_MAX = 502            # python的selectors在windows下使用的是select,最大只支持509.
                                         # ValueError: too many file descriptors in select()
\ No newline at end of file
@@ -1,12 +1,8 @@
 # -*- coding: UTF-8 -*-
 
-from enum import Enum
-from dogwood.core.network.sock_id import SockId
-import copy
-  
 class NetNotify:
     __slots__ = ('sid', 'ope', 'buf')
     def __init__(self, sid, ope, buf=None):
-        self.sid = copy.deepcopy(sid)
+        self.sid = sid                  # 整数sock_id,见sock_id.py
         self.ope = ope
-        self.buf = buf
\ No newline at end of file
+        self.buf = buf
@@ -0,0 +1,37 @@
+# -*- coding: UTF-8 -*-
+
+class NetOption:
+    '''网络进程(ServerListen, WSServerListen, ClientConnect, WSClientConnect)的可选配置,
+    创建网络进程时不传则使用默认值'''
+    __slots__ = ('split_in_net', 'shm_queue_size', 'send_high_water', 'reuse_port', 'recv_size', 'recv_budget', 'connect_timeout', 'ws_max_message',
+                 'ws_deflate', 'ws_deflate_context_takeover', 'ws_deflate_window_bits', 'ws_deflate_min_size',
+                 'idle_timeout', 'heartbeat_interval', 'heartbeat_data',
+                 'max_connections', 'accept_rate', 'recv_bytes_rate', 'recv_packets_rate', 'rate_limit_close',
+                 'packet_codec', 'packet_codec_negotiate', 'max_message_len', 'lazy_packet')
+    def __init__(self):
+        self.split_in_net = False           # 是否在网络进程里做粘包处理和json解码,为True时向逻辑线程发RECV_PACKETS,而不是RECV
+        self.shm_queue_size = 0             # 大于0时,和逻辑线程之间使用此大小(字节)的共享内存队列,否则使用multiprocessing.Queue
+        self.send_high_water = 4 * 1024 * 1024      # 单个连接发送缓冲区积压超过此字节数时断开,防止一个慢客户端占满内存
+        self.reuse_port = False             # 监听端口设置SO_REUSEPORT,多个监听进程绑定同一端口.由ListenGroup设置
+        self.recv_size = 65536              # 每次recv_into的最大字节数.split_in_net时不超过粘包缓冲区能放下的大小
+        self.recv_budget = 262144           # 一次可读事件里单个连接最多读取的字节数,防止一个连接占满一帧
+        self.connect_timeout = 10000        # 客户端连接超时毫秒数,超时向逻辑线程发CLIENT_CONNECT_FAIL
+        self.ws_max_message = 1024 * 1024   # websocket单个消息(分片拼完后)的最大字节数,超过断开
+        self.ws_deflate = False             # websocket握手时协商permessage-deflate压缩,压缩和解压都在网络进程里
+        self.ws_deflate_context_takeover = True     # 消息之间保留压缩上下文,压缩率更高,每个连接多占一个压缩窗口的内存.为False时两端每个消息单独压缩
+        self.ws_deflate_window_bits = 15    # 压缩窗口大小(9-15),本端压缩使用,也要求对端不超过此值
+        self.ws_deflate_min_size = 256      # 小于此字节数的消息不压缩,压缩小包得不偿失
+        self.idle_timeout = 0               # 超过此毫秒数没有收到任何数据的连接,网络进程关闭并向逻辑线程发DISCONNECT.0不检查
+        self.heartbeat_interval = 0         # 连接空闲超过此毫秒数时发心跳,直到收到数据或超时.0不发
+        self.heartbeat_data = b''           # tcp连接的心跳数据,如打包好的心跳协议,为空时tcp连接不发心跳.websocket连接发PING帧
+        # 以下为监听进程(ServerListen, WSServerListen)的过载保护,0不限制.ListenGroup里每个进程各自计算
+        self.max_connections = 0            # 最大连接数,超过时新连接accept后立即关闭
+        self.accept_rate = 0                # 每秒最多accept的连接数,超过时暂停监听,新连接留在backlog里
+        self.recv_bytes_rate = 0            # 单个连接每秒最多接收的字节数,允许1秒的突发
+        self.recv_packets_rate = 0          # 单个连接每秒最多接收的包数,tcp连接只在split_in_net时限制,websocket按消息数
+        self.rate_limit_close = False       # 接收超限时关闭连接(收到的数据丢弃),为False时暂停读取直到恢复
+        self.max_message_len = 1048576      # 分片包(超过16K的BasePacket)重组后的最大字节数,超过时丢弃.网络进程或逻辑线程粘包处理时使用
+        self.lazy_packet = False            # 粘包处理时BasePacket延迟解码,只读取m,n,访问data时才解码.适合只按id路由,转发(BasePacket.raw)的网关
+        # 以下由逻辑线程使用,网络进程解码时按内容自动识别编码
+        self.packet_codec = 'json'          # 该网络进程上的连接回复BasePacket时默认使用的编码,见packet_codec.py
+        self.packet_codec_negotiate = True  # 连接收到的第一个BasePacket用的编码作为该连接的编码,老客户端用json,新客户端可以用更快的编码
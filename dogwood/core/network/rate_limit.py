@@ -0,0 +1,78 @@
+# -*- coding: UTF-8 -*-
+
+class TokenBucket:
+    '''令牌桶,rate为每秒补充的令牌数,burst为桶的容量.
+    consume允许透支,透支后要等令牌补回到0才算恢复,一次大的消耗会换来相应长的等待'''
+    __slots__ = ('__rate', '__burst', '__tokens', '__last_milli')
+    def __init__(self, rate, burst, now_milli):
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst
+        self.__last_milli = now_milli
+
+    def consume(self, count, now_milli):
+        '''返回False表示已经透支'''
+        self.__refill(now_milli)
+        self.__tokens -= count
+        return self.__tokens >= 0
+
+    def available(self, now_milli):
+        '''当前可用的整数令牌数,透支时为0'''
+        self.__refill(now_milli)
+        return max(int(self.__tokens), 0)
+
+    def wait_milli(self, now_milli, need=0):
+        '''令牌补回到need(不超过burst)还需要的毫秒数'''
+        self.__refill(now_milli)
+        if self.__tokens >= need:
+            return 0
+        return int((need - self.__tokens) * 1000 / self.__rate) + 1
+
+    def __refill(self, now_milli):
+        elapsed = now_milli - self.__last_milli
+        if elapsed > 0:
+            self.__tokens = min(self.__burst, self.__tokens + elapsed * self.__rate / 1000)
+            self.__last_milli = now_milli
+
+
+class RecvLimit:
+    '''一个连接的接收限速,每秒字节数和每秒包数两个令牌桶,都允许1秒的突发.rate为0的不限制.
+    字节数在读取前就限制了本次能读多少,超出的数据留在内核缓冲区;包数要读出来才知道,允许透支'''
+    __slots__ = ('__byte_bucket', '__byte_resume', '__packet_bucket')
+    def __init__(self, byte_rate, packet_rate, now_milli):
+        self.__byte_bucket = TokenBucket(byte_rate, byte_rate, now_milli) if byte_rate > 0 else None
+        self.__byte_resume = max(byte_rate // 10, 1)            # 字节令牌少于0.1秒的量时暂停读取,补回后每次能读到一块像样的数据
+        self.__packet_bucket = TokenBucket(packet_rate, packet_rate, now_milli) if packet_rate > 0 else None
+
+    def byte_budget(self, now_milli):
+        '''本次最多读取的字节数,没有字节限速时返回None'''
+        if self.__byte_bucket is None:
+            return None
+        return self.__byte_bucket.available(now_milli)
+
+    def consume(self, byte_count, packet_count, now_milli):
+        '''返回0表示没有超限,否则为需要暂停读取的毫秒数'''
+        wait_milli = 0
+        if self.__byte_bucket is not None:
+            self.__byte_bucket.consume(byte_count, now_milli)
+            wait_milli = self.__byte_bucket.wait_milli(now_milli, self.__byte_resume)
+        if self.__packet_bucket is not None and packet_count > 0 and not self.__packet_bucket.consume(packet_count, now_milli):
+            wait_milli = max(wait_milli, self.__packet_bucket.wait_milli(now_milli))
+        return wait_milli
+
+
+class OverloadStat:
+    '''一个监听进程的过载保护统计,和批量发送统计一起定时打印,用来观察攻击时丢弃了多少'''
+    __slots__ = ('accept_refused', 'accept_paused', 'throttled', 'dropped')
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.accept_refused = 0     # 超过max_connections,accept后立即关闭的连接数
+        self.accept_paused = 0      # 超过accept_rate,暂停监听的次数
+        self.throttled = 0          # 接收超限,暂停读取的次数
+        self.dropped = 0            # 接收超限,关闭的连接数(这次收到的数据丢弃)
+
+    def __str__(self):
+        return 'accept_refused:{},accept_paused:{},throttled:{},dropped:{}'.format(
+            self.accept_refused, self.accept_paused, self.throttled, self.dropped)
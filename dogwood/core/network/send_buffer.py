@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+
+from dogwood.core.network.net_def import NeTDef
+
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')           # windows下没有sendmsg,合并成一个bytes再send
+_SEND_FLAGS = getattr(socket, 'MSG_DONTWAIT', 0)            # 客户端的socket是阻塞的,加上这个标志发送时也不会卡住进程
+
+class SendBuffer:
+    '''单个连接的发送缓冲区.
+    逻辑线程发来的包先放进缓冲区,一帧的消息处理完后多个包合并成一次sendmsg发出,
+    发不完的部分留在缓冲区,等socket可写(EVENT_WRITE)时再发'''
+    __slots__ = ('__buf_list', '__pending_len', 'wait_writable')
+    def __init__(self):
+        self.__buf_list = []                # 待发送的bytes,第一个可能是发了一半剩下的memoryview
+        self.__pending_len = 0
+        self.wait_writable = False          # 是否已经在selector里注册了EVENT_WRITE
+
+    def push(self, buf):
+        if len(buf) == 0:
+            return
+        self.__buf_list.append(buf)
+        self.__pending_len += len(buf)
+
+    def flush(self, sock):
+        '''尽量发送缓冲区里的数据.全部发完返回True,socket发送缓冲区满了返回False.
+        连接出错时抛出OSError,由调用者关闭连接'''
+        buf_list = self.__buf_list
+        while buf_list:
+            try:
+                if _HAS_SENDMSG:
+                    sent = sock.sendmsg(buf_list[:NeTDef.SEND_IOV_MAX.value], (), _SEND_FLAGS)
+                else:
+                    sent = sock.send(b''.join(buf_list))
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.__consume(sent)
+        return True
+
+    def clear(self):
+        self.__buf_list.clear()
+        self.__pending_len = 0
+
+    def __consume(self, sent):
+        '''去掉已经发出去的数据,发了一半的包只保留剩下部分的memoryview,不拷贝'''
+        self.__pending_len -= sent
+        buf_list = self.__buf_list
+        index = 0
+        while sent > 0:
+            buf_len = len(buf_list[index])
+            if sent < buf_len:
+                buf_list[index] = memoryview(buf_list[index])[sent:]
+                break
+            sent -= buf_len
+            index += 1
+        del buf_list[:index]
+
+    @property
+    def pending_len(self):
+        return self.__pending_len
@@ -1,25 +1,55 @@
 # -*- coding: UTF-8 -*-
 
-import random
+'''
+sock_id是一个64位以内的整数,唯一表示一个连接: 高位是net_id,低SEQ_BITS位是网络进程内单调递增的序号.
+作为字典的key和放进NetNotify时都是整数操作,不需要拷贝,也不会重复.
+序号为0的sock_id不对应具体连接,用在CLIENT_CREATE,BROADCAST,CLIENT_CONNECT_FAIL等只需要找到网络进程的消息里.
+连接的地址只记录在网络进程的SockIdAlloc里,打印日志时使用
+'''
 
-class SockId:
-    __slots__ = ('net_id', 'addr', 'port', 'rnd_int')
-    '''用于表示来自客户端连接的类'''
+SEQ_BITS = 40                           # 每个网络进程可以分配约1万亿个连接,net_id最大到2^23也不超过63位
+SEQ_MASK = (1 << SEQ_BITS) - 1
+
+def make_sock_id(net_id, seq):
+    return (net_id << SEQ_BITS) | seq
+
+def net_sock_id(net_id):
+    '''不对应具体连接的sock_id'''
+    return net_id << SEQ_BITS
+
+def sock_net_id(sock_id):
+    return sock_id >> SEQ_BITS
+
+def sock_seq(sock_id):
+    return sock_id & SEQ_MASK
+
+def sock_id_str(sock_id):
+    return '{}:{}'.format(sock_id >> SEQ_BITS, sock_id & SEQ_MASK)
+
+
+class SockIdAlloc:
+    '''网络进程里分配sock_id,并记录连接的地址'''
+    __slots__ = ('__base', '__seq', '__addr_dict')
     def __init__(self, net_id):
-        self.net_id = net_id        # 可能同一个程序里，有不同的网络监控
-        self.addr = ''
-        self.port = 0
-        self.rnd_int = random.randint(100000, 10000000)     #四个属性都相等，就是同一个socket，随机数可能重复，但四个属性需要都相等的情况下，重复概率几乎不可能
-        
-    def set_data(self, net_addr):
-        self.addr = net_addr[0]
-        self.port = net_addr[1]
-        
-    def __eq__(self, other):                                    # 要作为字典的key, 必须__eq__和__hash__同时实现
-        return self.net_id == other.net_id and self.addr == other.addr and self.port == other.port and self.rnd_int == other.rnd_int
-    
-    def __hash__(self):
-        return hash(self.net_id) ^ hash(self.addr) ^ hash(self.port) ^ hash(self.rnd_int)
-    
-    def __str__(self):
-        return ('{}:{}:{}:{}'.format(self.net_id, self.addr, self.port, self.rnd_int))
\ No newline at end of file
+        self.__base = net_sock_id(net_id)
+        self.__seq = 0
+        self.__addr_dict = {}           # key sock_id, value (addr, port)
+
+    def alloc(self, net_addr):
+        self.__seq += 1
+        sock_id = self.__base | self.__seq
+        self.__addr_dict[sock_id] = net_addr
+        return sock_id
+
+    def free(self, sock_id):
+        self.__addr_dict.pop(sock_id, None)
+
+    def addr(self, sock_id):
+        return self.__addr_dict.get(sock_id, None)
+
+    def desc(self, sock_id):
+        '''日志用,net_id:序号:地址:端口'''
+        net_addr = self.__addr_dict.get(sock_id, None)
+        if net_addr is None:
+            return sock_id_str(sock_id)
+        return '{}:{}:{}'.format(sock_id_str(sock_id), net_addr[0], net_addr[1])
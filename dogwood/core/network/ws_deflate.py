@@ -0,0 +1,198 @@
+# -*- coding: UTF-8 -*-
+
+import time
+import zlib
+
+from dogwood.core.network.ws_frame import WsFrameError
+
+_DEFLATE_TAIL = b'\x00\x00\xff\xff'         # Z_SYNC_FLUSH结尾的4个字节,发送时去掉,解压前补上(RFC 7692)
+_EXTENSION_NAME = 'permessage-deflate'
+_MIN_WINDOW_BITS = 9                        # zlib的raw deflate不支持8位窗口,协商到8时拒绝该请求
+
+class WsDeflateStat:
+    '''一个网络进程里所有连接的压缩统计,和批量发送统计一起定时打印'''
+    __slots__ = ('out_count', 'out_skip', 'out_raw', 'out_wire', 'out_time', 'in_count', 'in_raw', 'in_wire', 'in_time')
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.out_count = 0          # 压缩发送的消息数
+        self.out_skip = 0           # 小于ws_deflate_min_size没有压缩的消息数
+        self.out_raw = 0            # 压缩前字节数
+        self.out_wire = 0           # 压缩后字节数
+        self.out_time = 0.0         # 压缩耗时,秒
+        self.in_count = 0           # 解压的消息数
+        self.in_raw = 0             # 解压后字节数
+        self.in_wire = 0            # 解压前字节数
+        self.in_time = 0.0          # 解压耗时,秒
+
+    def add_deflate(self, raw_len, wire_len, cost):
+        self.out_count += 1
+        self.out_raw += raw_len
+        self.out_wire += wire_len
+        self.out_time += cost
+
+    def add_inflate(self, wire_len, raw_len, cost):
+        self.in_count += 1
+        self.in_wire += wire_len
+        self.in_raw += raw_len
+        self.in_time += cost
+
+    def __str__(self):
+        out_saved = self.out_raw - self.out_wire
+        out_rate = out_saved * 100 / self.out_raw if self.out_raw > 0 else 0
+        out_us = self.out_time * 1000000 / self.out_count if self.out_count > 0 else 0
+        in_saved = self.in_raw - self.in_wire
+        in_us = self.in_time * 1000000 / self.in_count if self.in_count > 0 else 0
+        return 'out:{},skip:{},saved:{}({:.1f}%),{:.1f}us/msg; in:{},saved:{},{:.1f}us/msg'.format(
+            self.out_count, self.out_skip, out_saved, out_rate, out_us, self.in_count, in_saved, in_us)
+
+
+class WsDeflate:
+    '''一个连接的permessage-deflate.compress在网络进程发送时调用,
+    decompress由WsFrameParser在收完一个压缩消息时调用,逻辑线程收发的都是原始数据'''
+    __slots__ = ('__compressor', '__flush_mode', '__decompressor', '__inflate_takeover', '__min_size', '__stat')
+    def __init__(self, window_bits, deflate_takeover, inflate_takeover, min_size, stat):
+        '''window_bits: 本端压缩用的窗口. deflate_takeover/inflate_takeover: 本端压缩/对端压缩是否在消息之间保留上下文'''
+        self.__compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -window_bits)
+        self.__flush_mode = zlib.Z_SYNC_FLUSH if deflate_takeover else zlib.Z_FULL_FLUSH     # FULL_FLUSH清空字典,下个消息不会引用之前的数据
+        self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)      # 最大窗口可以解压对端任何窗口大小的数据
+        self.__inflate_takeover = inflate_takeover
+        self.__min_size = min_size
+        self.__stat = stat
+
+    def compress(self, payload):
+        '''返回(要发送的内容, 是否压缩).小于min_size的消息不压缩,不进压缩器,不影响后续消息的上下文'''
+        raw_len = len(payload)
+        if raw_len < self.__min_size:
+            self.__stat.out_skip += 1
+            return payload, False
+        begin = time.perf_counter()
+        data = self.__compressor.compress(payload) + self.__compressor.flush(self.__flush_mode)
+        data = data[:-4]                    # 去掉_DEFLATE_TAIL
+        self.__stat.add_deflate(raw_len, len(data), time.perf_counter() - begin)
+        return data, True
+
+    def decompress(self, payload, max_len):
+        '''解压后超过max_len或数据错误抛出WsFrameError'''
+        begin = time.perf_counter()
+        if not self.__inflate_takeover:     # 对端每个消息重新开始压缩
+            self.__decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            data = self.__decompressor.decompress(payload + _DEFLATE_TAIL, max_len + 1)
+        except zlib.error as e:
+            raise WsFrameError('inflate error.{}'.format(e))
+        if len(data) > max_len:
+            raise WsFrameError('inflated message too long.{}'.format(len(data)))
+        self.__stat.add_inflate(len(payload), len(data), time.perf_counter() - begin)
+        return data
+
+
+def _parse_extensions(header):
+    '''解析Sec-WebSocket-Extensions,返回[(扩展名, {参数名: 参数值})],没有值的参数值为None'''
+    ext_list = []
+    for ext in header.split(','):
+        items = [item.strip() for item in ext.split(';')]
+        if items[0] == '':
+            continue
+        params = {}
+        for item in items[1:]:
+            key, sep, value = item.partition('=')
+            params[key.strip()] = value.strip().strip('"') if sep else None
+        ext_list.append((items[0], params))
+    return ext_list
+
+def _window_bits(value):
+    '''参数值不合法返回None'''
+    if value is None or not value.isdigit():
+        return None
+    bits = int(value)
+    if bits < _MIN_WINDOW_BITS or bits > zlib.MAX_WBITS:
+        return None
+    return bits
+
+def _accept_offer(params, option, stat):
+    '''服务端检查客户端的一个请求,返回(响应参数列表, WsDeflate),不能接受返回None'''
+    server_bits = option.ws_deflate_window_bits
+    for key, value in params.items():
+        if key == 'server_no_context_takeover' or key == 'client_no_context_takeover':
+            if value is not None:
+                return None
+        elif key == 'server_max_window_bits':
+            bits = _window_bits(value)
+            if bits is None:
+                return None
+            server_bits = min(server_bits, bits)
+        elif key == 'client_max_window_bits':
+            if value is not None and _window_bits(value) is None:
+                return None
+        else:
+            return None
+    server_takeover = option.ws_deflate_context_takeover and not 'server_no_context_takeover' in params
+    client_takeover = option.ws_deflate_context_takeover and not 'client_no_context_takeover' in params
+    resp = [_EXTENSION_NAME]
+    if not server_takeover:
+        resp.append('server_no_context_takeover')
+    if not client_takeover:
+        resp.append('client_no_context_takeover')
+    if server_bits < zlib.MAX_WBITS:
+        resp.append('server_max_window_bits={}'.format(server_bits))
+    if 'client_max_window_bits' in params:             # 客户端声明了支持才能限制它的窗口
+        client_bits = option.ws_deflate_window_bits
+        if params['client_max_window_bits'] is not None:
+            client_bits = min(client_bits, int(params['client_max_window_bits']))
+        if client_bits < zlib.MAX_WBITS:
+            resp.append('client_max_window_bits={}'.format(client_bits))
+    return resp, WsDeflate(server_bits, server_takeover, client_takeover, option.ws_deflate_min_size, stat)
+
+def ws_deflate_accept(header, option, stat):
+    '''服务端根据客户端握手请求里的Sec-WebSocket-Extensions协商,
+    返回(响应的Sec-WebSocket-Extensions, WsDeflate).没有开启或没有能接受的请求时返回('', None)'''
+    if not option.ws_deflate:
+        return '', None
+    for name, params in _parse_extensions(header):
+        if name != _EXTENSION_NAME:
+            continue
+        accept = _accept_offer(params, option, stat)
+        if accept is not None:
+            resp, deflate = accept
+            return '; '.join(resp), deflate
+    return '', None
+
+def ws_deflate_offer(option):
+    '''客户端握手请求里的Sec-WebSocket-Extensions,没有开启时返回空字符串'''
+    if not option.ws_deflate:
+        return ''
+    offer = [_EXTENSION_NAME, 'client_max_window_bits']
+    if not option.ws_deflate_context_takeover:
+        offer.append('server_no_context_takeover')
+        offer.append('client_no_context_takeover')
+    if option.ws_deflate_window_bits < zlib.MAX_WBITS:
+        offer.append('server_max_window_bits={}'.format(option.ws_deflate_window_bits))
+    return '; '.join(offer)
+
+def ws_deflate_confirm(header, option, stat):
+    '''客户端检查服务端响应里的Sec-WebSocket-Extensions,返回WsDeflate,服务端没有接受时返回None.
+    响应里有客户端没有请求的内容时抛出WsFrameError'''
+    ext_list = _parse_extensions(header)
+    if len(ext_list) == 0:
+        return None
+    if not option.ws_deflate or len(ext_list) != 1 or ext_list[0][0] != _EXTENSION_NAME:
+        raise WsFrameError('unexpected extensions.{}'.format(header))
+    params = ext_list[0][1]
+    client_bits = option.ws_deflate_window_bits
+    for key, value in params.items():
+        if key == 'server_no_context_takeover' or key == 'client_no_context_takeover':
+            if value is not None:
+                raise WsFrameError('bad extension param.{}'.format(header))
+        elif key == 'server_max_window_bits' or key == 'client_max_window_bits':
+            bits = _window_bits(value)
+            if bits is None:
+                raise WsFrameError('bad extension param.{}'.format(header))
+            if key == 'client_max_window_bits':
+                client_bits = min(client_bits, bits)
+        else:
+            raise WsFrameError('bad extension param.{}'.format(header))
+    client_takeover = option.ws_deflate_context_takeover and not 'client_no_context_takeover' in params
+    server_takeover = not 'server_no_context_takeover' in params
+    return WsDeflate(client_bits, client_takeover, server_takeover, option.ws_deflate_min_size, stat)
@@ -0,0 +1,234 @@
+# -*- coding: UTF-8 -*-
+
+from enum import Enum
+import base64
+import hashlib
+import os
+import struct
+
+try:
+    import numpy                        # 可选,安装了大包用numpy去掩码
+except ImportError:
+    numpy = None
+
+class WsOpcode(Enum):
+    CONTINUATION = 0
+    TEXT = 1
+    BINARY = 2
+    CLOSE = 8
+    PING = 9
+    PONG = 10
+
+class WsDef(Enum):
+    GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+    HANDSHAKE_MAX_LEN = 8192            # 握手头的最大长度
+    CONTROL_MAX_LEN = 125               # 控制帧(close,ping,pong)内容的最大长度
+    NUMPY_MIN_LEN = 4096                # 超过这个长度且安装了numpy时,用numpy去掩码
+
+_HEAD_STRUCT = struct.Struct('!BB')
+_HEAD_STRUCT_16 = struct.Struct('!BBH')
+_HEAD_STRUCT_64 = struct.Struct('!BBQ')
+
+class WsFrameError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return 'WsFrameError: {}'.format(self.msg)
+
+
+def ws_unmask(data, mask):
+    '''整个内容当成一个大整数和重复的掩码异或,由C实现逐字处理,不在python里逐字节循环'''
+    data_len = len(data)
+    if data_len == 0:
+        return b''
+    key = (mask * ((data_len >> 2) + 1))[:data_len]
+    if numpy is not None and data_len >= WsDef.NUMPY_MIN_LEN.value:
+        return numpy.bitwise_xor(numpy.frombuffer(data, numpy.uint8), numpy.frombuffer(key, numpy.uint8)).tobytes()
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(key, 'little')).to_bytes(data_len, 'little')
+
+def ws_frame_head(opcode, length, mask=None, compressed=False):
+    '''返回帧头,内容另外发送.mask不为None时(客户端发的帧)内容要先用同一个mask去掩码.
+    compressed为True时设置RSV1,表示内容经过permessage-deflate压缩'''
+    b0 = 0x80 | opcode                  # 不分片发送,FIN总是1
+    if compressed:
+        b0 |= 0x40
+    mask_bit = 0 if mask is None else 0x80
+    if length <= 125:
+        head = _HEAD_STRUCT.pack(b0, mask_bit | length)
+    elif length <= 0xffff:
+        head = _HEAD_STRUCT_16.pack(b0, mask_bit | 126, length)
+    else:
+        head = _HEAD_STRUCT_64.pack(b0, mask_bit | 127, length)
+    if mask is not None:
+        head += mask
+    return head
+
+def ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WsDef.GUID.value).encode('utf8')).digest()).decode('utf8')
+
+def _extensions_line(extensions):
+    if extensions == '':
+        return ''
+    return 'Sec-WebSocket-Extensions: {}\r\n'.format(extensions)
+
+
+class WsHandshake:
+    '''一个连接的握手过程.数据可能分多次到达,收到完整的http头之前先缓存'''
+    __slots__ = ('__buf', '__key', 'status_line', 'headers')
+    def __init__(self):
+        self.__buf = bytearray()
+        self.__key = None                   # 客户端发出的Sec-WebSocket-Key
+        self.status_line = ''
+        self.headers = {}                   # key为小写的头名字
+
+    def feed(self, data):
+        '''http头还不完整时返回None,完整时返回头后面多出来的数据(已经是websocket帧).头超长抛出WsFrameError'''
+        self.__buf += data
+        end = self.__buf.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.__buf) > WsDef.HANDSHAKE_MAX_LEN.value:
+                raise WsFrameError('handshake too long.{}'.format(len(self.__buf)))
+            return None
+        lines = self.__buf[:end].decode('latin-1').split('\r\n')
+        remain = bytes(self.__buf[end + 4:])
+        self.__buf = bytearray()
+        self.status_line = lines[0]
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                self.headers[name.strip().lower()] = value.strip()
+        return remain
+
+    def server_response(self, extensions=''):
+        '''服务端检查客户端的握手请求,返回101响应,一次写出.请求不合法抛出WsFrameError.
+        extensions为协商好的Sec-WebSocket-Extensions,空字符串时不带'''
+        key = self.headers.get('sec-websocket-key', '')
+        if key == '' or self.headers.get('upgrade', '').lower() != 'websocket':
+            raise WsFrameError('bad handshake request.{}'.format(self.status_line))
+        return ('HTTP/1.1 101 Switching Protocols\r\n'
+                'Upgrade: websocket\r\n'
+                'Connection: Upgrade\r\n'
+                '{}'
+                'Sec-WebSocket-Accept: {}\r\n\r\n'.format(_extensions_line(extensions), ws_accept_key(key))).encode('utf8')
+
+    def client_request(self, host, port, path='/', extensions=''):
+        '''客户端的握手请求,每个连接随机生成key.extensions为请求的Sec-WebSocket-Extensions'''
+        self.__key = base64.b64encode(os.urandom(16)).decode('utf8')
+        return ('GET {} HTTP/1.1\r\n'
+                'Host: {}:{}\r\n'
+                'Upgrade: websocket\r\n'
+                'Connection: Upgrade\r\n'
+                '{}'
+                'Sec-WebSocket-Key: {}\r\n'
+                'Sec-WebSocket-Version: 13\r\n\r\n'.format(path, host, port, _extensions_line(extensions), self.__key)).encode('utf8')
+
+    def check_response(self):
+        '''客户端检查服务端的101响应,不合法抛出WsFrameError'''
+        status = self.status_line.split(' ')
+        if len(status) < 2 or status[1] != '101':
+            raise WsFrameError('handshake refused.{}'.format(self.status_line))
+        if self.headers.get('sec-websocket-accept', '') != ws_accept_key(self.__key):
+            raise WsFrameError('bad Sec-WebSocket-Accept')
+
+
+class WsFrameParser:
+    '''增量解析websocket帧.每次recv到的数据feed进来,返回已经完整的消息列表[(opcode, payload)],
+    不完整的帧留在缓冲区等下次.分片(continuation)的数据帧拼成一个消息返回,控制帧(close,ping,pong)直接返回.
+    协商了permessage-deflate时,RSV1置位的消息收完整后解压再返回'''
+    __slots__ = ('__buf', '__need_mask', '__max_len', '__deflate', '__frag_opcode', '__frag_compressed', '__frag_list', '__frag_len')
+    def __init__(self, need_mask, max_len, deflate=None):
+        '''need_mask: 服务端收的帧必须带掩码,客户端收的帧不能带掩码. max_len: 一个消息的最大长度.
+        deflate: 握手协商出的WsDeflate,没有协商时为None'''
+        self.__buf = bytearray()
+        self.__need_mask = need_mask
+        self.__max_len = max_len
+        self.__deflate = deflate
+        self.__frag_compressed = False      # 正在拼的分片消息是否压缩
+        self.__frag_opcode = None           # 正在拼的分片消息的opcode
+        self.__frag_list = []
+        self.__frag_len = 0
+
+    def feed(self, data):
+        '''协议错误抛出WsFrameError,调用者需要关闭连接'''
+        buf = self.__buf
+        buf += data
+        buf_len = len(buf)
+        msg_list = []
+        pos = 0
+        while buf_len - pos >= 2:
+            b0 = buf[pos]
+            b1 = buf[pos + 1]
+            rsv = b0 & 0x70
+            if rsv != 0 and (rsv != 0x40 or self.__deflate is None):       # 只有协商了压缩时可以有RSV1
+                raise WsFrameError('rsv bits set.{}'.format(b0))
+            masked = (b1 & 0x80) != 0
+            if masked != self.__need_mask:
+                raise WsFrameError('mask bit error.{}'.format(masked))
+            length = b1 & 0x7f
+            head_len = 2
+            if length == 126:
+                if buf_len - pos < 4:
+                    break
+                length, = struct.unpack_from('!H', buf, pos + 2)
+                head_len = 4
+            elif length == 127:
+                if buf_len - pos < 10:
+                    break
+                length, = struct.unpack_from('!Q', buf, pos + 2)
+                head_len = 10
+            if length > self.__max_len:
+                raise WsFrameError('frame too long.{}'.format(length))
+            if masked:
+                head_len += 4
+            frame_end = pos + head_len + length
+            if frame_end > buf_len:                 # 帧还没收完整
+                break
+            payload = buf[pos + head_len:frame_end]
+            if masked:
+                payload = ws_unmask(payload, bytes(buf[pos + head_len - 4:pos + head_len]))
+            else:
+                payload = bytes(payload)
+            pos = frame_end
+            self.__on_frame(b0 & 0x80, b0 & 0x0f, rsv != 0, payload, msg_list)
+        if pos > 0:
+            del buf[:pos]
+        return msg_list
+
+    def __on_frame(self, fin, opcode, compressed, payload, msg_list):
+        if opcode >= WsOpcode.CLOSE.value:
+            if opcode > WsOpcode.PONG.value:
+                raise WsFrameError('unknown opcode.{}'.format(opcode))
+            if not fin or compressed or len(payload) > WsDef.CONTROL_MAX_LEN.value:
+                raise WsFrameError('bad control frame.{}'.format(opcode))
+            msg_list.append((opcode, payload))
+            return
+        if opcode == WsOpcode.CONTINUATION.value:
+            if self.__frag_opcode is None or compressed:      # RSV1只能在消息的第一帧
+                raise WsFrameError('bad continuation')
+            self.__frag_len += len(payload)
+            if self.__frag_len > self.__max_len:
+                raise WsFrameError('message too long.{}'.format(self.__frag_len))
+            self.__frag_list.append(payload)
+            if fin:
+                self.__on_message(self.__frag_opcode, self.__frag_compressed, b''.join(self.__frag_list), msg_list)
+                self.__frag_opcode = None
+                self.__frag_list = []
+                self.__frag_len = 0
+            return
+        if opcode > WsOpcode.BINARY.value:
+            raise WsFrameError('unknown opcode.{}'.format(opcode))
+        if self.__frag_opcode is not None:
+            raise WsFrameError('new message before last fragment end')
+        if fin:
+            self.__on_message(opcode, compressed, payload, msg_list)
+            return
+        self.__frag_opcode = opcode
+        self.__frag_compressed = compressed
+        self.__frag_list = [payload]
+        self.__frag_len = len(payload)
+
+    def __on_message(self, opcode, compressed, payload, msg_list):
+        if compressed:
+            payload = self.__deflate.decompress(payload, self.__max_len)
+        msg_list.append((opcode, payload))
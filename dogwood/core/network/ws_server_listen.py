@@ -1,73 +1,130 @@
 # -*- coding: UTF-8 -*-
 
 import socket, selectors
-import hashlib, base64, struct
 import platform
 
 from dogwood.core.helper import Helper
 from dogwood.core.base_process import BaseProcess
 from dogwood.core.logger import LogInit, Logger
-from dogwood.core.network.sock_id import SockId
+from dogwood.core.network.sock_id import SockIdAlloc, sock_net_id, sock_id_str
 from dogwood.core.network.net_notify import NetNotify
 from dogwood.core.network.net_def import NeTDef
-from dogwood.core.base_packet import PacketDef
+from dogwood.core.network.net_option import NetOption
+from dogwood.core.network.send_buffer import SendBuffer
+from dogwood.core.network.idle_reaper import IdleReaper
+from dogwood.core.network.rate_limit import TokenBucket, RecvLimit, OverloadStat
+from dogwood.core.network.ws_frame import WsOpcode, WsFrameError, WsHandshake, WsFrameParser, ws_frame_head
+from dogwood.core.network.ws_deflate import WsDeflateStat, ws_deflate_accept
+from dogwood.core.base_packet import PacketDef, PacketSplit, PacketError
 
 class WSServerListen(BaseProcess):
-    __slots__ = ('__net_id', '__port', '__selector', '__sock_listen', '__conn_sid_dict', '__sid_conn_dict', '__handshakes_dict')
-    def __init__(self, log_name, event, net_id, port):
-        super().__init__(log_name, event)
+    __slots__ = ('__net_id', '__sid_alloc', '__port', '__option', '__selector', '__select_time', '__sock_listen', '__conn_sid_dict', '__sid_conn_dict', '__handshakes_dict',
+                 '__parser_dict', '__split_dict', '__send_buf_dict', '__dirty_set', '__recv_view',
+                 '__deflate_dict', '__deflate_stat', '__reaper', '__limit_dict', '__paused_dict', '__accept_bucket', '__accept_resume_milli',
+                 '__overload_stat', '__now_milli')
+    def __init__(self, log_name, event, net_id, port, option=None):
+        if option is None:
+            option = NetOption()
+        super().__init__(log_name, event, option.shm_queue_size)
         self.__net_id = net_id
+        self.__sid_alloc = SockIdAlloc(net_id)                         # 分配sock_id,记录连接地址
         self.__port = port
+        self.__option = option
         self.__selector = selectors.DefaultSelector()
+        self.__select_time = NeTDef.SELECT_TIME_OUT.value
         self.__sock_listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.__sock_listen.setblocking(False)
         self.__conn_sid_dict = {}                                       # key conn, value sock_id 
         self.__sid_conn_dict = {}                                      # key sock_id, value conn
-        self.__handshakes_dict = {}                                     # 客户端websocket握手情况,只有通过了握手的连接才能算成正式连接       
+        self.__handshakes_dict = {}                                     # key conn, value WsHandshake. 握手完成后删除,只有通过了握手的连接才能算成正式连接
+        self.__parser_dict = {}                                        # key conn, value WsFrameParser. 握手完成后创建
+        self.__split_dict = {}                                         # key conn, value PacketSplit. 只在option.split_in_net时使用
+        self.__send_buf_dict = {}                                      # key conn, value SendBuffer
+        self.__dirty_set = set()                                       # 本帧有新数据要发送的conn
+        self.__recv_view = None                                        # recv_into用的缓冲区,在process_init里创建
+        self.__deflate_dict = {}                                       # key conn, value WsDeflate. 只有协商了压缩的连接
+        self.__deflate_stat = WsDeflateStat()
+        self.__reaper = None                                           # IdleReaper,设置了option.idle_timeout或heartbeat_interval时在process_init里创建
+        self.__limit_dict = {}                                         # key conn, value RecvLimit. 设置了接收限速时使用
+        self.__paused_dict = {}                                        # key conn, value 恢复读取的时间. 接收超限暂停读取的连接
+        self.__accept_bucket = None                                    # 设置了option.accept_rate时在process_init里创建
+        self.__accept_resume_milli = 0                                 # 超过accept_rate暂停监听时,恢复监听的时间
+        self.__overload_stat = OverloadStat()
+        self.__now_milli = 0                                           # 本帧select返回后的时间,限速用
         
     def process_init(self):
+        self.__recv_view = memoryview(bytearray(self.__option.recv_size))     # 进程里所有连接共用.在子进程里创建,memoryview不能pickle
+        if self.__option.idle_timeout > 0 or self.__option.heartbeat_interval > 0:
+            self.__reaper = IdleReaper(self.__option.idle_timeout, self.__option.heartbeat_interval, Helper.get_program_milli_second())
+        if self.__option.accept_rate > 0:
+            self.__accept_bucket = TokenBucket(self.__option.accept_rate, self.__option.accept_rate, Helper.get_program_milli_second())
+        if self.__option.reuse_port:            # ListenGroup里的多个进程绑定同一端口,由内核分配新连接
+            self.__sock_listen.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.__sock_listen.bind(('0.0.0.0', self.__port))
         self.__sock_listen.listen(NeTDef.LISTEN_NUM.value)
         self.__selector.register(self.__sock_listen, selectors.EVENT_READ, self.__on_accept)
+        if self._register_wakeup(self.__selector):            # 入队列有消息时select会立即返回
+            self.__select_time = NeTDef.SELECT_IDLE_TIME_OUT.value
         Logger().info('WS %s 监听启动. 端口:%d' % (self._log_name, self.__port))
     
+    def _wait_work(self, timeout):
+        '''重载父类,在run_frame的select里等待'''
+        pass
+    
     def run_frame(self, now_milli):
         try:
-            events = self.__selector.select(NeTDef.SELECT_TIME_OUT.value)
+            events = self.__selector.select(self.__select_time)
         except Exception as e:
             Logger().error('{}.{}'.format(self.__net_id,e))
             return
+        self.__now_milli = Helper.get_program_milli_second()           # select可能等了一段时间,限速用select返回后的时间
         for key, mask in events:
             callback = key.data
             callback(key.fileobj, mask)
+        if len(self.__paused_dict) > 0:
+            self.__resume_read()
+        if self.__accept_resume_milli > 0 and self.__now_milli >= self.__accept_resume_milli:
+            self.__accept_resume_milli = 0
+            self.__selector.register(self.__sock_listen, selectors.EVENT_READ, self.__on_accept)
         # 以下处理外界的消息,发关消息或关闭socket,或者退出进程
-        notify_list = []
-        while not self._in_queue.empty():
-            nf = self._in_queue.get_nowait()
-            notify_list.append(nf)
+        notify_list = self._pull_in_msgs()
         send_count = 0
         for nf in notify_list:
             if type(nf) is str and nf.lower() == Helper.quit_signal():
                 self._run_flag = False
                 continue
             sid = nf.sid
-            if sid.net_id != self.__net_id:
-                Logger().warning('wsserver listen.net_id error.{}.{}'.format(self.__net_id, sid))
+            if sock_net_id(sid) != self.__net_id:
+                Logger().warning('wsserver listen.net_id error.{}.{}'.format(self.__net_id, sock_id_str(sid)))
                 continue
             if nf.ope == NeTDef.SERVER_CLOSE.value:
                 if not sid in self.__sid_conn_dict.keys():
-                    Logger().warning('ws SERVER_CLOSE.sid not exist. {}'.format(sid))
+                    Logger().warning('ws SERVER_CLOSE.sid not exist. {}'.format(self.__sid_alloc.desc(sid)))
                     continue
                 conn_close = self.__sid_conn_dict[sid]
+                self.__try_flush(conn_close)                # 关闭前把缓冲区里的数据尽量发出去,如踢人前的提示消息
                 self.__close_conn(conn_close)
             elif nf.ope == NeTDef.SEND.value:
                 self.__send_ws_msg(sid, nf.buf)
                 send_count += 1
                 if send_count >= NeTDef.MAX_TRANSMIT_ONE_FRAME.value:
                     continue
+            elif nf.ope == NeTDef.BROADCAST.value:
+                self.__broadcast(nf.buf)
+        if self.__reaper is not None:
+            self.__check_idle(now_milli)
+        self.__flush_dirty()
         
     def __on_accept(self, sock, mask):
         conn, addr = sock.accept()
+        if self.__option.max_connections > 0 and len(self.__conn_sid_dict) >= self.__option.max_connections:
+            conn.close()                        # 立即关闭,让客户端马上知道,而不是在backlog里等到超时
+            self.__overload_stat.accept_refused += 1
+            return
+        if self.__accept_bucket is not None and not self.__accept_bucket.consume(1, self.__now_milli):
+            self.__selector.unregister(sock)    # 这个连接照常接受,之后暂停监听,新连接留在backlog里
+            self.__accept_resume_milli = self.__now_milli + self.__accept_bucket.wait_milli(self.__now_milli)
+            self.__overload_stat.accept_paused += 1
         conn.setblocking(False)
         if platform.system().lower() == 'windows':       
             '''windows select模型超过509连接会报错'''
@@ -76,174 +133,296 @@ class WSServerListen(BaseProcess):
                 Logger().error('wsserver, windows平台超过最大select数量.{}:{}'.format(self.__net_id, conn_num))
                 conn.close()
                 return
-        sid = SockId(self.__net_id)
-        sid.set_data(addr)
+        sid = self.__sid_alloc.alloc(addr)
         self.__conn_sid_dict[conn] = sid
         self.__sid_conn_dict[sid] = conn
-        self.__selector.register(conn, selectors.EVENT_READ, self.__on_read)
+        self.__send_buf_dict[conn] = SendBuffer()
+        self.__selector.register(conn, selectors.EVENT_READ, self.__on_event)
         
-        self.__handshakes_dict[conn] = False        
+        self.__handshakes_dict[conn] = WsHandshake()
+        if self.__reaper is not None:           # 握手也受空闲超时限制
+            self.__reaper.add(conn)
+        if self.__option.split_in_net:
+            self.__split_dict[conn] = PacketSplit(self.__option.max_message_len, self.__option.lazy_packet)
+        if self.__option.recv_bytes_rate > 0 or self.__option.recv_packets_rate > 0:
+            self.__limit_dict[conn] = RecvLimit(self.__option.recv_bytes_rate, self.__option.recv_packets_rate, self.__now_milli)
+            
+    def __on_event(self, conn, mask):
+        '''conn的selector回调.有数据待发时才注册EVENT_WRITE'''
+        if mask & selectors.EVENT_READ:
+            self.__on_read(conn, mask)
+        if (mask & selectors.EVENT_WRITE) and (conn in self.__send_buf_dict):       # 读的时候可能已经关闭
+            self.__flush_conn(conn)
             
     def __on_read(self, conn, mask):
+        '''一次可读事件里循环recv_into直到读空或超出本连接的预算,数据交给握手或增量帧解析,
+        解出的消息合并成一个消息发给逻辑线程'''
         sid = self.__conn_sid_dict[conn]
+        if self.__reaper is not None:
+            self.__reaper.touch(conn)
+        recv_view = self.__recv_view
+        recv_size = len(recv_view)
+        budget = self.__option.recv_budget
+        limit = self.__limit_dict.get(conn, None)
+        if limit is not None:
+            byte_budget = limit.byte_budget(self.__now_milli)
+            if byte_budget is not None and byte_budget < budget:       # 限速时不多读,超出的数据留在内核缓冲区,由tcp流控让对端慢下来
+                budget = byte_budget
+        read_total = budget
+        msg_list = []               # option.split_in_net时为BasePacket列表,否则为bytes列表
+        peer_closed = False
         try:
-            if self.__handshakes_dict[conn] == False:        # 首先判断websocket握手
-                msg = conn.recv(PacketDef.PER_RECV_SIZE.value)
-                if (not msg) or (len(msg) == 0):
-                    self.__close_conn(conn)
-                    return
-                handshake_recv = str(msg)
-                entities = handshake_recv.split("\\r\\n")
-                sec_key_in = ''
-                for str_sub in entities:
-                    if str_sub.split(":")[0].strip() == 'Sec-WebSocket-Key':
-                        sec_key_in = str_sub.split(":")[1].strip()
-                        break
-                sec_websocket_key = sec_key_in + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
-                response_key = base64.b64encode(hashlib.sha1(bytes(sec_websocket_key, encoding="utf8")).digest())
-                response_key_str = str(response_key)
-                response_key_str = response_key_str[2:30]
-                response_key_entity = "Sec-WebSocket-Accept: " + response_key_str +"\r\n"
-                try:
-                    conn.send(bytes("HTTP/1.1 101 Web Socket Protocol Handshake\r\n", encoding="utf8"))
-                    conn.send(bytes("Upgrade: websocket\r\n", encoding="utf8"))
-                    conn.send(bytes(response_key_entity, encoding="utf8"))
-                    conn.send(bytes("Connection: Upgrade\r\n\r\n", encoding="utf8"))
-                except Exception as e:
-                    Logger().warning(e)
-                    return
-                self.__handshakes_dict[conn] = True
-                ntif = NetNotify(sid, NeTDef.CONNECT.value)    # 没能通过握手的连接不告诉主程序
-                self._out_queue.put(ntif)
-                return
-            #                    
-            receive = conn.recv(2)                              # 130是二进制流，129是text
-            if (not receive) or (len(receive) == 0):
-                self.__close_conn(conn)
-                return
-            is_mask = receive[1] & 0x80
-            if is_mask == 0:
-                Logger().warning('暂不支持不带mask的websocket.sid:{}'.format(sid))
-                self.__close_conn(conn)
-                return
-            len_tag = receive[1] & 0x7f
-            if len_tag == 0:
-                self.__close_conn(conn)
-                return
-            content_len = 0         #实际应该接收的内容长度
-            if len_tag <= 125:
-                content_len = len_tag
-            elif len_tag == 126:
-                receive, recv_ok = self.__recv_msg(conn, 2)
-                if recv_ok is False:
-                    Logger().warning('读取websocket长度出错:126.sid:{}'.format(sid))
-                    self.__close_conn(conn)
-                    return
-                content_len, = struct.unpack_from('!h', receive, 0)
-            elif len_tag == 127:
-                receive, recv_ok = self.receive_msg(conn, 8)
-                if recv_ok is False:
-                    Logger().warning('读取websocket长度出错:127.sid:{}'.format(sid))
-                    self.__close_conn(conn)
-                    return
-                content_len, = struct.unpack_from('!q', receive, 0)
-            else:
-                Logger().warning('读取websocket长度出错:too large.sid:{}'.format(sid))
-                self.__close_conn(conn)
-                return
-            mask, recv_ok = self.__recv_msg(conn, 4)
-            if recv_ok is False:
-                Logger().warning('读取websocketmask出错.sid:{}'.format(sid))
-                self.__close_conn(conn)
-                return
-            receive, recv_ok = self.__recv_msg(conn, content_len)
-            if recv_ok is False:
-                Logger().warning('读取websocket包内容出错.sid:{}'.format(sid))
-                self.__close_conn(conn)
-                return
-            byte_arr = bytearray()
-            i = 0
-            for d in receive:
-                byte_arr.append(d ^ mask[i % 4])
-                i += 1
-            data_bytes = bytes(byte_arr)
-            if (len(data_bytes) == 0):
-                self.__close_conn(conn)
-                return
-            if (len(data_bytes) == 2) and (data_bytes[0] == 0x03) and (data_bytes[1] == 0xe9 or data_bytes[1] == 0xe8):
-                self.__close_conn(conn)
-                return
-            
-            ntif = NetNotify(sid, NeTDef.RECV.value, data_bytes)        # 告诉主进程收到网络消息
-            self._out_queue.put(ntif)
+            while budget > 0:
+                read_len = recv_size if budget >= recv_size else budget
+                recv_len = conn.recv_into(recv_view, read_len)
+                if recv_len == 0:
+                    peer_closed = True
+                    break
+                budget -= recv_len
+                if not self.__on_data(conn, sid, recv_view[:recv_len], msg_list):
+                    peer_closed = True
+                    break
+                if recv_len < read_len:         # 没读满,内核缓冲区已经读空,省一次返回EAGAIN的recv
+                    break
+        except (BlockingIOError, InterruptedError):
+            pass
         except ConnectionResetError as err:     # 目标方突然强行关闭程序会发生,如果是正常关闭socket，不会产生异常
-            Logger().info('ConnectionResetError:{} {}'.format(sid, err))
-            self.__close_conn(conn)            
+            Logger().info('ConnectionResetError:{} {}'.format(self.__sid_alloc.desc(sid), err))
+            self.__close_conn(conn)
+            return
         except Exception as e:
-            Logger().info(sid, e)
+            Logger().info('{}.{}'.format(self.__sid_alloc.desc(sid), e))
+            self.__close_conn(conn)
+            return
+        if limit is not None and not self.__check_limit(conn, sid, read_total - budget, len(msg_list)):
+            return
+        self.__post_recv(sid, msg_list)
+        if peer_closed:
             self.__close_conn(conn)
             
-    def __recv_msg(self, conn, length):        
-        try: 
-            receive = conn.recv(length)
-        except ConnectionResetError as err:
-            Logger().info(err)
-            return None, False
-        except Exception as e:
-            Logger().info(e)
-            return None, False
-        return receive, True
+    def __on_data(self, conn, sid, data, msg_list):
+        '''返回False时需要关闭连接'''
+        try:
+            if conn in self.__handshakes_dict:          # 首先是websocket握手
+                handshake = self.__handshakes_dict[conn]
+                data = handshake.feed(data)
+                if data is None:                        # 握手头还没收完整
+                    return True
+                extensions, deflate = ws_deflate_accept(handshake.headers.get('sec-websocket-extensions', ''), self.__option, self.__deflate_stat)
+                self.__push_send(conn, handshake.server_response(extensions))     # 101响应一次写出
+                del self.__handshakes_dict[conn]
+                if deflate is not None:
+                    self.__deflate_dict[conn] = deflate
+                self.__parser_dict[conn] = WsFrameParser(True, self.__option.ws_max_message, deflate)
+                ntif = NetNotify(sid, NeTDef.CONNECT.value, self.__sid_alloc.addr(sid))    # 没能通过握手的连接不告诉主程序
+                self._post_msg(ntif)
+            frame_list = self.__parser_dict[conn].feed(data)
+        except WsFrameError as e:
+            Logger().warning('{}.{}'.format(self.__sid_alloc.desc(sid), e))
+            return False
+        for opcode, payload in frame_list:
+            if opcode == WsOpcode.BINARY.value or opcode == WsOpcode.TEXT.value:
+                if len(payload) == 0:
+                    continue
+                if not self.__option.split_in_net:
+                    msg_list.append(payload)
+                elif not self.__split_msg(conn, sid, payload, msg_list):
+                    return False
+            elif opcode == WsOpcode.PING.value:
+                self.__push_frame(conn, WsOpcode.PONG.value, payload)
+            elif opcode == WsOpcode.CLOSE.value:
+                self.__push_frame(conn, WsOpcode.CLOSE.value, payload[:2])      # 回应同样的关闭码
+                self.__try_flush(conn)
+                return False
+        return True
+            
+    def __post_recv(self, sid, msg_list):
+        if len(msg_list) == 0:
+            return
+        if self.__option.split_in_net:
+            ntif = NetNotify(sid, NeTDef.RECV_PACKETS.value, msg_list)
+        elif len(msg_list) == 1:
+            ntif = NetNotify(sid, NeTDef.RECV.value, msg_list[0])
+        else:
+            ntif = NetNotify(sid, NeTDef.RECV.value, b''.join(msg_list))
+        self._post_msg(ntif)
+            
+    def __split_msg(self, conn, sid, msg, pack_list):
+        '''在网络进程里做粘包处理和解码,完整的包放进pack_list.缓冲区溢出返回False,需要关闭连接'''
+        split = self.__split_dict[conn]
+        view = memoryview(msg)              # 一个websocket消息可能比粘包缓冲区大,分段放进去
+        for pos in range(0, len(view), PacketDef.SPLIT_PUSH_SIZE.value):
+            if not split.push_data(view[pos:pos + PacketDef.SPLIT_PUSH_SIZE.value]):
+                return False
+            try:
+                pack_list.extend(split.split())
+            except PacketError as e:
+                Logger().warning('{}.{}'.format(self.__sid_alloc.desc(sid), e))
+        return True
     
     def __close_conn(self, conn):
         if not conn in self.__conn_sid_dict.keys():        # 已经关闭，不重复关闭
             return
         
-        self.__selector.unregister(conn)
+        if self.__paused_dict.pop(conn, None) is None or self.__send_buf_dict[conn].wait_writable:     # 暂停读取且不等待可写时不在selector里
+            self.__selector.unregister(conn)
         sid = self.__conn_sid_dict[conn]
         conn.close()
+        self.__limit_dict.pop(conn, None)
         del self.__sid_conn_dict[sid]
         del self.__conn_sid_dict[conn]  
-        b_handshakes = self.__handshakes_dict[conn]
-        del self.__handshakes_dict[conn]
+        b_handshakes = self.__parser_dict.pop(conn, None) is not None
+        self.__handshakes_dict.pop(conn, None)
+        self.__split_dict.pop(conn, None)
+        self.__deflate_dict.pop(conn, None)
+        del self.__send_buf_dict[conn]
+        self.__dirty_set.discard(conn)
+        if self.__reaper is not None:
+            self.__reaper.remove(conn)
+        self.__sid_alloc.free(sid)
         
         if b_handshakes:                    # 没能通过握手的连接不告诉主程序
             ntif = NetNotify(sid, NeTDef.DISCONNECT.value)
-            self._out_queue.put(ntif)   
+            self._post_msg(ntif)   
     
     def __send_ws_msg(self, sock_id, buf):
-        if sock_id in self.__sid_conn_dict.keys():
-            msgLen = len(buf)
-            backMsgList = []
-            backMsgList.append(struct.pack('B', 0x82))   # 0x82是二进制流，0x81是text
-            if msgLen <= 125:
-                backMsgList.append(struct.pack('b', msgLen))
-            elif msgLen <= 65535:
-                backMsgList.append(struct.pack('b', 126))
-                backMsgList.append(struct.pack('!h', msgLen))
-            elif msgLen <= (2^64 - 1):
-                backMsgList.append(struct.pack('b', 127))
-                backMsgList.append(struct.pack('!q', msgLen))
-            else:
-                Logger().info("the message is too long to send in a time")
-                return
-            message_byte = bytes()
-            for c in backMsgList:
-                message_byte += c
-            message_byte += buf
-            try:
-                self.__sid_conn_dict[sock_id].send(message_byte)
-            except Exception as e:
-                Logger().warning(e)
+        '''帧头和内容分别放进发送缓冲区,发送时用sendmsg一起发出,不用拼接.本帧消息处理完后在__flush_dirty里统一发送'''
+        if not sock_id in self.__sid_conn_dict.keys():
+            Logger().warning('ws server __send_ws_msg. sid not exist. {}'.format(self.__sid_alloc.desc(sock_id)))
+            return
+        conn = self.__sid_conn_dict[sock_id]
+        deflate = self.__deflate_dict.get(conn, None)
+        if deflate is None:
+            self.__push_frame(conn, WsOpcode.BINARY.value, buf)
         else:
-            Logger().warning('ws server __send_ws_msg. sid not exist. {}'.format(sock_id))
+            payload, compressed = deflate.compress(buf)
+            self.__push_frame(conn, WsOpcode.BINARY.value, payload, compressed)
+        self.__check_high_water(conn)
+    
+    def __broadcast(self, broadcast_buf):
+        '''帧头只生成一次,和数据一起放进每个连接的发送缓冲区,只是引用,不拷贝.
+        协商了压缩的连接各自有压缩上下文,单独压缩'''
+        sid_list, buf = broadcast_buf
+        head = ws_frame_head(WsOpcode.BINARY.value, len(buf))
+        for sid in sid_list:
+            conn = self.__sid_conn_dict.get(sid, None)
+            if conn is None:                        # 逻辑线程还没收到DISCONNECT的连接,跳过
+                continue
+            if conn in self.__deflate_dict:
+                self.__send_ws_msg(sid, buf)
+                continue
+            self.__push_send(conn, head)
+            self.__push_send(conn, buf)
+            self.__check_high_water(conn)
+            
+    def __check_high_water(self, conn):
+        send_buf = self.__send_buf_dict[conn]
+        if send_buf.pending_len > self.__option.send_high_water:
+            Logger().warning('ws server send buffer over high water, close.{}.{}'.format(self.__sid_alloc.desc(self.__conn_sid_dict[conn]), send_buf.pending_len))
+            self.__close_conn(conn)
     
-    def quit(self):
-        self._in_queue.put(Helper.quit_signal())
+    def __push_frame(self, conn, opcode, payload, compressed=False):
+        self.__push_send(conn, ws_frame_head(opcode, len(payload), None, compressed))
+        self.__push_send(conn, payload)
         
+    def __push_send(self, conn, bys):
+        self.__send_buf_dict[conn].push(bys)
+        self.__dirty_set.add(conn)
+        
+    def __try_flush(self, conn):
+        '''关闭连接前尽量发出缓冲区里的数据,出错也不处理'''
+        try:
+            self.__send_buf_dict[conn].flush(conn)
+        except OSError:
+            pass
+    
+    def __check_idle(self, now_milli):
+        '''空闲超时的连接关闭,握手完成的连接向逻辑线程发DISCONNECT.空闲超过心跳间隔的连接发PING'''
+        expired_list, heartbeat_list = self.__reaper.check(now_milli)
+        for conn in expired_list:
+            Logger().info('ws idle timeout, close.{}'.format(self.__sid_alloc.desc(self.__conn_sid_dict[conn])))
+            self.__close_conn(conn)
+        for conn in heartbeat_list:
+            if conn in self.__parser_dict:          # 握手完成后才能发帧
+                self.__push_frame(conn, WsOpcode.PING.value, b'')
+    
+    def __check_limit(self, conn, sid, byte_count, packet_count):
+        '''接收超限时按option.rate_limit_close关闭连接,返回False,这次收到的数据丢弃,不发给逻辑线程;
+        或者暂停读取直到令牌补回,由tcp流控让对端慢下来'''
+        wait_milli = self.__limit_dict[conn].consume(byte_count, packet_count, self.__now_milli)
+        if wait_milli == 0:
+            return True
+        if self.__option.rate_limit_close:
+            Logger().warning('recv over limit, close.{}'.format(self.__sid_alloc.desc(sid)))
+            self.__overload_stat.dropped += 1
+            self.__close_conn(conn)
+            return False
+        self.__overload_stat.throttled += 1
+        self.__paused_dict[conn] = self.__now_milli + wait_milli
+        self.__update_events(conn)
+        return True
+    
+    def __resume_read(self):
+        resume_list = [conn for conn, resume_milli in self.__paused_dict.items() if resume_milli <= self.__now_milli]
+        for conn in resume_list:
+            del self.__paused_dict[conn]
+            self.__update_events(conn)
+    
+    def __update_events(self, conn):
+        '''根据是否暂停读取和是否等待可写,修改conn在selector里注册的事件.两者都没有时不在selector里'''
+        events = 0 if conn in self.__paused_dict else selectors.EVENT_READ
+        if self.__send_buf_dict[conn].wait_writable:
+            events |= selectors.EVENT_WRITE
+        try:
+            key = self.__selector.get_key(conn)
+        except KeyError:
+            if events != 0:
+                self.__selector.register(conn, events, self.__on_event)
+            return
+        if events == 0:
+            self.__selector.unregister(conn)
+        elif events != key.events:
+            self.__selector.modify(conn, events, self.__on_event)
+    
+    def __flush_dirty(self):
+        dirty_set = self.__dirty_set
+        self.__dirty_set = set()            # __flush_conn里可能会关闭连接,从__dirty_set里删除
+        for conn in dirty_set:
+            self.__flush_conn(conn)
+    
+    def __flush_conn(self, conn):
+        send_buf = self.__send_buf_dict[conn]
+        try:
+            done = send_buf.flush(conn)
+        except OSError as e:
+            Logger().info('{}.{}'.format(self.__sid_alloc.desc(self.__conn_sid_dict[conn]), e))
+            self.__close_conn(conn)
+            return
+        if done == send_buf.wait_writable:          # 发完了取消EVENT_WRITE,没发完注册EVENT_WRITE
+            send_buf.wait_writable = not done
+            self.__update_events(conn)
+    
+    def _log_stat(self):
+        '''重载父类,定时打印压缩节省的字节数和每个消息的压缩耗时,设置了过载保护时打印丢弃统计'''
+        if self.__option.ws_deflate:
+            Logger().info('{}.ws deflate.{}'.format(self._log_name, self.__deflate_stat))
+            self.__deflate_stat.reset()
+        if self.__limit_enabled():
+            Logger().info('{}.overload.{}'.format(self._log_name, self.__overload_stat))
+            self.__overload_stat.reset()
+    
+    def __limit_enabled(self):
+        option = self.__option
+        return option.max_connections > 0 or option.accept_rate > 0 or option.recv_bytes_rate > 0 or option.recv_packets_rate > 0
+    
     @property
     def net_id(self):
         return self.__net_id
     
+    @property
+    def option(self):
+        return self.__option
+    
     @property
     def port(self):
         return self.__port
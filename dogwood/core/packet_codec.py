@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import re
+import struct
+
+try:
+    import orjson                       # 可选,安装了json编码就使用
+except ImportError:
+    orjson = None
+try:
+    import ujson                        # 可选,没有orjson时使用
+except ImportError:
+    ujson = None
+try:
+    import msgpack                      # 可选,安装了才注册msgpack编码
+except ImportError:
+    msgpack = None
+
+class PacketCodec:
+    '''BasePacket内容的编码.收到的包按内容的第一个字节识别编码,不同编码的第一个字节不能相同.
+    子类实现dumps/loads,用register_codec注册'''
+    __slots__ = ()
+    name = ''
+    first_bytes = ()                    # 编码后内容可能的第一个字节
+
+    def dumps(self, data):
+        '''子类需重载,dict编码为bytes'''
+        pass
+
+    def loads(self, buffer):
+        '''子类需重载,buffer为memoryview,返回dict,数据错误时抛出异常,由BasePacket转为PacketError'''
+        pass
+
+    def peek_ids(self, buffer):
+        '''不解码整个内容,只读取开头的m,n,用于BasePacket延迟解码时路由.
+        m,n不在开头等读不到的情况返回None,由调用者完整解码后再取'''
+        return None
+
+
+class JsonCodec(PacketCodec):
+    '''json编码,lib为orjson,ujson或json,不同的库编出来的都是json,可以互相解码.
+    默认按orjson,ujson,json的顺序使用能导入的第一个.
+    orjson把超过64位的整数解码为float,默认时只用来编码,解码用json保持精度,JsonCodec(lib=orjson)时解码也用orjson'''
+    __slots__ = ('__lib', '__dumps', '__loads')
+    name = 'json'
+    first_bytes = (ord('{'),)
+
+    def __init__(self, lib=None):
+        orjson_loads = lib is orjson
+        if lib is None:
+            lib = orjson or ujson or json
+        self.__lib = lib
+        if lib is orjson:
+            self.__dumps = self.__orjson_dumps
+            self.__loads = orjson.loads if orjson_loads else self.__json_loads      # orjson可以直接解码memoryview
+        elif lib is ujson:
+            self.__dumps = self.__ujson_dumps
+            self.__loads = self.__ujson_loads
+        else:
+            self.__dumps = self.__json_dumps
+            self.__loads = self.__json_loads
+
+    def dumps(self, data):
+        return self.__dumps(data)
+
+    def loads(self, buffer):
+        return self.__loads(buffer)
+
+    @staticmethod
+    def __json_dumps(data):
+        return json.dumps(data, ensure_ascii=False).encode(encoding='utf8')
+
+    @staticmethod
+    def __json_loads(buffer):
+        return json.loads(str(buffer, encoding='utf8'))
+
+    @staticmethod
+    def __orjson_dumps(data):
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)     # 和json一样支持非字符串的key
+        except TypeError:                               # 如超过64位的整数,orjson不支持
+            return json.dumps(data, ensure_ascii=False).encode(encoding='utf8')
+
+    @staticmethod
+    def __ujson_dumps(data):
+        return ujson.dumps(data, ensure_ascii=False).encode(encoding='utf8')
+
+    @staticmethod
+    def __ujson_loads(buffer):
+        return ujson.loads(bytes(buffer))
+
+    # BasePacket.set_id先设置m,n,各个json库都按插入顺序输出,所以内容开头是{"m":1,"n":2
+    __IDS_PATTERN = re.compile(rb'\{\s*"m"\s*:\s*(-?\d+)\s*,\s*"n"\s*:\s*(-?\d+)\s*[,}]')
+
+    def peek_ids(self, buffer):
+        match = self.__IDS_PATTERN.match(buffer)
+        if match is None:
+            return None
+        return int(match.group(1)), int(match.group(2))
+
+    @property
+    def lib_name(self):
+        return self.__lib.__name__
+
+
+class MsgpackCodec(PacketCodec):
+    '''msgpack编码,dict编码后第一个字节为fixmap(0x80-0x8f),map16(0xde)或map32(0xdf)'''
+    __slots__ = ()
+    name = 'msgpack'
+    first_bytes = tuple(range(0x80, 0x90)) + (0xde, 0xdf)
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, buffer):
+        data = msgpack.unpackb(buffer, raw=False, strict_map_key=False)
+        if type(data) is not dict:
+            raise ValueError('msgpack content not dict.{}'.format(type(data)))
+        return data
+
+    # 无符号整数的格式,key 第一个字节, value 解码用的Struct
+    __UINT_STRUCT_DICT = {0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q')}
+    __MAP_HEAD_LEN_DICT = {0xde: 3, 0xdf: 5}        # map16,map32头的长度,fixmap为1
+
+    def peek_ids(self, buffer):
+        '''开头为map头,0xa1 'm' 整数,0xa1 'n' 整数'''
+        try:
+            pos = self.__MAP_HEAD_LEN_DICT.get(buffer[0], 1)
+            mid, pos = self.__peek_key_int(buffer, pos, ord('m'))
+            if mid is None:
+                return None
+            nid, pos = self.__peek_key_int(buffer, pos, ord('n'))
+            if nid is None:
+                return None
+        except (IndexError, struct.error):
+            return None
+        return mid, nid
+
+    @classmethod
+    def __peek_key_int(cls, buffer, pos, key):
+        '''读取一个字符的key和整数value,返回(value, 下一个位置),格式不对返回(None, pos)'''
+        if buffer[pos] != 0xa1 or buffer[pos + 1] != key:
+            return None, pos
+        pos += 2
+        byte = buffer[pos]
+        if byte <= 0x7f:                        # positive fixint
+            return byte, pos + 1
+        if byte >= 0xe0:                        # negative fixint
+            return byte - 0x100, pos + 1
+        uint_struct = cls.__UINT_STRUCT_DICT.get(byte, None)
+        if uint_struct is None:                 # 有符号整数等其它格式,较少见,不处理
+            return None, pos
+        return uint_struct.unpack_from(buffer, pos + 1)[0], pos + 1 + uint_struct.size
+
+
+_RESERVED_BYTES = (0, 1)                # StructPacket和分片包的标记(PacketDef.STRUCT_FLAG, CHUNK_FLAG),不能作为编码的第一个字节
+_codec_dict = {}                        # key 编码名, value PacketCodec
+_first_byte_list = [None] * 256         # 下标为内容的第一个字节, value PacketCodec
+
+def register_codec(codec):
+    '''注册编码,同名的替换.第一个字节和其它编码冲突时抛出ValueError'''
+    for byte in codec.first_bytes:
+        if byte in _RESERVED_BYTES:
+            raise ValueError('codec first byte reserved.{}.{}'.format(codec.name, byte))
+        other = _first_byte_list[byte]
+        if other is not None and other.name != codec.name:
+            raise ValueError('codec first byte conflict.{}.{}.{}'.format(codec.name, other.name, byte))
+    old = _codec_dict.get(codec.name, None)
+    if old is not None:
+        for byte in old.first_bytes:
+            _first_byte_list[byte] = None
+    _codec_dict[codec.name] = codec
+    for byte in codec.first_bytes:
+        _first_byte_list[byte] = codec
+
+def get_codec(name):
+    '''没有注册(如msgpack没有安装)返回None'''
+    return _codec_dict.get(name, None)
+
+def codec_of(first_byte):
+    '''按内容的第一个字节识别编码,不能识别返回None'''
+    return _first_byte_list[first_byte]
+
+def codec_names():
+    return list(_codec_dict.keys())
+
+register_codec(JsonCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
@@ -4,6 +4,7 @@ from dogwood.core.helper import Helper
 from dogwood.core.logger import Logger
 from dogwood.core.meta_class import Singleton
 from dogwood.core.lock import MyLock
+from dogwood.core.timer_wheel import TimerWheel
 
 class TimerEvent:
     '''Timer事件类,可指定执行次数'''
@@ -32,56 +33,47 @@ class TimerEvent:
       
       
 class TimerGroup:
-    '''无做线程安全'''
-    __slots__ = ('__run_dict', '__add_dict')
+    '''无做线程安全.timer放在时间轮里,run_timer只处理到期的,耗时和timer总数无关'''
+    __slots__ = ('__wheel', '__event_dict')
     def __init__(self):
-        self.__run_dict = {}                  # 事件字典,以event_name为key
-        self.__add_dict = {}                    # 准备排队加的字典，以event_name为key
+        self.__wheel = TimerWheel(Helper.get_program_milli_second())
+        self.__event_dict = {}                  # 事件字典,以event_name为key,value TimerHandle
+    
+    @property
+    def wheel(self):
+        '''时间轮,不需要名字的timer(如每个客户端的timer)可以直接加进去,由本对象的run_timer执行'''
+        return self.__wheel
     
     def add_timer_event(self, event_name, ticker, func, exe_num=0):
         '''添加timer事件, 返回是否成功'''
-        n_exist = False
-        if event_name in self.__run_dict.keys():
-            n_exist = True
-        if event_name in self.__add_dict.keys():
-            n_exist = True
-        if n_exist:
+        if event_name in self.__event_dict.keys():
             Logger().error('event_name exist. {}'.format(event_name))
             return False
-        
-        timer_event = TimerEvent(event_name, ticker, func, exe_num)
-        self.__add_dict[event_name] = timer_event
+        handle = self.__wheel.add_timer(ticker, func, exe_num)
+        handle.name = event_name
+        handle.on_end = self.__on_end
+        self.__event_dict[event_name] = handle
         return True
         
     def remove_timer_event(self, event_name):
-        if event_name in self.__run_dict.keys():
-            del self.__run_dict[event_name]
-        if event_name in self.__add_dict.keys():
-            del self.__add_dict[event_name]
+        handle = self.__event_dict.pop(event_name, None)
+        if handle is not None:
+            handle.cancel()
+            
+    def __on_end(self, handle):
+        if self.__event_dict.get(handle.name, None) is handle:
+            del self.__event_dict[handle.name]
         
     def run_timer(self, now_milli):
-        run_arr = []
-        add_arr =[]
-        del_arr = []
-        for v in self.__run_dict.values():
-            run_arr.append(v)
-        for v in self.__add_dict.values():
-            add_arr.append(v)
-        self.__add_dict.clear()
-        
-        for it in run_arr:
-            it.run_timer(now_milli)
-            if it.is_end:
-                del_arr.append(it.event_name)
-                
-        for d in del_arr:
-            del self.__run_dict[d]
-        for a in add_arr:
-            self.__run_dict[a.event_name] = a
+        self.__wheel.run_timer(now_milli)
+            
+    def next_wait(self, now_milli):
+        '''距离下一个事件触发的毫秒数,没有事件时返回None'''
+        return self.__wheel.next_wait(now_milli)
         
         
 class TimerGroupS:
-    '''有做线程安全'''
+    '''有做线程安全.其它线程要在某个线程里定时执行,用BaseThread.call_later_threadsafe,不用加锁'''
     __slots__ = ('__run_dict', '__add_dict', '__run_lock', '__add_lock')
     def __init__(self):
         self.__run_dict = {}                  # 事件字典,以event_name为key
@@ -0,0 +1,194 @@
+# -*- coding: UTF-8 -*-
+
+'''
+分层时间轮,精度1毫秒.增加,取消都是O(1),run_timer的耗时只和经过的毫秒数及到期的timer数有关,和timer总数无关.
+第0层256个槽,每槽1毫秒;第1-4层各64个槽,每槽是下一层转一圈的时间,共可表示2^32毫秒(约49天),更远的放在最高层,转到时重新放置.
+高层的槽转到时,把里面的timer按到期时间重新放到低层(cascade)
+'''
+
+from dogwood.core.helper import Helper
+from dogwood.core.logger import Logger
+
+WHEEL0_BITS = 8
+WHEEL_BITS = 6
+WHEEL_LEVEL = 5
+WHEEL0_MASK = (1 << WHEEL0_BITS) - 1
+WHEEL_MASK = (1 << WHEEL_BITS) - 1
+MAX_DELTA = 1 << (WHEEL0_BITS + WHEEL_BITS * (WHEEL_LEVEL - 1))
+NEXT_WAIT_SCAN = 64                     # next_wait最多向后查找的毫秒数,超过时返回此值,由调用者提前醒来
+
+
+class TimerHandle:
+    '''add_timer返回的句柄,用cancel取消'''
+    __slots__ = ('name', 'func', 'args', 'ticker', 'exe_num', 'exe_count', 'expire', 'on_end', '_wheel', '_slot', '_level', '_ended')
+    def __init__(self, wheel, ticker, func, exe_num, args):
+        self.name = None                    # 日志用,TimerGroup里为event_name
+        self.func = func
+        self.args = args
+        self.ticker = ticker                # 间隔时间,单位毫秒
+        self.exe_num = exe_num              # 执行次数, 0表示无限次数
+        self.exe_count = 0                  # 执行计数
+        self.expire = 0                     # 下次触发的毫秒数
+        self.on_end = None                  # 执行次数到了时调用,参数为本句柄,cancel时不调用
+        self._wheel = wheel
+        self._slot = None                   # 所在的槽,正在执行,已结束或取消时为None
+        self._level = 0                     # 所在的层
+        self._ended = False                 # 已结束或取消
+
+    @property
+    def active(self):
+        return not self._ended
+
+    def cancel(self):
+        '''可以重复调用,也可以在timer函数里调用'''
+        if self._ended:
+            return
+        self._ended = True
+        if self._slot is not None:          # 在timer函数里取消自己时不在槽里
+            del self._slot[self]
+            self._slot = None
+            self._wheel._on_cancel(self._level)
+
+
+class TimerWheel:
+    '''无做线程安全,一个线程一个,由BaseThread持有,线程里的所有timer共用'''
+    __slots__ = ('__wheels', '__current', '__count', '__count0')
+    def __init__(self, now_milli):
+        # 每个槽是dict,key TimerHandle,value None.dict保持插入顺序,同一毫秒到期的按增加顺序执行
+        self.__wheels = [[{} for _ in range(WHEEL0_MASK + 1)]]
+        for _ in range(WHEEL_LEVEL - 1):
+            self.__wheels.append([{} for _ in range(WHEEL_MASK + 1)])
+        self.__current = now_milli          # 下一个要处理的毫秒,之前到期的都已经执行
+        self.__count = 0
+        self.__count0 = 0                   # 第0层的timer数,为0时run_timer直接跳到第0层转完一圈
+
+    def __len__(self):
+        return self.__count
+
+    def add_timer(self, ticker, func, exe_num=0, args=(), now_milli=None):
+        '''每ticker毫秒执行一次func(*args),共exe_num次,0表示无限次数.ticker为0时每帧执行一次.
+        now_milli为None时取当前时间,返回TimerHandle'''
+        if now_milli is None:
+            now_milli = Helper.get_program_milli_second()
+        handle = TimerHandle(self, ticker, func, exe_num, args)
+        handle.expire = now_milli + max(ticker, 1)
+        self.__place(handle)
+        self.__count += 1
+        return handle
+
+    def call_later(self, delay_milli, func, *args):
+        '''delay_milli毫秒后执行一次func(*args)'''
+        return self.add_timer(delay_milli, func, 1, args)
+
+    def _on_cancel(self, level):
+        self.__count -= 1
+        if level == 0:
+            self.__count0 -= 1
+
+    def __place(self, handle):
+        current = self.__current
+        expire = handle.expire
+        delta = expire - current
+        if delta < 0:                       # 已经到期的,放到下一个要处理的槽
+            expire = current
+            delta = 0
+        elif delta >= MAX_DELTA:            # 太远的放到最高层最远的槽,转到时重新放置
+            expire = current + MAX_DELTA - 1
+            delta = MAX_DELTA - 1
+        if delta <= WHEEL0_MASK:
+            slot = self.__wheels[0][expire & WHEEL0_MASK]
+            level = 0
+            self.__count0 += 1
+        else:
+            level = 1
+            shift = WHEEL0_BITS
+            while delta >= 1 << (shift + WHEEL_BITS):
+                level += 1
+                shift += WHEEL_BITS
+            slot = self.__wheels[level][(expire >> shift) & WHEEL_MASK]
+        slot[handle] = None
+        handle._slot = slot
+        handle._level = level
+
+    def __cascade(self):
+        '''第0层转完一圈时调用,把上层当前槽里的timer重新放置,上层也转完一圈时继续向上'''
+        shift = WHEEL0_BITS
+        for level in range(1, WHEEL_LEVEL):
+            index = (self.__current >> shift) & WHEEL_MASK
+            wheel = self.__wheels[level]
+            slot = wheel[index]
+            if len(slot) > 0:
+                wheel[index] = {}
+                for handle in slot:
+                    self.__place(handle)
+            if index != 0:
+                break
+            shift += WHEEL_BITS
+
+    def run_timer(self, now_milli):
+        '''执行到now_milli为止到期的timer'''
+        if self.__count == 0:               # 没有timer时直接跳到当前时间
+            if now_milli >= self.__current:
+                self.__current = now_milli + 1
+            return
+        wheel0 = self.__wheels[0]
+        while self.__current <= now_milli:
+            tick = self.__current
+            index = tick & WHEEL0_MASK
+            if index == 0:
+                self.__cascade()
+            elif self.__count0 == 0:        # 第0层是空的,跳到转完一圈,只有远期timer时空闲的帧不用逐毫秒处理
+                self.__current = min((tick | WHEEL0_MASK) + 1, now_milli + 1)      # 不能超过当前时间,之后增加的timer要按当前时间放置
+                continue
+            slot = wheel0[index]
+            self.__current = tick + 1       # timer函数里增加的已到期timer放到下一毫秒,不会在这个槽里无限执行
+            if len(slot) == 0:
+                continue
+            wheel0[index] = {}
+            self.__count0 -= len(slot)
+            handle_list = list(slot)
+            for handle in handle_list:      # 先都移出槽,timer函数里取消同一槽里的其它timer时不再从槽里删除
+                handle._slot = None
+            for handle in handle_list:
+                if handle._ended:           # 被同一槽里前面的timer函数取消了
+                    self.__count -= 1
+                    continue
+                self.__fire(handle, now_milli)
+            if self.__count == 0:
+                self.__current = now_milli + 1
+                break
+
+    def __fire(self, handle, now_milli):
+        handle._slot = None
+        self.__count -= 1
+        try:
+            handle.func(*handle.args)
+        except Exception as e:
+            Logger().error('%s:%s:%s' % (handle.name, repr(handle.func), e))
+        handle.exe_count += 1
+        if handle._ended:                   # timer函数里cancel了自己
+            return
+        if handle.exe_num != 0 and handle.exe_count >= handle.exe_num:
+            handle._ended = True
+            if handle.on_end is not None:
+                handle.on_end(handle)
+            return
+        handle.expire = now_milli + max(handle.ticker, 1)      # 和TimerEvent一样从本次执行的时间开始计算下一次
+        self.__place(handle)
+        self.__count += 1
+
+    def next_wait(self, now_milli):
+        '''距离下一个timer到期的毫秒数,没有timer时返回None.超过NEXT_WAIT_SCAN毫秒的返回NEXT_WAIT_SCAN'''
+        if self.__count == 0:
+            return None
+        if self.__count0 == 0:
+            return max(min((self.__current | WHEEL0_MASK) + 1, self.__current + NEXT_WAIT_SCAN) - now_milli, 0)
+        wheel0 = self.__wheels[0]
+        tick = self.__current
+        for _ in range(NEXT_WAIT_SCAN):
+            if (tick & WHEEL0_MASK) == 0 and tick != self.__current:
+                break                       # 要cascade了,之后的槽可能还没放进来
+            if len(wheel0[tick & WHEEL0_MASK]) > 0:
+                break
+            tick += 1
+        return max(tick - now_milli, 0)
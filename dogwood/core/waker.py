@@ -0,0 +1,35 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+
+class Waker:
+    '''自唤醒管道,用socketpair实现,跨进程跨线程都可以用,windows下也能放进select.
+    等待方把reader放进select/multiprocessing.connection.wait,通知方调用wake写一个字节,
+    等待方醒来后调用clear读空'''
+    __slots__ = ('__reader', '__writer')
+    def __init__(self):
+        self.__reader, self.__writer = socket.socketpair()
+        self.__reader.setblocking(False)
+        self.__writer.setblocking(False)
+
+    def wake(self):
+        try:
+            self.__writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):         # 缓冲区满,说明已经有未处理的唤醒
+            pass
+
+    def clear(self):
+        while True:
+            try:
+                if not self.__reader.recv(4096):
+                    break
+            except (BlockingIOError, InterruptedError):
+                break
+
+    def close(self):
+        self.__reader.close()
+        self.__writer.close()
+
+    @property
+    def reader(self):
+        return self.__reader
@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+
+'''
+逐个连接发SEND和一次BROADCAST的对比测试
+本进程充当逻辑线程,每轮把同一个包发给网络进程上的所有连接,
+统计逻辑线程发出所有轮次的耗时,以及客户端进程收完所有数据的总耗时
+运行: python broadcast_bench.py [连接数] [轮数]
+'''
+
+from multiprocessing import Process, Queue, Event
+import selectors
+import socket
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_packet import BasePacket
+from dogwood.core.network.net_def import NeTDef
+from dogwood.core.network.net_notify import NetNotify
+from dogwood.core.network.sock_id import net_sock_id
+from dogwood.core.network.server_listen import ServerListen
+from dogwood.core.network.ws_server_listen import WSServerListen
+from dogwood.core.network.ws_frame import WsOpcode, WsHandshake, ws_frame_head
+
+BASE_PORT = 19700
+
+def make_payload():
+    pack = BasePacket()
+    pack.set_id(2, 1)
+    pack['players'] = [{'id': i, 'x': i * 3, 'y': i * 7, 'hp': 100} for i in range(5)]
+    return pack.pack()
+
+def client_main(port, conn_num, total_len, is_ws, result_que):
+    '''total_len为每个连接要收的字节数(websocket包括帧头),全部收完后返回结束时间'''
+    selector = selectors.DefaultSelector()
+    recv_dict = {}
+    for i in range(conn_num):
+        sock = socket.create_connection(('127.0.0.1', port))
+        if is_ws:
+            sock.sendall(WsHandshake().client_request('127.0.0.1', port))
+            handshake = WsHandshake()
+            while handshake.feed(sock.recv(4096)) is None:
+                pass
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        recv_dict[sock] = 0
+    result_que.put('ready')
+    done = 0
+    while done < conn_num:
+        for key, mask in selector.select(1):
+            sock = key.fileobj
+            recv_dict[sock] += len(sock.recv(1 << 20))
+            if recv_dict[sock] >= total_len:
+                selector.unregister(sock)
+                done += 1
+    result_que.put(time.time())
+    for sock in recv_dict.keys():
+        sock.close()
+
+def run_bench(name, listen_cls, port, conn_num, rounds, use_broadcast):
+    payload = make_payload()
+    frame_len = len(payload)
+    if listen_cls is WSServerListen:
+        frame_len += len(ws_frame_head(WsOpcode.BINARY.value, len(payload)))
+    event = Event()
+    net_proc = listen_cls(name, event, 1, port)
+    net_proc.start()
+    event.wait()
+    result_que = Queue()
+    clt = Process(target=client_main, args=(port, conn_num, frame_len * rounds, listen_cls is WSServerListen, result_que))
+    clt.start()
+    result_que.get()
+    sid_list = []
+    while len(sid_list) < conn_num:
+        for nf in net_proc.pull_msgs():
+            if nf.ope == NeTDef.CONNECT.value:
+                sid_list.append(nf.sid)
+        time.sleep(0.01)
+    begin = time.time()
+    for i in range(rounds):
+        if use_broadcast:
+            net_proc.push_msg(NetNotify(net_sock_id(1), NeTDef.BROADCAST.value, (sid_list, payload)))
+        else:
+            for sid in sid_list:
+                net_proc.push_msg(NetNotify(sid, NeTDef.SEND.value, payload))
+        net_proc.flush_msg()
+    logic_cost = time.time() - begin
+    end = result_que.get()
+    clt.join()
+    net_proc.quit()
+    net_proc.join()
+    net_proc.close_queues()
+    print('{:>24}: 逻辑线程 {:.1f}ms/轮, 全部收完 {:.1f}ms/轮'.format(name, logic_cost * 1000 / rounds, (end - begin) * 1000 / rounds))
+
+def main():
+    conn_num = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    LogInit('broadcast_bench')
+    print('连接数:{}, 轮数:{}, 包长:{}'.format(conn_num, rounds, len(make_payload())))
+    run_bench('ServerListen SEND', ServerListen, BASE_PORT, conn_num, rounds, False)
+    run_bench('ServerListen BROADCAST', ServerListen, BASE_PORT + 1, conn_num, rounds, True)
+    run_bench('WSServerListen SEND', WSServerListen, BASE_PORT + 2, conn_num, rounds, False)
+    run_bench('WSServerListen BROADCAST', WSServerListen, BASE_PORT + 3, conn_num, rounds, True)
+
+if __name__ == '__main__':
+    main()
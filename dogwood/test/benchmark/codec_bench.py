@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+
+'''
+BasePacket各编码的打包,解包耗时和包长对比.
+json分别用json,ujson,orjson测试(没有安装的跳过),msgpack安装了才测试
+运行: python codec_bench.py [包数量]
+'''
+
+import json
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_packet import BasePacket
+from dogwood.core import packet_codec
+from dogwood.core.packet_codec import JsonCodec, register_codec, get_codec
+
+def make_packets(pack_num):
+    '''常见的几种包: 只有id的请求,带几个字段的请求,带列表的推送'''
+    pack_list = []
+    for i in range(pack_num):
+        pack = BasePacket()
+        kind = i % 3
+        if kind == 0:
+            pack.set_id(1001, 1)
+        elif kind == 1:
+            pack.set_id(1002, 3)
+            pack['uid'] = 100000 + i
+            pack['item_id'] = 20031
+            pack['count'] = 5
+            pack['name'] = '铁剑'
+        else:
+            pack.set_id(2001, 7)
+            pack['players'] = [{'id': 100000 + j, 'x': j * 3.5, 'y': j * 7.25, 'hp': 100} for j in range(5)]
+        pack_list.append(pack)
+    return pack_list
+
+def run(name, codec_name, pack_list):
+    begin = time.perf_counter()
+    buf_list = [pack.pack(codec_name) for pack in pack_list]
+    pack_cost = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for buf in buf_list:
+        BasePacket().unpack(buf)
+    unpack_cost = time.perf_counter() - begin
+    pack_num = len(pack_list)
+    print('{:>8}: 平均包长:{:.1f} 打包:{:.2f}us/包 解包:{:.2f}us/包'.format(
+        name, sum([len(buf) for buf in buf_list]) / pack_num, pack_cost * 1000000 / pack_num, unpack_cost * 1000000 / pack_num))
+
+def main():
+    LogInit('codec_bench')
+    pack_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    pack_list = make_packets(pack_num)
+    print('包数量:{}'.format(pack_num))
+    default_codec = get_codec('json')
+    for lib in (json, packet_codec.ujson, packet_codec.orjson):
+        if lib is None:
+            continue
+        register_codec(JsonCodec(lib))
+        run(lib.__name__, 'json', pack_list)
+    register_codec(default_codec)
+    if get_codec('msgpack') is not None:
+        run('msgpack', 'msgpack', pack_list)
+    else:
+        print('msgpack没有安装,跳过')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: UTF-8 -*-
+
+'''
+协程每一步恢复的耗时对比: 经过_corou_notify_queue(原来本线程里push_corou_msg的做法,每一步要等到下一帧)
+和resume_corou在本帧内直接恢复.模拟一个多步登陆流程,每一步发起请求后立即得到回复
+运行: python corou_bench.py [步数]
+'''
+
+import sys
+import threading
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_thread import BaseThread, CoroutineNotify, CoroutineOpe
+from dogwood.core.coroutine import CorouWait
+
+class LogicThread(BaseThread):
+    pass
+
+def run(name, logic, step_num, reply_func):
+    done = threading.Event()
+    result = {}
+    async def flow():
+        begin = time.perf_counter()
+        for i in range(step_num):
+            await CorouWait(0, reply_func)
+        result['cost'] = time.perf_counter() - begin
+        done.set()
+    logic.call_soon_threadsafe(logic.add_corou, flow())
+    done.wait()
+    print('{:>6}: {:.2f}us/步'.format(name, result['cost'] * 1000000 / step_num))
+
+def main():
+    LogInit('corou_bench')
+    step_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    event = threading.Event()
+    logic = LogicThread(event)
+    logic.start()
+    event.wait()
+    print('步数:{}'.format(step_num))
+    def queue_reply(cid):
+        logic._corou_notify_queue.put(CoroutineNotify(CoroutineOpe.COROUTINE_PUSH_MSG.value, cid, cid))
+    def direct_reply(cid):
+        logic.resume_corou(cid, cid)
+    run('queue', logic, step_num, queue_reply)
+    run('direct', logic, step_num, direct_reply)
+    logic.quit()
+    logic.join()
+
+if __name__ == '__main__':
+    main()
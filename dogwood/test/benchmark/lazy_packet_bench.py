@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+
+'''
+BasePacket延迟解码和完整解码的路由耗时对比.
+模拟网关: 粘包处理后按mid分发,大部分包只看mid,nid后原样转发(raw),少数包要读取内容
+运行: python lazy_packet_bench.py [包数量] [读取内容的比例,默认0.1]
+'''
+
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_packet import BasePacket, PacketSplit
+
+def make_stream(pack_num):
+    buf_list = []
+    for i in range(pack_num):
+        pack = BasePacket()
+        pack.set_id(1000 + i % 8, i % 5)
+        pack['uid'] = 100000 + i
+        pack['players'] = [{'id': 100000 + j, 'x': j * 3.5, 'y': j * 7.25, 'hp': 100} for j in range(5)]
+        buf_list.append(pack.pack())
+    return b''.join(buf_list)
+
+def run(name, stream, lazy, read_ratio):
+    split = PacketSplit(lazy=lazy)
+    read_every = int(1 / read_ratio) if read_ratio > 0 else 0
+    route_count = [0] * 8
+    forward_bytes = 0
+    count = 0
+    begin = time.perf_counter()
+    for pos in range(0, len(stream), 4096):
+        split.push_data(stream[pos:pos + 4096])
+        for pack in split.split():
+            count += 1
+            route_count[pack.mid - 1000] += 1
+            if read_every > 0 and count % read_every == 0:
+                pack.get('uid', 0)
+            elif lazy:
+                forward_bytes += len(pack.raw)
+            else:
+                forward_bytes += len(pack.pack())               # 完整解码的包转发要重新编码
+    cost = time.perf_counter() - begin
+    print('{:>6}: {:.2f}us/包 包数:{} 转发字节:{}'.format(name, cost * 1000000 / count, count, forward_bytes))
+
+def main():
+    LogInit('lazy_packet_bench')
+    pack_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    read_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    stream = make_stream(pack_num)
+    print('包数量:{} 读取内容的比例:{}'.format(pack_num, read_ratio))
+    run('full', stream, False, read_ratio)
+    run('lazy', stream, True, read_ratio)
+
+if __name__ == '__main__':
+    main()
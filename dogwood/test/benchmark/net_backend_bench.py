@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+
+'''
+selectors实现的ServerListen和asyncio实现的AioServerListen的对比测试
+压测进程开多个连接,每个连接发一个包,收到完整回包后再发下一个.
+本进程充当逻辑线程,把网络进程收到的数据原样发回,统计每秒往返次数
+运行: python net_backend_bench.py [连接数] [秒数]
+'''
+
+from multiprocessing import Process, Queue, Event
+from multiprocessing.connection import wait
+import selectors
+import socket
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.network.net_def import NeTDef
+from dogwood.core.network.net_notify import NetNotify
+from dogwood.core.network.server_listen import ServerListen
+from dogwood.core.network.aio_server_listen import AioServerListen
+from dogwood.core.network import aio_net_process
+
+PAYLOAD = b'x' * 100
+BASE_PORT = 19500
+
+def client_main(port, conn_num, seconds, result_que):
+    selector = selectors.DefaultSelector()
+    recv_dict = {}
+    for i in range(conn_num):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        recv_dict[sock] = 0
+    time.sleep(0.5)                     # 等逻辑侧收到所有连接
+    for sock in recv_dict.keys():
+        sock.send(PAYLOAD)
+    count = 0
+    end_time = time.perf_counter() + seconds
+    while time.perf_counter() < end_time:
+        for key, mask in selector.select(0.1):
+            sock = key.fileobj
+            recv_dict[sock] += len(sock.recv(65536))
+            while recv_dict[sock] >= len(PAYLOAD):
+                recv_dict[sock] -= len(PAYLOAD)
+                count += 1
+                sock.send(PAYLOAD)
+    result_que.put(count)
+    for sock in recv_dict.keys():
+        sock.close()
+
+def run_bench(name, listen_cls, port, conn_num, seconds):
+    event = Event()
+    net_proc = listen_cls(name, event, 1, port)
+    net_proc.start()
+    event.wait()
+    result_que = Queue()
+    clt = Process(target=client_main, args=(port, conn_num, seconds, result_que))
+    clt.start()
+    result = None
+    while result is None:
+        wait(net_proc.out_wait_list() + [result_que._reader], 0.1)
+        for nf in net_proc.pull_msgs():
+            if nf.ope == NeTDef.RECV.value:
+                net_proc.push_msg(NetNotify(nf.sid, NeTDef.SEND.value, nf.buf))
+        net_proc.flush_msg()
+        if not result_que.empty():
+            result = result_que.get()
+    clt.join()
+    net_proc.quit()
+    net_proc.join()
+    net_proc.close_queues()
+    print('{:>16}: 每秒往返 {:.0f}'.format(name, result / seconds))
+
+def main():
+    conn_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    LogInit('net_backend_bench')
+    print('连接数:{}, 秒数:{}, 包长:{}, uvloop:{}'.format(conn_num, seconds, len(PAYLOAD), aio_net_process.uvloop is not None))
+    run_bench('ServerListen', ServerListen, BASE_PORT, conn_num, seconds)
+    run_bench('AioServerListen', AioServerListen, BASE_PORT + 1, conn_num, seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+
+'''
+PacketSplit粘包处理性能测试,对比原来逐字节拷贝的实现和现在的切片实现
+运行: python packet_split_bench.py [包数量]
+'''
+
+import random
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_packet import BasePacket, PacketSplit, PacketDef
+
+
+class LegacyPacketSplit:
+    '''原来逐字节拷贝的实现,只用于对比.
+    修正了不同边判断时误用MAX_PACKET_LEN的问题,否则数据绕回缓冲区头部后会卡住'''
+    def __init__(self):
+        self._byte_arr = bytearray(PacketDef.PACKET_SPLIT_BUFFER_SIZE.value)
+        self._copy_pos = 0
+        self._split_pos = 0
+        self._data_len = 0
+
+    def push_data(self, dt_bys):
+        dt_len = len(dt_bys)
+        for i in range(0, dt_len):
+            if self._copy_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
+                self._copy_pos = 0
+            self._byte_arr[self._copy_pos] = dt_bys[i]
+            self._copy_pos += 1
+        self._data_len += dt_len
+        return True
+
+    def split(self):
+        len_arr = bytearray(2)
+        pack_list = []
+        while self._data_len > 0:
+            if self._split_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
+                self._split_pos = 0
+            len_pos1 = self._split_pos
+            len_pos2 = self._split_pos + 1
+            if len_pos2 >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
+                len_pos2 = 0
+            len_arr[0] = self._byte_arr[len_pos1]
+            len_arr[1] = self._byte_arr[len_pos2]
+            content_len = int.from_bytes(len_arr, 'little')
+            pack_len = content_len + 2
+            if pack_len > self._data_len:
+                break
+            data_arr = bytearray(pack_len)
+            pack_pos = len_pos1
+            for i in range(0, pack_len):
+                if pack_pos >= PacketDef.PACKET_SPLIT_BUFFER_SIZE.value:
+                    pack_pos = 0
+                data_arr[i] = self._byte_arr[pack_pos]
+                self._byte_arr[pack_pos] = 0
+                pack_pos += 1
+            packet = BasePacket()
+            packet.unpack(bytes(data_arr))
+            pack_list.append(packet)
+            self._split_pos = pack_pos
+            self._data_len -= pack_len
+        return pack_list
+
+
+def make_stream(pack_num):
+    '''生成pack_num个包,按随机长度切成网络读取时的数据块'''
+    buf_list = []
+    for i in range(pack_num):
+        pack = BasePacket()
+        pack.set_id(1001, i % 100)
+        pack['clt'] = 'x' * random.randint(10, 300)
+        buf_list.append(pack.pack())
+    stream = b''.join(buf_list)
+    chunk_list = []
+    pos = 0
+    while pos < len(stream):
+        size = random.randint(1, PacketDef.PER_RECV_SIZE.value)
+        chunk_list.append(stream[pos:pos + size])
+        pos += size
+    return chunk_list
+
+def run_split(split, chunk_list):
+    count = 0
+    begin = time.perf_counter()
+    for chunk in chunk_list:
+        split.push_data(chunk)
+        count += len(split.split())
+    cost = time.perf_counter() - begin
+    return count, cost
+
+def main():
+    LogInit('packet_split_bench')
+    pack_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(1)
+    chunk_list = make_stream(pack_num)
+    print('包数量:{}, 数据块数量:{}'.format(pack_num, len(chunk_list)))
+    for name, split in (('legacy', LegacyPacketSplit()), ('slice', PacketSplit())):
+        count, cost = run_split(split, chunk_list)
+        print('{:>8}: 包数:{} 耗时:{:.3f}秒 {:.0f}包/秒'.format(name, count, cost, count / cost))
+
+if __name__ == '__main__':
+    main()
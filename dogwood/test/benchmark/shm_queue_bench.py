@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+
+'''
+multiprocessing.Queue和共享内存队列ShmQueue的对比测试
+吞吐: 父进程按批(MsgBatch)发送bytes消息,子进程收完后回一个确认
+延迟: 父进程发一条消息,子进程原样返回,统计往返时间
+运行: python shm_queue_bench.py [消息数量]
+'''
+
+from multiprocessing import Process, Queue
+import os
+import queue
+import sys
+import time
+
+from dogwood.core.base_process import MsgBatch
+from dogwood.core.shm_queue import ShmQueue
+
+BATCH_SIZE = 64
+PAYLOAD = b'x' * 200
+BATCH_LIST = [[bytes([i % 256]) + PAYLOAD[1:] for i in range(BATCH_SIZE)] for j in range(16)]    # 内容不同的消息,避免pickle的memo优化
+PING_NUM = 5000
+
+def pull_one(que):
+    while True:
+        try:
+            return que.get_nowait()
+        except queue.Empty:
+            os.sched_yield()            # 单核机器上让出CPU给对方进程
+
+def echo_main(in_que, out_que, msg_num):
+    count = 0
+    while count < msg_num:
+        msg = pull_one(in_que)
+        count += len(msg.msgs)
+    out_que.put(b'done')
+    for i in range(PING_NUM):
+        out_que.put(pull_one(in_que))
+
+def run_bench(name, in_que, out_que, msg_num):
+    proc = Process(target=echo_main, args=(in_que, out_que, msg_num))
+    proc.start()
+    begin = time.perf_counter()
+    for i in range(msg_num // BATCH_SIZE):
+        in_que.put(MsgBatch(list(BATCH_LIST[i % 16])))
+    pull_one(out_que)
+    cost = time.perf_counter() - begin
+    rtt_sum = 0
+    for i in range(PING_NUM):
+        begin = time.perf_counter()
+        in_que.put(PAYLOAD)
+        pull_one(out_que)
+        rtt_sum += time.perf_counter() - begin
+    proc.join()
+    print('{:>6}: 吞吐 {:.0f}消息/秒, 平均往返 {:.1f}微秒'.format(name, msg_num / cost, rtt_sum / PING_NUM * 1000000))
+
+def main():
+    msg_num = int(sys.argv[1]) if len(sys.argv) > 1 else 640000
+    msg_num -= msg_num % BATCH_SIZE
+    print('消息数量:{}, 每批:{}, 消息长度:{}'.format(msg_num, BATCH_SIZE, len(PAYLOAD)))
+    run_bench('Queue', Queue(), Queue(), msg_num)
+    in_que = ShmQueue(4 * 1024 * 1024, MsgBatch)
+    out_que = ShmQueue(4 * 1024 * 1024, MsgBatch)
+    run_bench('Shm', in_que, out_que, msg_num)
+    in_que.close()
+    out_que.close()
+
+if __name__ == '__main__':
+    main()
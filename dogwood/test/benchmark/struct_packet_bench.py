@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+
+'''
+StructPacket二进制格式和BasePacket json格式的对比测试,比较编码,解码(经过PacketSplit)的耗时和包长.
+MoveSync是tools/xml_2_python.py对下面的xml生成的类:
+    <nid cname="move_sync" value="1" dmemo="移动同步">
+        <field name="uid" type="uint32"/> <field name="x" type="float"/> <field name="y" type="float"/>
+        <field name="dir" type="int16"/> <field name="speed" type="uint16"/> <field name="stamp" type="int64"/>
+    </nid>
+ChatMsg带变长字段
+运行: python struct_packet_bench.py [包数量]
+'''
+
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_packet import BasePacket, PacketSplit, StructPacket
+
+MID = 3
+
+class MoveSync(StructPacket):
+    '''移动同步'''
+    __slots__ = ('uid', 'x', 'y', 'dir', 'speed', 'stamp', )
+    MID = 3
+    NID = 1
+    FIELDS = (('uid', 'uint32'), ('x', 'float'), ('y', 'float'), ('dir', 'int16'), ('speed', 'uint16'), ('stamp', 'int64'), )
+    def __init__(self, uid=0, x=0.0, y=0.0, dir=0, speed=0, stamp=0):
+        self.uid = uid
+        self.x = x
+        self.y = y
+        self.dir = dir
+        self.speed = speed
+        self.stamp = stamp
+
+class ChatMsg(StructPacket):
+    '''聊天'''
+    __slots__ = ('uid', 'channel', 'text', )
+    MID = 3
+    NID = 2
+    FIELDS = (('uid', 'uint32'), ('channel', 'uint8'), ('text', 'string'), )
+    def __init__(self, uid=0, channel=0, text=''):
+        self.uid = uid
+        self.channel = channel
+        self.text = text
+
+def json_move(i):
+    pack = BasePacket()
+    pack.set_id(MID, 1)
+    pack['uid'] = 100000 + i
+    pack['x'] = 1024.5
+    pack['y'] = 768.25
+    pack['dir'] = i % 360
+    pack['speed'] = 300
+    pack['stamp'] = 1700000000000 + i
+    return pack
+
+def json_chat(i):
+    pack = BasePacket()
+    pack.set_id(MID, 2)
+    pack['uid'] = 100000 + i
+    pack['channel'] = 1
+    pack['text'] = '大家好,今天一起打副本吗? {}'.format(i)
+    return pack
+
+def struct_move(i):
+    return MoveSync(100000 + i, 1024.5, 768.25, i % 360, 300, 1700000000000 + i)
+
+def struct_chat(i):
+    return ChatMsg(100000 + i, 1, '大家好,今天一起打副本吗? {}'.format(i))
+
+def run(name, make_func, pack_num):
+    msg_list = [make_func(i) for i in range(pack_num)]
+    begin = time.perf_counter()
+    buf_list = [msg.pack() for msg in msg_list]
+    pack_cost = time.perf_counter() - begin
+    stream = b''.join(buf_list)
+    split = PacketSplit()
+    count = 0
+    begin = time.perf_counter()
+    for pos in range(0, len(stream), 4096):
+        split.push_data(stream[pos:pos + 4096])
+        count += len(split.split())
+    unpack_cost = time.perf_counter() - begin
+    print('{:>12}: 包长:{:>3} 编码:{:.2f}us/包 解码:{:.2f}us/包 包数:{}'.format(
+        name, len(buf_list[0]), pack_cost * 1000000 / pack_num, unpack_cost * 1000000 / pack_num, count))
+
+def main():
+    LogInit('struct_packet_bench')
+    pack_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('包数量:{}'.format(pack_num))
+    run('json move', json_move, pack_num)
+    run('struct move', struct_move, pack_num)
+    run('json chat', json_chat, pack_num)
+    run('struct chat', struct_chat, pack_num)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+
+'''
+其它线程向逻辑线程投递执行的对比测试: TimerGroupS.add_timer_event(两把锁)和BaseThread.call_soon_threadsafe(deque).
+producer_num个线程各投递call_num次,逻辑线程不停地执行,比较投递的耗时和全部执行完的耗时
+运行: python threadsafe_call_bench.py [投递线程数] [每个线程投递次数]
+'''
+
+import sys
+import threading
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.base_thread import BaseThread
+from dogwood.core.helper import Helper
+from dogwood.core.timer_group import TimerGroupS
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def inc(self):
+        self.count += 1             # 只在逻辑线程里执行,不用加锁
+
+class LogicThread(BaseThread):
+    pass
+
+def run_producers(producer_num, submit_func):
+    '''返回所有投递线程完成的耗时'''
+    thread_list = [threading.Thread(target=submit_func, args=(i,)) for i in range(producer_num)]
+    begin = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    return time.perf_counter() - begin
+
+def wait_count(counter, total, begin):
+    while counter.count < total:
+        time.sleep(0.0005)
+    return time.perf_counter() - begin
+
+def bench_timer_group_s(producer_num, call_num):
+    group = TimerGroupS()
+    counter = Counter()
+    running = [True]
+    def consume():
+        while running[0]:
+            group.run_timer(Helper.get_program_milli_second())
+            time.sleep(0.001)
+    def submit(index):
+        for i in range(call_num):
+            group.add_timer_event((index, i), 0, counter.inc, 1)
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    begin = time.perf_counter()
+    submit_cost = run_producers(producer_num, submit)
+    total_cost = wait_count(counter, producer_num * call_num, begin)
+    running[0] = False
+    consumer.join()
+    return submit_cost, total_cost
+
+def bench_threadsafe(producer_num, call_num):
+    event = threading.Event()
+    logic = LogicThread(event)
+    logic.start()
+    event.wait()
+    counter = Counter()
+    def submit(index):
+        for i in range(call_num):
+            logic.call_soon_threadsafe(counter.inc)
+    begin = time.perf_counter()
+    submit_cost = run_producers(producer_num, submit)
+    total_cost = wait_count(counter, producer_num * call_num, begin)
+    logic.quit()
+    logic.join()
+    return submit_cost, total_cost
+
+def show(name, call_total, cost):
+    submit_cost, total_cost = cost
+    print('{:>12}: 投递:{:.2f}us/次 全部执行完:{:.1f}ms'.format(name, submit_cost * 1000000 / call_total, total_cost * 1000))
+
+def main():
+    LogInit('threadsafe_call_bench')
+    producer_num = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    call_num = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    call_total = producer_num * call_num
+    print('投递线程:{} 每个线程投递:{}'.format(producer_num, call_num))
+    show('TimerGroupS', call_total, bench_timer_group_s(producer_num, call_num))
+    show('threadsafe', call_total, bench_threadsafe(producer_num, call_num))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+
+'''
+时间轮(TimerWheel)和原来逐个扫描TimerEvent的对比测试.
+模拟timer_num个客户端各有一个间隔10秒的timer,比较增加,每帧run_timer(16毫秒一帧)和取消的耗时
+运行: python timer_bench.py [timer数量]
+'''
+
+import sys
+import time
+
+from dogwood.core.logger import LogInit
+from dogwood.core.timer_group import TimerEvent
+from dogwood.core.timer_wheel import TimerWheel
+
+FRAME_MILLI = 16
+TICKER = 10000
+
+class ScanGroup:
+    '''原来TimerGroup的做法: 每帧检查所有TimerEvent'''
+    def __init__(self):
+        self.run_dict = {}
+
+    def add(self, name, now_milli):
+        event = TimerEvent(name, TICKER, self.on_timer, 0)
+        event.last_trigger_time = now_milli
+        self.run_dict[name] = event
+
+    def remove(self, name):
+        del self.run_dict[name]
+
+    def run_timer(self, now_milli):
+        run_arr = list(self.run_dict.values())
+        for it in run_arr:
+            it.run_timer(now_milli)
+
+    @staticmethod
+    def on_timer():
+        pass
+
+def on_timer():
+    pass
+
+def bench_scan(timer_num, frame_num):
+    group = ScanGroup()
+    begin = time.perf_counter()
+    for i in range(timer_num):
+        group.add(i, i % TICKER)                    # 到期时间分散开
+    add_cost = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for frame in range(frame_num):
+        group.run_timer(frame * FRAME_MILLI)
+    run_cost = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for i in range(timer_num):
+        group.remove(i)
+    cancel_cost = time.perf_counter() - begin
+    return add_cost, run_cost, cancel_cost
+
+def bench_wheel(timer_num, frame_num):
+    wheel = TimerWheel(0)
+    begin = time.perf_counter()
+    handle_list = [wheel.add_timer(TICKER, on_timer, 0, (), i % TICKER) for i in range(timer_num)]
+    add_cost = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for frame in range(frame_num):
+        wheel.run_timer(frame * FRAME_MILLI)
+    run_cost = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for handle in handle_list:
+        handle.cancel()
+    cancel_cost = time.perf_counter() - begin
+    return add_cost, run_cost, cancel_cost
+
+def show(name, timer_num, frame_num, cost):
+    add_cost, run_cost, cancel_cost = cost
+    print('{:>6}: 增加:{:.2f}us/个 每帧:{:.3f}ms 取消:{:.2f}us/个'.format(
+        name, add_cost * 1000000 / timer_num, run_cost * 1000 / frame_num, cancel_cost * 1000000 / timer_num))
+
+def main():
+    LogInit('timer_bench')
+    timer_num = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    frame_num = 2 * TICKER // FRAME_MILLI          # 20秒,每个timer触发约2次
+    print('timer数量:{} 帧数:{} 每帧平均到期:{:.1f}个'.format(timer_num, frame_num, timer_num * FRAME_MILLI / TICKER))
+    show('scan', timer_num, frame_num, bench_scan(timer_num, frame_num))
+    show('wheel', timer_num, frame_num, bench_wheel(timer_num, frame_num))
+
+if __name__ == '__main__':
+    main()
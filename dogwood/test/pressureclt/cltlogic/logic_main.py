@@ -3,7 +3,7 @@
 from dogwood.core.gameframe.base_game_main import BaseGameMain
 from dogwood.core.network.net_def import NeTDef
 from dogwood.core.network.net_notify import NetNotify
-from dogwood.core.network.sock_id import SockId
+from dogwood.core.network.sock_id import net_sock_id
 
 from cltlogic.terminate.terminate import Terminate
 from cltlogic.game_define import GameDefine
@@ -24,7 +24,7 @@ class LogicMain(BaseGameMain):
         if self._client_mgr.sid_num() >= self.max_clt:     # 已经达到最大连接数
             return 
         
-        nf = NetNotify(SockId(GameDefine.NET_ID.value), NeTDef.CLIENT_CREATE.value)
+        nf = NetNotify(net_sock_id(GameDefine.NET_ID.value), NeTDef.CLIENT_CREATE.value)
         self._net_dict[GameDefine.NET_ID.value].push_msg(nf)
         
     
\ No newline at end of file
@@ -2,7 +2,6 @@
 
 from dogwood.core.helper import Helper
 from dogwood.core.gameframe.base_client import BaseClient
-from dogwood.core.timer_group import TimerGroup
 from dogwood.core.global_var import GlobalVar
 
 from dogwood.core.base_packet import BasePacket
@@ -11,13 +10,19 @@ from cltlogic.game_define import GameDefine
 
 class TerminateUserId:
     g_user_id = 1
+    
+class TerminateRtt:
+    '''统计请求到收到服务端回包的往返时间,每收到STAT_NUM个回包打印一次'''
+    STAT_NUM = 100
+    g_count = 0
+    g_total = 0
+    g_max = 0
 
 class Terminate(BaseClient):
-    __slots__ = ('__time_group')
+    __slots__ = ()
     def __init__(self, mgr, sock_id):
         super().__init__(mgr, sock_id)
-        self.__time_group = TimerGroup()
-        self.__time_group.add_timer_event('send_msg', 10000, self.send_msg)
+        self.add_timer_event('send_msg', 10000, self.send_msg)
         self.set_user_id(TerminateUserId.g_user_id)
         TerminateUserId.g_user_id += 1
         print('net client.sid:{},uid:{}'.format(self._sock_id, self._user_id))
@@ -29,10 +34,19 @@ class Terminate(BaseClient):
         clt = msg.data['clt']
         svr = msg.data['svr']
         print('mid:{},nid:{},clt:{},svr:{}'.format(mid, nid, clt, svr))
+        self.stat_rtt(clt)
         
-    def run_timer(self, now_milli):      # 重载
-        super().run_timer(now_milli)
-        self.__time_group.run_timer(now_milli)
+    def stat_rtt(self, clt):
+        rtt = Helper.get_time_stamp_milli_second() - int(clt.split(':')[1])
+        TerminateRtt.g_count += 1
+        TerminateRtt.g_total += rtt
+        if rtt > TerminateRtt.g_max:
+            TerminateRtt.g_max = rtt
+        if TerminateRtt.g_count >= TerminateRtt.STAT_NUM:
+            print('rtt.count:{},avg:{:.1f}ms,max:{}ms'.format(TerminateRtt.g_count, TerminateRtt.g_total / TerminateRtt.g_count, TerminateRtt.g_max))
+            TerminateRtt.g_count = 0
+            TerminateRtt.g_total = 0
+            TerminateRtt.g_max = 0
         
     def send_msg(self):
         pack = BasePacket()
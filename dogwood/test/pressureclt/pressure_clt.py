@@ -31,11 +31,12 @@ def main():
     while True:
         cmd_line = input('输入命令:\n')
         if cmd_line.lower() == 'quit':
+            game_main.quit()                # 逻辑线程还在用net_clt的队列,先停逻辑线程再关网络进程的队列
+            game_main.join()
+            
             net_clt.quit()
             net_clt.join()
-            
-            game_main.quit()
-            game_main.join()
+            net_clt.close_queues()
             
             break
 
@@ -29,6 +29,6 @@ class PreClient(BaseClient):
         pack['clt'] = clt_msg
         pack['svr'] = 'hello,pressure.{}'.format(random.randint(0, 10000))
         svr_main = GlobalVar.get_value('svr_main')
-        svr_main.send_socket_msg(self._sock_id, pack.pack())
+        svr_main.send_socket_msg(self._sock_id, pack.pack(self.codec))
     
     
\ No newline at end of file
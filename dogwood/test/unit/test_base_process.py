@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+
+'''
+BaseProcess的退出信号要排在quit之前flush_msg的消息后面,不能抢先(MySqlMonitor.close_all就是flush,quit,join)
+ShmQueue两个方向都满时不能互相等待,一帧的消息超过队列容量时拆开发送
+'''
+
+import time
+import unittest
+from multiprocessing import Event as PeEvent
+
+from dogwood.core.base_process import BaseProcess
+from dogwood.core.helper import Helper
+from dogwood.core.logger import LogInit
+
+MSG_NUM = 2000
+PAYLOAD = b'x' * 1024         # 一批约2MB,multiprocessing.Queue的后台线程要写一段时间
+
+class CountProcess(BaseProcess):
+    '''统计收到的消息数,退出时回给调用者进程'''
+    __slots__ = ('count', )
+    def process_init(self):
+        self.count = 0
+
+    def run_frame(self, now_milli):
+        for msg in self._pull_in_msgs():
+            if type(msg) is str and msg == Helper.quit_signal():
+                self._post_msg(self.count)
+                self._run_flag = False
+                continue
+            self.count += 1
+
+
+class EchoProcess(BaseProcess):
+    '''收到的消息原样发回'''
+    __slots__ = ()
+    def run_frame(self, now_milli):
+        for msg in self._pull_in_msgs():
+            if type(msg) is str and msg == Helper.quit_signal():
+                self._run_flag = False
+                continue
+            self._post_msg(msg)
+
+
+class TestQuitOrder(unittest.TestCase):
+    def run_proc(self, shm_size):
+        event = PeEvent()
+        proc = CountProcess('test_base_process', event, shm_size)
+        proc.start()
+        event.wait()                    # 子进程已经在等待入队列,quit的唤醒会让它立即去取消息
+        for i in range(MSG_NUM):
+            proc.push_msg(PAYLOAD)
+        proc.flush_msg()
+        proc.quit()
+        proc.join(10)
+        self.assertFalse(proc.is_alive())
+        result = []
+        deadline = time.time() + 5
+        while len(result) == 0 and time.time() < deadline:
+            result = proc.pull_msgs()
+        proc.close_queues()
+        return result
+
+    def test_queue(self):
+        for i in range(10):
+            self.assertEqual(self.run_proc(0), [MSG_NUM])
+
+    def test_shm(self):
+        for i in range(10):
+            self.assertEqual(self.run_proc(1024 * 1024), [MSG_NUM])
+
+
+class TestShmFull(unittest.TestCase):
+    SHM_SIZE = 8192
+
+    @classmethod
+    def setUpClass(cls):
+        LogInit('test_base_process')    # 丢弃放不进队列的消息时打印错误
+
+    def start_proc(self):
+        event = PeEvent()
+        proc = EchoProcess('test_base_process', event, self.SHM_SIZE)
+        proc.start()
+        event.wait()
+        return proc
+
+    def pull_until(self, proc, num):
+        result = []
+        deadline = time.time() + 10
+        while len(result) < num and time.time() < deadline:
+            result.extend(proc.pull_msgs())
+            time.sleep(0.001)
+        return result
+
+    def stop_proc(self, proc):
+        proc.quit()
+        proc.join(10)
+        self.assertFalse(proc.is_alive())
+        proc.close_queues()
+
+    def test_both_full(self):
+        '''每帧发1.5K,先不取回复,两个方向的队列都会满'''
+        proc = self.start_proc()
+        sent = [bytes([i % 256]) * 1500 for i in range(100)]
+        for msg in sent:
+            proc.push_msg(msg)
+            proc.flush_msg()
+        self.assertEqual(self.pull_until(proc, len(sent)), sent)
+        self.stop_proc(proc)
+
+    def test_batch_too_large(self):
+        '''一帧12K,超过队列容量,中间一条10K的单条消息放不进去,丢弃'''
+        proc = self.start_proc()
+        sent = [bytes([i]) * 1500 for i in range(8)]
+        for msg in sent[:4]:
+            proc.push_msg(msg)
+        proc.push_msg(b'z' * 10240)
+        for msg in sent[4:]:
+            proc.push_msg(msg)
+        proc.flush_msg()
+        self.assertEqual(self.pull_until(proc, len(sent)), sent)
+        self.stop_proc(proc)
+
+if __name__ == '__main__':
+    unittest.main()
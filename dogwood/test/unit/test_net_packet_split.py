@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+
+'''
+split_in_net为False时,网络进程一次RECV可能合并了超过粘包缓冲区(64K)的数据,NetPacketSplit要分段处理,不能丢弃
+'''
+
+import unittest
+
+from dogwood.core.base_packet import BasePacket, PacketDef
+from dogwood.core.gameframe.net_packet_split import NetPacketSplit
+
+def make_packet(index):
+    pack = BasePacket()
+    pack.set_id(1, 2)
+    pack['i'] = index
+    pack['s'] = 'a' * 1000
+    return pack.pack()
+
+class TestNetPacketSplit(unittest.TestCase):
+    def test_larger_than_buffer(self):
+        bys = b''.join(make_packet(i) for i in range(200))
+        self.assertGreater(len(bys), PacketDef.PACKET_SPLIT_BUFFER_SIZE.value)
+        split = NetPacketSplit(1)
+        pack_list = split.deal_with_bytes(bys)
+        self.assertEqual([pack.get('i', None) for pack in pack_list], list(range(200)))
+
+    def test_half_packet_across_calls(self):
+        bys = b''.join(make_packet(i) for i in range(100))
+        cut = len(bys) - 500                # 最后一个包分两次收到
+        split = NetPacketSplit(1)
+        pack_list = split.deal_with_bytes(bys[:cut])
+        self.assertEqual(len(pack_list), 99)
+        pack_list = split.deal_with_bytes(bys[cut:])
+        self.assertEqual([pack.get('i', None) for pack in pack_list], [99])
+
+    def test_chunked_message(self):
+        pack = BasePacket()
+        pack.set_id(1, 2)
+        pack['s'] = 'b' * 100000            # 超过MAX_PACKET_LEN,分片发送
+        split = NetPacketSplit(1)
+        pack_list = split.deal_with_bytes(pack.pack())
+        self.assertEqual(len(pack_list), 1)
+        self.assertEqual(pack_list[0].get('s', None), 'b' * 100000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: UTF-8 -*-
+
+'''
+TimerWheel里同一毫秒到期的timer,前面的timer函数取消后面的,被取消的不执行,计数不出错,其它timer照常执行
+'''
+
+import unittest
+
+from dogwood.core.timer_wheel import TimerWheel
+
+class TestTimerWheel(unittest.TestCase):
+    def test_cancel_in_same_slot(self):
+        wheel = TimerWheel(0)
+        fired = []
+        h2 = None
+        def on_h1():
+            fired.append(1)
+            h2.cancel()
+        h1 = wheel.add_timer(10, on_h1, 1, now_milli=0)
+        h2 = wheel.add_timer(10, fired.append, 1, (2, ), now_milli=0)
+        h3 = wheel.add_timer(10, fired.append, 1, (3, ), now_milli=0)
+        wheel.run_timer(10)
+        self.assertEqual(fired, [1, 3])
+        self.assertFalse(h1.active or h2.active or h3.active)
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.next_wait(10))
+
+    def test_cancel_repeat_in_same_slot(self):
+        wheel = TimerWheel(0)
+        fired = []
+        h2 = None
+        def on_h1():
+            fired.append(1)
+            h2.cancel()
+        h1 = wheel.add_timer(10, on_h1, 0, now_milli=0)
+        h2 = wheel.add_timer(10, fired.append, 0, (2, ), now_milli=0)
+        h3 = wheel.add_timer(10, fired.append, 0, (3, ), now_milli=0)
+        wheel.run_timer(10)
+        self.assertEqual(len(wheel), 2)
+        wheel.run_timer(20)
+        self.assertEqual(fired, [1, 3, 1, 3])
+        h1.cancel()
+        h3.cancel()
+        self.assertEqual(len(wheel), 0)
+        wheel.add_timer(5, fired.append, 1, (4, ), now_milli=20)
+        wheel.run_timer(25)
+        self.assertEqual(fired[-1], 4)
+
+if __name__ == '__main__':
+    unittest.main()
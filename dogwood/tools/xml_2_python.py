@@ -1,5 +1,18 @@
 # -*- coding: UTF-8 -*-
 
+'''
+协议xml转python: 每个xml生成一个Enum类,包括mid和nid.
+nid下有field时还生成一个StructPacket子类,这个消息就可以用二进制格式收发,不经过json:
+    <mid dname="fight" value="2" memo="战斗">
+        <nid cname="move" value="1" dmemo="移动" struct="MoveReq">
+            <field name="x" type="int32" memo="x坐标"/>
+            <field name="name" type="string"/>
+        </nid>
+    </mid>
+struct为类名,不写时由cname生成(move->Move). 没有字段的消息写了struct也生成.
+type: int8,uint8,int16,uint16,int32,uint32,int64,uint64,float,double,bool,string,bytes
+'''
+
 import sys
 import os
 import xml.dom.minidom
@@ -19,15 +32,22 @@ def list_dir():
             if os.path.isfile(in_fl):
                 trans_files_dict[in_fl] = out_fl
                 
+g_field_default_dict = {'int8': '0', 'uint8': '0', 'int16': '0', 'uint16': '0', 'int32': '0', 'uint32': '0',
+                        'int64': '0', 'uint64': '0', 'float': '0.0', 'double': '0.0', 'bool': 'False',
+                        'string': "''", 'bytes': "b''"}       # key 字段类型, value __init__里的默认值
+                
 def trans_xml_to_py(src_fl, dst_fl):
     str_content = parse_xml_content(src_fl)
-    create_py_file(dst_fl, str_content)
+    str_struct = parse_xml_struct(src_fl)
+    create_py_file(dst_fl, str_content + str_struct, str_struct != '')
 
-def create_py_file(out_file_name, str_content):
+def create_py_file(out_file_name, str_content, has_struct=False):
     encode_str = '# -*- coding: UTF-8 -*-'
     pre_fix = '#以下是自动生成部分不要手动修改'
     suf_fix = '#以上是自动生成部分不要手动修改'
     ipt_str = 'from enum import Enum'
+    if has_struct:
+        ipt_str += '\n\nfrom dogwood.core.base_packet import StructPacket'
     
     all_input = encode_str + '\n\n' + pre_fix + '\n\n' + ipt_str + '\n\n' + str_content + '\n' + suf_fix
     f = open(out_file_name, mode="w", encoding ='UTF-8')
@@ -62,6 +82,43 @@ def parse_xml_content(xml_fl_name):
     ret_content += '\n'
     
     return ret_content
+
+def struct_class_name(nid):
+    class_name = nid.getAttribute('struct')
+    if class_name == '':
+        class_name = ''.join([word.capitalize() for word in nid.getAttribute('cname').split('_')])
+    return class_name
+    
+def parse_xml_struct(xml_fl_name):
+    '''有field或struct属性的nid生成StructPacket子类'''
+    ret_content = ''
+    xml_dom = xml.dom.minidom.parse(xml_fl_name)
+    for mid in xml_dom.getElementsByTagName('mid'):
+        for nid in mid.getElementsByTagName('nid'):
+            fields = nid.getElementsByTagName('field')
+            if len(fields) == 0 and nid.getAttribute('struct') == '':
+                continue
+            field_list = []
+            for field in fields:
+                name = field.getAttribute('name')
+                field_type = field.getAttribute('type')
+                if not field_type in g_field_default_dict.keys():
+                    print('field type error', xml_fl_name, nid.getAttribute('cname'), name, field_type)
+                    os._exit(-1)
+                field_list.append((name, field_type, field.getAttribute('memo')))
+            ret_content += 'class ' + struct_class_name(nid) + '(StructPacket):\n'
+            ret_content += "    '''" + nid.getAttribute('dmemo') + "'''\n"
+            ret_content += '    __slots__ = (' + ''.join(["'" + f[0] + "', " for f in field_list]) + ')\n'
+            ret_content += '    MID = ' + mid.getAttribute('value') + '\n'
+            ret_content += '    NID = ' + nid.getAttribute('value') + '\n'
+            ret_content += '    FIELDS = (' + ''.join(["('" + f[0] + "', '" + f[1] + "'), " for f in field_list]) + ')\n'
+            ret_content += '    def __init__(self' + ''.join([', ' + f[0] + '=' + g_field_default_dict[f[1]] for f in field_list]) + '):\n'
+            if len(field_list) == 0:
+                ret_content += '        pass\n'
+            for f in field_list:
+                ret_content += '        self.' + f[0] + ' = ' + f[0] + ('  # ' + f[2] if f[2] != '' else '') + '\n'
+            ret_content += '\n'
+    return ret_content
     
 def main():
     if not os.path.exists(g_xml_path):